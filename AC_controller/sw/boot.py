@@ -6,17 +6,25 @@ from constants import UART_TYPES
 
 
 
+def init_executor(loop):
+    from helpers.executor import get_command_executor
+    loop.create_task(get_command_executor().run())
+
+
 def init_UART(loop):
     from uart.uart_bus import get_UART_bus
+    from commands import get_update_coalescer
     uart = get_UART_bus()
-    Pin(settings.PINS.UART_RX_PIN).irq(trigger=Pin.IRQ_FALLING, handler=uart.handle_uart_cmd)
+    uart.add_loop_tasks(loop)
+    loop.create_task(get_update_coalescer().run())
 
 
 def init_CAN(loop):
-    from can.can_bus import get_CAN_bus
+    from can.can_bus import get_CAN_bus, get_P_CAN_bus
     can = get_CAN_bus()
     can.add_loop_tasks(loop)
-    # Pin(settings.PINS.CAN_INTERRUPT_PIN).irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=can.handle_can_cmd)
+    if settings.P_CAN.ENABLED:
+        get_P_CAN_bus().add_loop_tasks(loop)
 
 
 def init_devices():
@@ -96,6 +104,7 @@ def sendParkingOn(uart, status):
 
 try:
     loop = uasyncio.get_event_loop()
+    init_executor(loop)
     init_CAN(loop)
     init_UART(loop)
     init_devices()
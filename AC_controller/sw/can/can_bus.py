@@ -2,61 +2,137 @@ import uasyncio
 
 from libs.MCP2515 import MCP2515
 from libs.canio import Message, Match
-from settings import CAN, PINS, DUBUG_MODE
+from settings import CAN, P_CAN, PINS, DUBUG_MODE
 
 from helpers.observer import Observer
-from commands import CANCmdHandlers
+from commands import CANCmdHandlers, CANPBusCmdHandlers
+from constants import CAN_COMMANDS_NAMES
+from can.can_filters import FilterPlanner, FILTERS_COUNT
+from can.can_tx import CanTxScheduler
+from can.can_supervisor import CanBusSupervisor
 
 from controllers.climate_controller import get_climate_controller
 
 
 class CanBus(Observer):
     LISTEN_TIMEOUT = 0.5
+    TOPICS = ()  # subscribed for the controller state, not its updates
 
-    def __init__(self):
-        self._can = MCP2515(CAN.ID, CAN.SPI_BAUDRATE,
+    def __init__(self, bus_settings=CAN, cs_pin=PINS.CAN_SPI_CS_PIN, interrupt_pin=PINS.CAN_INTERRUPT_PIN,
+                 handlers=CANCmdHandlers, known_ids=CAN_COMMANDS_NAMES.keys(), spi=None, name='CANBus'):
+        """
+        :param bus_settings: settings class of the bus (`settings.CAN`, `settings.P_CAN`)
+        :param handlers: CAN ID -> command handler
+        :param known_ids: IDs known to be on the bus, used to plan the hardware filters
+        :param spi: `SharedSPI` of another bus, for a second MCP2515 on the same SPI (own CS/INT pins)
+        """
+        self._settings = bus_settings
+        self._handlers = handlers
+        self._known_ids = known_ids
+        self._name = name
+        self._can = MCP2515(bus_settings.ID, bus_settings.SPI_BAUDRATE,
                             PINS.CAN_SPI_SCK_PIN, PINS.CAN_SPI_MOSI_PIN,
-                            PINS.CAN_SPI_MISO_PIN, PINS.CAN_SPI_CS_PIN,
-                            baudrate=CAN.BAUDRATE)
-        self._listener = self._can.listen(timeout=self.LISTEN_TIMEOUT, matches=[Match(x) for x in CAN.IDS_TO_FILTER])
+                            PINS.CAN_SPI_MISO_PIN, cs_pin,
+                            baudrate=bus_settings.BAUDRATE,
+                            interrupt_pin=interrupt_pin if bus_settings.USE_INTERRUPT else None,
+                            rx_ring_size=bus_settings.RX_RING_SIZE,
+                            rx_pool_size=bus_settings.RX_POOL_SIZE,
+                            filter_hits=bus_settings.FAST_DISPATCH,
+                            crystal_freq=bus_settings.CRYSTAL_FREQ,
+                            sample_point=bus_settings.SAMPLE_POINT,
+                            spi=spi)
+        self._filter_plan = None
+        # filter index -> (CAN ID, handler) for filters accepting a single ID
+        self._filter_dispatch = [None] * FILTERS_COUNT
+        if not bus_settings.IDS_TO_FILTER and bus_settings.AUTO_FILTERS:
+            self._program_filters()
+        self._listener = self._can.listen(timeout=self.LISTEN_TIMEOUT,
+                                          matches=[Match(x) for x in bus_settings.IDS_TO_FILTER])
         # subscribe to controller updates
-        self._send_message_queue = []
+        self._tx_scheduler = CanTxScheduler(self._can, bus_settings, name)
+        self._supervisor = CanBusSupervisor(self._can, self._tx_scheduler.controller_restarted, bus_settings, name)
         self.subscribe(get_climate_controller())
 
+    @property
+    def shared_spi(self):
+        return self._can.shared_spi
+
+    @property
+    def filter_plan(self):
+        return self._filter_plan
+
+    def _program_filters(self):
+        """Let the MCP2515 drop frames no command handles"""
+        self._filter_plan = FilterPlanner(self._handlers.keys(), self._known_ids).plan()
+        self._can.program_filters(self._filter_plan.masks, self._filter_plan.filters)
+        if self._settings.FAST_DISPATCH:
+            for filter_index, can_id in enumerate(self._filter_plan.exact_ids()):
+                if can_id is not None:
+                    self._filter_dispatch[filter_index] = (can_id, self._handlers.get(can_id))
+        if DUBUG_MODE:
+            print('[{}] Hardware filters: {}'.format(self._name, self._filter_plan))
+
     def add_loop_tasks(self, loop):
         loop.create_task(self.send_task())
         loop.create_task(self.receive_task())
+        loop.create_task(self._supervisor.run())
+
+    @property
+    def supervisor(self):
+        return self._supervisor
+
+    @property
+    def health(self):
+        """Bus state, error counters and restart/recovery metrics, see `CanBusSupervisor`"""
+        return self._supervisor.health
+
+    @property
+    def tx_scheduler(self):
+        return self._tx_scheduler
+
+    @property
+    def tx_stats(self):
+        """Send queue depth and sent/coalesced/dropped/expired/aborted frame counters"""
+        return self._tx_scheduler.stats
 
     def send(self, data_id, data):
         message = Message(id=data_id, data=bytearray(data))
-        self._send_message_queue.append(message)
+        self._tx_scheduler.submit(message)
 
     async def send_task(self):
         """ Send CAN command to devices """
-        while True:
-            if len(self._send_message_queue) == 0:
-                await uasyncio.sleep_ms(0)
-                continue
-            msg = self._send_message_queue.pop(0)
-            send_success = self._can.send(msg)
-            if DUBUG_MODE:
-                print('[CANBus] Message {}/{} send status: {}'.format(hex(msg.id), msg.data, send_success))
+        await self._tx_scheduler.run()
 
     async def receive_task(self):
         """ Handle CAN commands from car devices """
         while True:
+            if self._can.interrupt_mode:
+                # frames are drained from the chip by the INT pin IRQ, sleep until there are some
+                await self._can.wait_for_messages()
             message_count = self._listener.in_waiting()
             if message_count == 0:
                 await uasyncio.sleep_ms(0)
                 continue
             for i in range(message_count):
-                msg = self._listener.receive()
-                if msg:
-                    if DUBUG_MODE:
-                        print('[CANBus] Message {}/{} received'.format(msg.id, msg.data))
-                    cmd = CANCmdHandlers.get(msg.id)
-                    if cmd:
-                        cmd(msg)
+                self._dispatch()
+
+    def _dispatch(self):
+        filter_hit = self._can.next_filter_hit
+        target = self._filter_dispatch[filter_hit] if filter_hit is not None else None
+        if target is not None:
+            # the filter only accepts this ID: no need to decode it or look the handler up
+            can_id, cmd = target
+            msg = self._can.read_message(can_id)
+        else:
+            msg = self._listener.receive()
+            if not msg:
+                return
+            cmd = self._handlers.get(msg.id)
+
+        if DUBUG_MODE:
+            print('[{}] Message {}/{} received'.format(self._name, msg.id, bytes(msg.data)))
+        if cmd:
+            cmd(msg)
 
 
 CAN_bus = None
@@ -68,3 +144,17 @@ def get_CAN_bus():
         CAN_bus = CanBus()
 
     return CAN_bus
+
+
+P_CAN_bus = None
+
+
+def get_P_CAN_bus():
+    """Powertrain bus on a second MCP2515 sharing the SPI of the I-bus one"""
+    global P_CAN_bus
+    if P_CAN_bus is None:
+        P_CAN_bus = CanBus(P_CAN, PINS.P_CAN_SPI_CS_PIN, PINS.P_CAN_INTERRUPT_PIN,
+                           handlers=CANPBusCmdHandlers, known_ids=(),
+                           spi=get_CAN_bus().shared_spi, name='PCANBus')
+
+    return P_CAN_bus
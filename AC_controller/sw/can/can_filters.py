@@ -0,0 +1,167 @@
+from micropython import const
+
+STD_ID_MASK = const(0x7FF)
+STD_ID_BITS = const(11)
+
+# MCP2515 acceptance hardware: RXB0 has mask 0 and filters 0-1, RXB1 has mask 1 and filters 2-5
+BANK_FILTERS = (2, 4)
+FILTERS_COUNT = const(6)
+
+
+def _popcount(value):
+    count = 0
+    while value:
+        value &= value - 1
+        count += 1
+    return count
+
+
+class FilterPlan:
+    """Mask/filter assignment for the two MCP2515 receive buffers (standard IDs only)"""
+
+    def __init__(self, masks, filters, handled_ids, known_ids):
+        self.masks = masks  # [mask RXB0, mask RXB1]
+        self.filters = filters  # [[RXF0, RXF1], [RXF2, RXF3, RXF4, RXF5]]
+        self.handled_ids = handled_ids
+        self.known_ids = known_ids
+
+    def accepts(self, can_id):
+        for bank, mask in enumerate(self.masks):
+            for value in self.filters[bank]:
+                if (can_id ^ value) & mask == 0:
+                    return True
+        return False
+
+    @property
+    def accepted_space(self):
+        """Number of 11-bit IDs the hardware lets through (an upper bound if the banks have different
+        masks and overlap)"""
+        patterns = set()
+        for bank, mask in enumerate(self.masks):
+            for value in self.filters[bank]:
+                patterns.add((mask, value & mask))
+        return sum(1 << (STD_ID_BITS - _popcount(mask)) for mask, _ in patterns)
+
+    @property
+    def false_accept_ratio(self):
+        """Share of accepted frames nobody handles.
+
+        Measured over the IDs known to be on the bus if given, over the whole 11-bit space otherwise.
+        """
+        if self.known_ids:
+            accepted = [can_id for can_id in self.known_ids if self.accepts(can_id)]
+            if not accepted:
+                return 0
+            return sum(1 for can_id in accepted if can_id not in self.handled_ids) / len(accepted)
+        accepted = self.accepted_space
+        return max(0, accepted - len(self.handled_ids)) / accepted
+
+    def exact_ids(self):
+        """CAN ID each filter (RXF0-RXF5) accepts, None for filters that accept several IDs"""
+        ids = []
+        for bank, mask in enumerate(self.masks):
+            for value in self.filters[bank]:
+                ids.append(value & STD_ID_MASK if mask == STD_ID_MASK else None)
+        return ids
+
+    def __repr__(self):
+        return "FilterPlan(masks={}, filters={}, false_accept_ratio={:.2f})".format(
+            [hex(mask) for mask in self.masks], [[hex(value) for value in bank] for bank in self.filters],
+            self.false_accept_ratio)
+
+
+class FilterPlanner:
+    """Derives the MCP2515 acceptance masks/filters from the IDs the firmware handles.
+
+    Every handled ID is always accepted. With more handled IDs than filters, IDs are grouped so that
+    one filter covers a group: its mask only keeps the bits the group agrees on. Groups are merged
+    greedily by the number of known-but-unhandled IDs (then the ID space) the merge lets through,
+    and the groups are finally split between the two buffers so that the shared bank masks accept
+    as little as possible.
+    """
+
+    def __init__(self, handled_ids, known_ids=()):
+        self._handled_ids = sorted(set(can_id & STD_ID_MASK for can_id in handled_ids))
+        self._known_ids = sorted(set(known_ids) | set(self._handled_ids)) if known_ids else []
+
+    def plan(self):
+        if not self._handled_ids:
+            # nothing handled: keep the reset state (zero masks), everything is accepted
+            return FilterPlan([0, 0], [[0] * BANK_FILTERS[0], [0] * BANK_FILTERS[1]],
+                              self._handled_ids, self._known_ids)
+
+        groups = [[can_id] for can_id in self._handled_ids]
+        while len(groups) > FILTERS_COUNT:
+            groups = self._merge_cheapest(groups)
+
+        best = None
+        for bank0 in self._bank0_choices(len(groups)):
+            bank0_groups = [groups[idx] for idx in bank0]
+            bank1_groups = [group for idx, group in enumerate(groups) if idx not in bank0] or bank0_groups
+            plan = FilterPlan([self._bank_mask(bank0_groups), self._bank_mask(bank1_groups)],
+                              [self._bank_filters(bank0_groups, BANK_FILTERS[0]),
+                               self._bank_filters(bank1_groups, BANK_FILTERS[1])],
+                              self._handled_ids, self._known_ids)
+            cost = self._cost(plan)
+            if best is None or cost < best[0]:
+                best = (cost, plan)
+        return best[1]
+
+    @staticmethod
+    def _group_mask(group):
+        differing = 0
+        for can_id in group:
+            differing |= can_id ^ group[0]
+        return ~differing & STD_ID_MASK
+
+    def _bank_mask(self, groups):
+        mask = STD_ID_MASK
+        for group in groups:
+            mask &= self._group_mask(group)
+        return mask
+
+    @staticmethod
+    def _bank_filters(groups, size):
+        values = [group[0] for group in groups]
+        # unused filters repeat the last one so they cannot widen the acceptance
+        return values + [values[-1]] * (size - len(values))
+
+    @staticmethod
+    def _bank0_choices(groups_count):
+        if groups_count == 1:
+            return [(0,)]
+        # RXB1 takes at most 4 groups, RXB0 the rest (at least one so it does not accept everything)
+        choices = []
+        for first in range(groups_count):
+            if groups_count - 1 <= BANK_FILTERS[1]:
+                choices.append((first,))
+            for second in range(first + 1, groups_count):
+                choices.append((first, second))
+        return choices
+
+    def _cost(self, plan):
+        unhandled = 0
+        for can_id in self._known_ids:
+            if can_id not in self._handled_ids and plan.accepts(can_id):
+                unhandled += 1
+        return unhandled, plan.accepted_space
+
+    def _group_cost(self, group):
+        mask = self._group_mask(group)
+        unhandled = 0
+        for can_id in self._known_ids:
+            if (can_id ^ group[0]) & mask == 0 and can_id not in self._handled_ids:
+                unhandled += 1
+        return unhandled, 1 << (STD_ID_BITS - _popcount(mask))
+
+    def _merge_cheapest(self, groups):
+        best = None
+        for first in range(len(groups)):
+            for second in range(first + 1, len(groups)):
+                cost = self._group_cost(groups[first] + groups[second])
+                if best is None or cost < best[0]:
+                    best = (cost, first, second)
+        _, first, second = best
+        merged = [group for idx, group in enumerate(groups) if idx not in (first, second)]
+        merged.append(sorted(groups[first] + groups[second]))
+        return merged
@@ -0,0 +1,85 @@
+from time import ticks_ms, ticks_add, ticks_diff
+
+import uasyncio
+
+from libs.canio import BusState
+from settings import CAN, DUBUG_MODE
+
+BUS_STATE_NAMES = ('ERROR_ACTIVE', 'ERROR_WARNING', 'ERROR_PASSIVE', 'BUS_OFF')
+
+
+class CanBusSupervisor:
+    """Watches the MCP2515 error state and restarts the controller when it is stuck in bus-off.
+
+    TEC/REC/EFLG are sampled every `CAN.SUPERVISOR_PERIOD_MS` (reading EFLG also clears the RX
+    overflow flags). A controller that stays in bus-off for `CAN.RESTART_BACKOFF_MS` is restarted;
+    every further restart without recovery doubles the wait up to `CAN.RESTART_BACKOFF_MAX_MS`.
+    The time from detecting bus-off until the first sample in another state is kept as
+    `last_recovery_ms`.
+    """
+
+    def __init__(self, can, on_restart=None, bus_settings=CAN, name='CANBus'):
+        self._can = can
+        self._on_restart = on_restart
+        self._settings = bus_settings
+        self._name = name
+        self._backoff_ms = bus_settings.RESTART_BACKOFF_MS
+        self._restart_at = None
+        self._bus_off_since = None
+
+        self.state = BusState.ERROR_ACTIVE
+        self.tec = 0
+        self.rec = 0
+        self.restart_count = 0
+        self.bus_off_count = 0
+        self.last_recovery_ms = None
+
+    @property
+    def health(self):
+        return {'state': BUS_STATE_NAMES[self.state], 'tec': self.tec, 'rec': self.rec,
+                'rx_overflows': self._can.rx_overflow_count, 'bus_off_count': self.bus_off_count,
+                'restarts': self.restart_count, 'last_recovery_ms': self.last_recovery_ms}
+
+    async def run(self):
+        while True:
+            await uasyncio.sleep_ms(self._settings.SUPERVISOR_PERIOD_MS)
+            self.check()
+
+    def check(self):
+        """Sample the controller error state and act on it"""
+        self.tec = self._can.transmit_error_count
+        self.rec = self._can.receive_error_count
+        self.on_sample(self._can.state, ticks_ms())
+
+    def on_sample(self, state, now):
+        """Update the supervisor with a bus state sampled at `now` (ticks_ms)"""
+        if state != self.state and DUBUG_MODE:
+            print('[{}] Bus state {} -> {}, TEC: {}, REC: {}'.format(
+                self._name, BUS_STATE_NAMES[self.state], BUS_STATE_NAMES[state], self.tec, self.rec))
+        self.state = state
+
+        if state != BusState.BUS_OFF:
+            if self._bus_off_since is not None:
+                self.last_recovery_ms = ticks_diff(now, self._bus_off_since)
+                self._bus_off_since = None
+                self._restart_at = None
+                self._backoff_ms = self._settings.RESTART_BACKOFF_MS
+            return
+
+        if self._bus_off_since is None:
+            self._bus_off_since = now
+            self._restart_at = ticks_add(now, self._backoff_ms)
+            self.bus_off_count += 1
+        elif ticks_diff(now, self._restart_at) >= 0:
+            self._restart(now)
+
+    def _restart(self, now):
+        self._can.restart()
+        self.restart_count += 1
+        self._backoff_ms = min(self._backoff_ms * 2, self._settings.RESTART_BACKOFF_MAX_MS)
+        self._restart_at = ticks_add(now, self._backoff_ms)
+        if self._on_restart is not None:
+            self._on_restart()
+        if DUBUG_MODE:
+            print('[{}] Controller restarted after bus-off, next attempt in {} ms'.format(
+                self._name, self._backoff_ms))
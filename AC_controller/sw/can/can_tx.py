@@ -0,0 +1,216 @@
+from time import ticks_ms, ticks_add, ticks_diff
+
+import uasyncio
+from micropython import const
+
+from settings import CAN, DUBUG_MODE
+
+# MCP2515 TXP priorities: with several TX buffers pending the highest priority is sent first
+TX_PRIORITY_LEVELS = const(4)
+TX_BUFFERS_COUNT = const(3)
+
+
+# push() results
+TX_QUEUED = const(0)
+TX_COALESCED = const(1)  # replaced the queued frame with the same ID
+TX_DROPPED_OLDEST = const(2)  # queue was full, its oldest frame was dropped
+
+
+class TxQueue:
+    """Fixed-size FIFO of (message, deadline) entries with latest-value-wins coalescing.
+
+    A coalesced frame replaces the queued frame with the same ID in place, so an ID is queued at
+    most once and a busy bus delays it instead of piling up stale values. Ordered frames (multi-frame
+    sequences) are always appended. When the queue is full the oldest entry is dropped.
+    """
+
+    def __init__(self, size):
+        self._slots = [None] * size
+        self._head = 0
+        self._count = 0
+        self._slot_by_id = {}  # CAN ID -> slot of its queued coalescing frame
+
+    def __len__(self):
+        return self._count
+
+    def push(self, message, deadline, coalesce=True):
+        if coalesce:
+            slot = self._slot_by_id.get(message.id)
+            if slot is not None:
+                self._slots[slot] = (message, deadline)
+                return TX_COALESCED
+
+        size = len(self._slots)
+        result = TX_QUEUED
+        if self._count == size:
+            self.pop()
+            result = TX_DROPPED_OLDEST
+        slot = (self._head + self._count) % size
+        self._slots[slot] = (message, deadline)
+        self._count += 1
+        if coalesce:
+            self._slot_by_id[message.id] = slot
+        return result
+
+    def peek(self, index=0):
+        """The `index`-th entry from the oldest one"""
+        return self._slots[(self._head + index) % len(self._slots)]
+
+    def pop(self, index=0):
+        """Remove and return the `index`-th entry; the entries in front of it move up one slot"""
+        size = len(self._slots)
+        slot = (self._head + index) % size
+        entry = self._slots[slot]
+        if self._slot_by_id.get(entry[0].id) == slot:
+            del self._slot_by_id[entry[0].id]
+        for i in range(index, 0, -1):
+            src = (self._head + i - 1) % size
+            moved = self._slots[src]
+            self._slots[slot] = moved
+            if self._slot_by_id.get(moved[0].id) == src:
+                self._slot_by_id[moved[0].id] = slot
+            slot = src
+        self._slots[self._head] = None
+        self._head = (self._head + 1) % size
+        self._count -= 1
+        return entry
+
+
+class CanTxScheduler:
+    """Feeds the three MCP2515 TX buffers from one queue per hardware priority.
+
+    The priority of a frame comes from `CAN.TX_PRIORITIES` (by CAN ID) and is written to the TXP bits
+    of its buffer, so e.g. the periodic status report is not stuck behind a SID text burst. Frames
+    with the same ID are never pending in two buffers at once, which keeps multi-frame sequences in
+    order; frames of other IDs queued behind such a frame are loaded past it. Frames of IDs not in
+    `CAN.TX_ORDERED_IDS` are coalesced: a newer frame replaces the queued one with the same ID.
+    Buffers are refilled as soon as a TX-complete interrupt frees them. A frame that has not left the
+    controller `CAN.TX_DEADLINE_MS` after it was submitted is dropped from the queue or aborted in
+    its buffer.
+    """
+
+    def __init__(self, can, bus_settings=CAN, name='CANBus'):
+        self._can = can
+        self._settings = bus_settings
+        self._name = name
+        self._queues = [TxQueue(bus_settings.TX_QUEUE_SIZE) for _ in range(TX_PRIORITY_LEVELS)]
+        # (CAN ID, deadline) of the frame pending in each TX buffer
+        self._in_flight = [None] * TX_BUFFERS_COUNT
+        self._work = uasyncio.ThreadSafeFlag()
+
+        self.sent_count = 0
+        self.expired_count = 0
+        self.aborted_count = 0
+        self.dropped_count = 0
+        self.coalesced_count = 0
+
+    def submit(self, message, priority=None):
+        """Queue a message for sending. Safe to call from timer callbacks."""
+        if priority is None:
+            priority = self._settings.TX_PRIORITIES.get(message.id, 0)
+        result = self._queues[priority].push(message, ticks_add(ticks_ms(), self._settings.TX_DEADLINE_MS),
+                                             message.id not in self._settings.TX_ORDERED_IDS)
+        if result == TX_COALESCED:
+            self.coalesced_count += 1
+        elif result == TX_DROPPED_OLDEST:
+            self.dropped_count += 1
+        self._work.set()
+
+    @property
+    def queued_count(self):
+        """Queue depth: frames waiting for a TX buffer"""
+        return sum(len(queue) for queue in self._queues)
+
+    @property
+    def stats(self):
+        return {'queued': self.queued_count, 'sent': self.sent_count, 'coalesced': self.coalesced_count,
+                'dropped': self.dropped_count, 'expired': self.expired_count, 'aborted': self.aborted_count}
+
+    def controller_restarted(self):
+        """The controller was reset: frames pending in its TX buffers are lost"""
+        for idx in range(TX_BUFFERS_COUNT):
+            if self._in_flight[idx] is not None:
+                self._in_flight[idx] = None
+                self.aborted_count += 1
+        self._work.set()
+
+    async def run(self):
+        while True:
+            self._update_in_flight()
+            self._refill()
+
+            timeout = self._next_deadline_ms()
+            if self.queued_count:
+                # buffers full or the next frames wait for a frame with the same ID
+                waiter = self._can.wait_for_tx_complete()
+            else:
+                waiter = self._work.wait()
+
+            if timeout is None:
+                await waiter
+                continue
+            try:
+                await uasyncio.wait_for_ms(waiter, max(1, timeout))
+            except uasyncio.TimeoutError:
+                pass
+
+    def _update_in_flight(self):
+        now = ticks_ms()
+        busy = self._can.tx_buffers_busy
+        for idx in range(TX_BUFFERS_COUNT):
+            frame = self._in_flight[idx]
+            if frame is None:
+                continue
+            if not busy[idx]:
+                self._in_flight[idx] = None
+                self.sent_count += 1
+            elif ticks_diff(frame[1], now) <= 0 and self._can.abort_tx(idx):
+                self._in_flight[idx] = None
+                self.aborted_count += 1
+
+    def _refill(self):
+        now = ticks_ms()
+        for priority in range(TX_PRIORITY_LEVELS - 1, -1, -1):
+            queue = self._queues[priority]
+            index = 0
+            while index < len(queue):
+                if self._can.free_tx_buffer_count == 0:
+                    return
+                message, deadline = queue.peek(index)
+                if ticks_diff(deadline, now) <= 0:
+                    queue.pop(index)
+                    self.expired_count += 1
+                    continue
+                if self._id_in_flight(message.id):
+                    # the frames of this ID stay in order, the other IDs queued behind them go ahead
+                    index += 1
+                    continue
+                buffer_index = self._can.transmit(message, priority)
+                if buffer_index is None:
+                    return
+                queue.pop(index)
+                self._in_flight[buffer_index] = (message.id, deadline)
+                if DUBUG_MODE:
+                    print('[{}] Message {}/{} loaded into TX buffer {}'.format(
+                        self._name, hex(message.id), message.data, buffer_index))
+
+    def _id_in_flight(self, can_id):
+        for frame in self._in_flight:
+            if frame is not None and frame[0] == can_id:
+                return True
+        return False
+
+    def _next_deadline_ms(self):
+        now = ticks_ms()
+        nearest = None
+        for frame in self._in_flight:
+            if frame is not None:
+                remaining = ticks_diff(frame[1], now)
+                if nearest is None or remaining < nearest:
+                    nearest = remaining
+        for queue in self._queues:
+            if len(queue):
+                remaining = ticks_diff(queue.peek()[1], now)
+                if nearest is None or remaining < nearest:
+                    nearest = remaining
+        return nearest
@@ -1,13 +1,62 @@
 import time
+import uasyncio
 from micropython import const
 
-from constants import (UART_COMMANDS, AC_COOL_MODE, AC_STATUS, AC_DUAL_MODE, AC_CYCLE_MODE, AC_WINDOW_MAX,
+from constants import (UART_TYPES, AC_CONTROL, AC_COOL_MODE, AC_STATUS, AC_DUAL_MODE, AC_CYCLE_MODE, AC_WINDOW_MAX,
                        AC_COOL_MODE_AUTO, AC_FAN_DIR, AC_REAR_WINDOW_HEAT, CAN_COMMANDS_IDS, CAN_COMMANDS_NAMES)
 from controllers.door_controller import get_door_controller
 from controllers.climate_controller import get_climate_controller, get_temp_controller
 from controllers.parking_controller import get_front_parking_controller, get_rear_parking_controller
 from helpers.utils import unpack_fan_dir, pack_fan_dir, get_16_bit_hex
-from settings import UART_COMMAND_DEBOUNCE_TIMEOUT, FAN_SPEED_RANGE, CAN_COMMAND_DEBOUNCE_TIMEOUT, DUBUG_MODE
+from settings import (UART_COMMAND_DEBOUNCE_TIMEOUT, UART_COMMAND_UPDATE_TICK, FAN_SPEED_RANGE,
+                      CAN_COMMAND_DEBOUNCE_TIMEOUT, DUBUG_MODE)
+
+
+class ControllerUpdateCoalescer:
+    """Notifies the observers of controllers changed by HU commands at most once per tick.
+
+    The first update request is sent on the next loop turn; requests arriving during the following
+    `tick_ms` are collected and every changed controller is notified once at the end of the tick. The
+    commands themselves change the controller state right away and in order, only the observers
+    (actuators, UART echo) see the result of a burst at once.
+    """
+
+    def __init__(self, tick_ms=UART_COMMAND_UPDATE_TICK):
+        self._tick_ms = tick_ms
+        self._changed = []
+        self._work = uasyncio.ThreadSafeFlag()
+
+        self.requested_count = 0
+        self.sent_count = 0
+
+    def request(self, controller):
+        self.requested_count += 1
+        if controller not in self._changed:
+            self._changed.append(controller)
+        self._work.set()
+
+    async def run(self):
+        while True:
+            await self._work.wait()
+            while self._changed:
+                controller = self._changed.pop(0)
+                try:
+                    controller.send_update()
+                    self.sent_count += 1
+                except Exception as e:
+                    print('[ControllerUpdateCoalescer] {} update failed: {}'.format(controller, e))
+            await uasyncio.sleep_ms(self._tick_ms)
+
+
+update_coalescer = None
+
+
+def get_update_coalescer():
+    global update_coalescer
+    if update_coalescer is None:
+        update_coalescer = ControllerUpdateCoalescer()
+
+    return update_coalescer
 
 
 class BaseCommand:
@@ -29,6 +78,8 @@ class BaseCommand:
 
 
 class BaseUartCommand(BaseCommand):
+    TAKES_VALUE = False  # called with the value byte of the frame
+
     def __init__(self):
         super(BaseUartCommand, self).__init__()
         self._debounce_timout = UART_COMMAND_DEBOUNCE_TIMEOUT
@@ -37,6 +88,9 @@ class BaseUartCommand(BaseCommand):
     def _validate(self):
         return True
 
+    def _send_update(self):
+        get_update_coalescer().request(self._controller)
+
 
 class BaseCanCommand(BaseCommand):
     DATA_FIELD_LENGTH = 8
@@ -56,17 +110,23 @@ class BaseCanCommand(BaseCommand):
 
     def _execute(self, msg):
         if DUBUG_MODE:
-            print("[CAN command] {}/{} executing".format(self._id, msg.data))
+            print("[CAN command] {}/{} executing".format(self._id, bytes(msg.data)))
 
     def build(self):
         pass
 
 
 class StubCommand(BaseUartCommand):
+    # UART_COMMANDS.STUB_REQUEST carries 0x37, not a press byte
+    TAKES_VALUE = True
+
     def __init__(self):
         super(StubCommand, self).__init__()
 
-    def _execute(self):
+    def _validate(self, value):
+        return True
+
+    def _execute(self, value):
         pass
 
 
@@ -78,7 +138,7 @@ class ACSeatHeatLCommand(BaseUartCommand):
 
     def _execute(self):
         self._controller.l_seat_heat.next_state()
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACSeatHeatRCommand(BaseUartCommand):
@@ -89,7 +149,7 @@ class ACSeatHeatRCommand(BaseUartCommand):
 
     def _execute(self):
         self._controller.r_seat_heat.next_state()
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACCycleOnCommand(BaseUartCommand):
@@ -103,7 +163,7 @@ class ACCycleOnCommand(BaseUartCommand):
             self._controller.cycle = AC_CYCLE_MODE.INTERIOR
         else:
             self._controller.cycle = AC_CYCLE_MODE.EXTERIOR
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACRearWindowHeatOnCommand(BaseUartCommand):
@@ -117,7 +177,7 @@ class ACRearWindowHeatOnCommand(BaseUartCommand):
             self._controller.rear_window_heat = AC_REAR_WINDOW_HEAT.ON
         else:
             self._controller.rear_window_heat = AC_REAR_WINDOW_HEAT.OFF
-        self._controller.send_update()
+        self._send_update()
 
 
 class ClimateCommand(BaseUartCommand):
@@ -151,7 +211,7 @@ class ACStatusOnCommand(ClimateCommand):
             if self._prev_ac_state is not None:
                 self._controller.ac = self._prev_ac_state
                 self._prev_ac_state = None
-        self._controller.send_update()
+        self._send_update()
 
     def _validate(self):
         return True
@@ -167,7 +227,7 @@ class ACDualOnCommand(ClimateCommand):
             self._controller.dual = AC_DUAL_MODE.ON
         else:
             self._controller.dual = AC_DUAL_MODE.OFF
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACWindowMaxOnCommand(ClimateCommand):
@@ -192,7 +252,7 @@ class ACWindowMaxOnCommand(ClimateCommand):
             if self._prev_fan_speed is not None:
                 self._controller.fan_speed.state = self._prev_fan_speed
                 self._prev_fan_speed = None
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACAutoOnCommand(ClimateCommand):
@@ -207,7 +267,7 @@ class ACAutoOnCommand(ClimateCommand):
             self._controller.auto = AC_COOL_MODE_AUTO.ON
         else:
             self._controller.auto = AC_COOL_MODE_AUTO.OFF
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACOnCommand(ClimateCommand):
@@ -220,7 +280,7 @@ class ACOnCommand(ClimateCommand):
             self._controller.ac = AC_COOL_MODE.ON
         else:
             self._controller.ac = AC_COOL_MODE.OFF
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACFanDirUpCommand(ClimateCommand):
@@ -232,7 +292,7 @@ class ACFanDirUpCommand(ClimateCommand):
         up_state, middle_state, down_state = unpack_fan_dir(self._controller.fan_dir)
         up = 0 if up_state == 1 else 1
         self._controller.fan_dir = pack_fan_dir(up, middle_state, down_state)
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACFanDirMiddleCommand(ClimateCommand):
@@ -244,7 +304,7 @@ class ACFanDirMiddleCommand(ClimateCommand):
         up_state, middle_state, down_state = unpack_fan_dir(self._controller.fan_dir)
         middle = 0 if middle_state == 1 else 1
         self._controller.fan_dir = pack_fan_dir(up_state, middle, down_state)
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACFanDirDownCommand(ClimateCommand):
@@ -256,7 +316,7 @@ class ACFanDirDownCommand(ClimateCommand):
         up_state, middle_state, down_state = unpack_fan_dir(self._controller.fan_dir)
         down = 0 if down_state == 1 else 1
         self._controller.fan_dir = pack_fan_dir(up_state, middle_state, down)
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACIncFanSpeedCommand(ClimateCommand):
@@ -266,7 +326,7 @@ class ACIncFanSpeedCommand(ClimateCommand):
 
     def _execute(self):
         self._controller.fan_speed.next_state()
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACDecFanSpeedCommand(ClimateCommand):
@@ -278,7 +338,7 @@ class ACDecFanSpeedCommand(ClimateCommand):
         if self._controller.window_max == AC_WINDOW_MAX.ON:
             return
         self._controller.fan_speed.prev_state()
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACIncLTempCommand(ClimateCommand):
@@ -290,7 +350,7 @@ class ACIncLTempCommand(ClimateCommand):
         self._controller.l_temp.next_state()
         if self._controller.dual == AC_DUAL_MODE.ON:
             self._controller.r_temp.state = self._controller.l_temp.state
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACDecLTempCommand(ClimateCommand):
@@ -302,7 +362,7 @@ class ACDecLTempCommand(ClimateCommand):
         self._controller.l_temp.prev_state()
         if self._controller.dual == AC_DUAL_MODE.ON:
             self._controller.r_temp.state = self._controller.l_temp.state
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACIncRTempCommand(ClimateCommand):
@@ -314,7 +374,7 @@ class ACIncRTempCommand(ClimateCommand):
         self._controller.r_temp.next_state()
         if self._controller.dual == AC_DUAL_MODE.ON:
             self._controller.l_temp.state = self._controller.r_temp.state
-        self._controller.send_update()
+        self._send_update()
 
 
 class ACDecRTempCommand(ClimateCommand):
@@ -326,7 +386,59 @@ class ACDecRTempCommand(ClimateCommand):
         self._controller.r_temp.prev_state()
         if self._controller.dual == AC_DUAL_MODE.ON:
             self._controller.l_temp.state = self._controller.r_temp.state
-        self._controller.send_update()
+        self._send_update()
+
+
+class ACSetValueCommand(ClimateCommand):
+    """Sets a selector to the value of the frame in one step (e.g. from a slider on HU)"""
+    TAKES_VALUE = True
+
+    def __init__(self):
+        super(ACSetValueCommand, self).__init__()
+        # absolute values are idempotent, every update of a slider has to pass
+        self._debounce_timout = 0
+
+    def _selector(self):
+        pass
+
+    def _validate(self, value):
+        return super(ACSetValueCommand, self)._validate() and value in self._selector()
+
+    def _execute(self, value):
+        self._selector().state = value
+        self._send_update()
+
+
+class ACSetLTempCommand(ACSetValueCommand):
+    def _selector(self):
+        return self._controller.l_temp
+
+    def _execute(self, value):
+        self._controller.l_temp.state = value
+        if self._controller.dual == AC_DUAL_MODE.ON:
+            self._controller.r_temp.state = value
+        self._send_update()
+
+
+class ACSetRTempCommand(ACSetValueCommand):
+    def _selector(self):
+        return self._controller.r_temp
+
+    def _execute(self, value):
+        self._controller.r_temp.state = value
+        if self._controller.dual == AC_DUAL_MODE.ON:
+            self._controller.l_temp.state = value
+        self._send_update()
+
+
+class ACSetFanSpeedCommand(ACSetValueCommand):
+    def _selector(self):
+        return self._controller.fan_speed
+
+    def _validate(self, value):
+        if self._controller.window_max == AC_WINDOW_MAX.ON:
+            return False
+        return super(ACSetFanSpeedCommand, self)._validate(value)
 
 
 class COMMAND_NAMES:
@@ -348,6 +460,9 @@ class COMMAND_NAMES:
     ACFanDirMiddleCommand = 'ACFanDirMiddleCommand'
     ACFanDirDownCommand = 'ACFanDirDownCommand'
     ACRearWindowHeatOnCommand = 'ACRearWindowHeatOnCommand'
+    ACSetLTempCommand = 'ACSetLTempCommand'
+    ACSetRTempCommand = 'ACSetRTempCommand'
+    ACSetFanSpeedCommand = 'ACSetFanSpeedCommand'
     StubCommand = 'StubCommand'
 
 
@@ -370,6 +485,9 @@ COMMANDS = (
     ACFanDirMiddleCommand,
     ACFanDirDownCommand,
     ACRearWindowHeatOnCommand,
+    ACSetLTempCommand,
+    ACSetRTempCommand,
+    ACSetFanSpeedCommand,
     StubCommand,
 )
 
@@ -377,26 +495,36 @@ COMMANDS = (
 INITED_COMMANDS = {c.__name__: c() for c in COMMANDS}
 
 
+def uart_command_key(frame_type, command):
+    """UARTCmdHandlers key: frame type and the first payload byte"""
+    return (frame_type << 8) | command
+
+
 UARTCmdHandlers = {
-     UART_COMMANDS.AC_ON: INITED_COMMANDS[COMMAND_NAMES.ACOnCommand],
-     UART_COMMANDS.AC_STATUS_ON: INITED_COMMANDS[COMMAND_NAMES.ACStatusOnCommand],
-     UART_COMMANDS.AC_MODE_AUTO_ON: INITED_COMMANDS[COMMAND_NAMES.ACAutoOnCommand],
-     UART_COMMANDS.DUAL_MODE_ON: INITED_COMMANDS[COMMAND_NAMES.ACDualOnCommand],
-     UART_COMMANDS.L_TEMP_INC: INITED_COMMANDS[COMMAND_NAMES.ACIncLTempCommand],
-     UART_COMMANDS.L_TEMP_DEC: INITED_COMMANDS[COMMAND_NAMES.ACDecLTempCommand],
-     UART_COMMANDS.R_TEMP_INC: INITED_COMMANDS[COMMAND_NAMES.ACIncRTempCommand],
-     UART_COMMANDS.R_TEMP_DEC: INITED_COMMANDS[COMMAND_NAMES.ACDecRTempCommand],
-     UART_COMMANDS.FAN_SPEED_INC: INITED_COMMANDS[COMMAND_NAMES.ACIncFanSpeedCommand],
-     UART_COMMANDS.FAN_SPEED_DEC: INITED_COMMANDS[COMMAND_NAMES.ACDecFanSpeedCommand],
-     UART_COMMANDS.L_SEAT_HEAT_SWITCH: INITED_COMMANDS[COMMAND_NAMES.ACSeatHeatLCommand],
-     UART_COMMANDS.R_SEAT_HEAT_SWITCH: INITED_COMMANDS[COMMAND_NAMES.ACSeatHeatRCommand],
-     UART_COMMANDS.CYCLE_MODE_ON: INITED_COMMANDS[COMMAND_NAMES.ACCycleOnCommand],
-     UART_COMMANDS.WINDOW_MAX_ON: INITED_COMMANDS[COMMAND_NAMES.ACWindowMaxOnCommand],
-     UART_COMMANDS.FAN_DIR_WINDOW: INITED_COMMANDS[COMMAND_NAMES.ACFanDirUpCommand],
-     UART_COMMANDS.FAN_DIR_MIDDLE: INITED_COMMANDS[COMMAND_NAMES.ACFanDirMiddleCommand],
-     UART_COMMANDS.FAN_DIR_DOWN: INITED_COMMANDS[COMMAND_NAMES.ACFanDirDownCommand],
-     UART_COMMANDS.REAR_WINDOW_HEAT_ON: INITED_COMMANDS[COMMAND_NAMES.ACRearWindowHeatOnCommand],
-     UART_COMMANDS.STUB_REQUEST: INITED_COMMANDS[COMMAND_NAMES.StubCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.AC): INITED_COMMANDS[COMMAND_NAMES.ACOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.AC_STATUS): INITED_COMMANDS[COMMAND_NAMES.ACStatusOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.AC_MODE_AUTO): INITED_COMMANDS[COMMAND_NAMES.ACAutoOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.DUAL_MODE): INITED_COMMANDS[COMMAND_NAMES.ACDualOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.L_TEMP_INC): INITED_COMMANDS[COMMAND_NAMES.ACIncLTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.L_TEMP_DEC): INITED_COMMANDS[COMMAND_NAMES.ACDecLTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.R_TEMP_INC): INITED_COMMANDS[COMMAND_NAMES.ACIncRTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.R_TEMP_DEC): INITED_COMMANDS[COMMAND_NAMES.ACDecRTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.FAN_SPEED_INC): INITED_COMMANDS[COMMAND_NAMES.ACIncFanSpeedCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.FAN_SPEED_DEC): INITED_COMMANDS[COMMAND_NAMES.ACDecFanSpeedCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.L_SEAT_HEAT): INITED_COMMANDS[COMMAND_NAMES.ACSeatHeatLCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.R_SEAT_HEAT): INITED_COMMANDS[COMMAND_NAMES.ACSeatHeatRCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.CYCLE_MODE): INITED_COMMANDS[COMMAND_NAMES.ACCycleOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.WINDOW_MAX): INITED_COMMANDS[COMMAND_NAMES.ACWindowMaxOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.FAN_DIR_WINDOW): INITED_COMMANDS[COMMAND_NAMES.ACFanDirUpCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.FAN_DIR_MIDDLE): INITED_COMMANDS[COMMAND_NAMES.ACFanDirMiddleCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.FAN_DIR_DOWN): INITED_COMMANDS[COMMAND_NAMES.ACFanDirDownCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.REAR_WINDOW_HEAT):
+        INITED_COMMANDS[COMMAND_NAMES.ACRearWindowHeatOnCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.SET_L_TEMP): INITED_COMMANDS[COMMAND_NAMES.ACSetLTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.SET_R_TEMP): INITED_COMMANDS[COMMAND_NAMES.ACSetRTempCommand],
+    uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.SET_FAN_SPEED):
+        INITED_COMMANDS[COMMAND_NAMES.ACSetFanSpeedCommand],
+    uart_command_key(UART_TYPES.STUB_REQUEST, 0x04): INITED_COMMANDS[COMMAND_NAMES.StubCommand],
 }
 
 class DoorStatusCommand(BaseCanCommand):
@@ -478,7 +606,7 @@ class ParkingCommand(BaseCanCommand):
         self._f_controller.rc = int(data[6])
         self._f_controller.r = int(data[7])
         self._f_controller.send_update()
-        print('Raw data: {}\n, {}, {}, {}, {}, {}, {}, {}, {}\n'.format(msg.data, int(data[0]), int(data[1]), int(data[2]),
+        print('Raw data: {}\n, {}, {}, {}, {}, {}, {}, {}, {}\n'.format(bytes(data), int(data[0]), int(data[1]), int(data[2]),
                                                         int(data[3]), int(data[4]), int(data[5]), int(data[6]),
                                                         int(data[7])))
 
@@ -587,3 +715,7 @@ CANCmdHandlers = {
     #CAN_COMMANDS_IDS.SID_BEEP_REQUEST: DummyCommand(),
     # CAN_COMMANDS_IDS.LIGHT_DIMMER_LIGHT_SENSOR: DummyCommand(),
 }
+
+# P-bus (powertrain, 500 kbps) handlers, see settings.P_CAN
+CANPBusCmdHandlers = {
+}
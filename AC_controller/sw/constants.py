@@ -13,13 +13,67 @@ class UART_TYPES:
     PARK_ON = const(0x25)
     TMPS = const(0x65)  # HU -> CH_CMD_TPMS_INFO
     CH_CMD_VEHICLE_SPEED_SIGNAL = const(0x0b)
+    AC_CONTROL = const(0xe0)  # HU -> Box, payload: AC_CONTROL command, value
+    STUB_REQUEST = const(0x89)  # HU -> Box
+    REQ_START = const(0x81)  # HU -> Box CANBOX_CMD_REQ_START
     # 0x0D CH_CMD_ALARM_VOLUME
     # 0x07 CH_CMD_PARKING_RADAR_SWITCH_INFO (rear radar)
 
+# HU -> Box UART_TYPES.AC_CONTROL commands
+class AC_CONTROL:
+    PRESSED = const(0x01)  # value byte of the toggle commands on a button press, 0x00 is the release
+    AC_STATUS = const(0x01)
+    L_TEMP_DEC = const(0x02)
+    L_TEMP_INC = const(0x03)
+    R_TEMP_DEC = const(0x04)
+    R_TEMP_INC = const(0x05)
+    FAN_DIR_MIDDLE = const(0x07)
+    FAN_DIR_DOWN = const(0x08)
+    FAN_SPEED_DEC = const(0x09)
+    FAN_SPEED_INC = const(0x0a)
+    L_SEAT_HEAT = const(0x0b)
+    L_SEAT_FAN = const(0x0c)
+    R_SEAT_HEAT = const(0x0d)
+    R_SEAT_FAN = const(0x0e)
+    DUAL_MODE = const(0x10)
+    FAN_DIR_WINDOW = const(0x12)
+    WINDOW_MAX = const(0x13)
+    REAR_WINDOW_HEAT = const(0x14)
+    AC_MODE_AUTO = const(0x15)
+    AC = const(0x17)
+    CYCLE_MODE = const(0x19)
+    # absolute values, value is the state as reported to HU (AC_TEMP_RANGE code, FAN_SPEED_RANGE step)
+    SET_L_TEMP = const(0x20)
+    SET_R_TEMP = const(0x21)
+    SET_FAN_SPEED = const(0x22)
+
+
 class CONTROLLER_TYPES:
     TEMP = 'TempController'
 
 
+# ClimateController fields, bits of the change mask delivered with its updates
+class CLIMATE_FIELDS:
+    AC_STATUS = const(0x0001)
+    AC = const(0x0002)
+    AUTO = const(0x0004)
+    DUAL = const(0x0008)
+    L_TEMP = const(0x0010)
+    R_TEMP = const(0x0020)
+    FAN_SPEED = const(0x0040)
+    L_SEAT_HEAT = const(0x0080)
+    R_SEAT_HEAT = const(0x0100)
+    EXT_TEMP = const(0x0200)
+    FAN_DIR = const(0x0400)
+    CYCLE = const(0x0800)
+    WINDOW_MAX = const(0x1000)
+    REAR_WINDOW_HEAT = const(0x2000)
+    SUN_SENSOR = const(0x4000)
+    ACC_VOLTAGE = const(0x8000)
+    # fields sent to HU
+    PACKED = const(0x3fff)
+
+
 class CAN_COMMANDS_IDS:
     SPA_DISTANCE = const(0x500)  # 0x439
     DOOR_STATUS = const(0x320)
@@ -105,6 +159,21 @@ class UART_COMMANDS:
     STUB_REQUEST = bytes([0x2e, 0x89, 0x03, 0x04, 0x37, 0x00, 0x38])  # b'\x2e\x89\x03\x04\x37\x00\x38'
     ACK = bytes([0xff])  # b'\xff'
 
+    # HU -> Box CANBOX_CMD_REQ_START
+    REQ_START = bytes([0x2e, 0x81, 0x01, 0x01, 0x7c])
+    # Box -> HU answer to REQ_START, one write
+    START_SEQUENCE = bytes([
+        0x2e, 0x30, 0x10, 0x42, 0x49, 0x4e, 0x41, 0x52, 0x59, 0x20, 0x42, 0x4b, 0x20, 0x56, 0x32, 0x32, 0x38,
+        0x00, 0x00, 0x3b,  # CH_CMD_PROTOCOL_VERSION_INFO "BINARY BK V228"
+        0x2e, 0xee, 0x02, 0xff, 0xff, 0x11,  # ?
+        0x2e, 0x24, 0x02, 0x00, 0x00, 0xd9,  # CH_CMD_BASE_INFO
+        0x2e, 0x05, 0x02, 0x00, 0x00, 0xf8,  # CH_CMD_AIR_CONDITON_CONTROL_INFO
+        0x2e, 0x06, 0x02, 0x00, 0x00, 0xf7,  # CH_CMD_VEHICLE_SETTING_INFO
+        0x2e, 0x0a, 0x03, 0x00, 0x00, 0x00, 0xf2,  # CH_CMD_VEHICLE_SETTING_INFO2
+        0x2e, 0x63, 0x06, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x96,  # ?
+    ])
+    START_SEQUENCE_FRAMES = 7  # frames in START_SEQUENCE, HU acknowledges each of them
+
 
 # HU - > VIM_AIR_CONDITIONING_PROPERTY
 class AC_STATUS:
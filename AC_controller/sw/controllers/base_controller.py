@@ -1,23 +1,36 @@
+from struct import pack_into, unpack_from
+
 from helpers.observer import ControllerNotifier
 
 
 class BaseStateSelector:
-    def __init__(self, sequence, initial_state=None):
+    def __init__(self, sequence, initial_state=None, on_change=None):
         self._sequence = sequence
         self._current_idx = 0
+        self.on_change = on_change  # called with the new state
         if initial_state is not None:
             self.state = initial_state
 
+    def _set_idx(self, idx):
+        self._current_idx = idx
+        if self.on_change is not None:
+            self.on_change(self._sequence[idx])
+
+    def __contains__(self, value):
+        return value in self._sequence
+
     @property
     def state(self):
         return self._sequence[self._current_idx]
 
     @state.setter
     def state(self, value):
-        if value in self._sequence:
-            self._current_idx = self._sequence.index(value)
-        else:
+        try:
+            idx = self._sequence.index(value)
+        except ValueError:
             print("Cannot set state: {}. Not in sequence: {}".format(value, self._sequence))
+            return
+        self._set_idx(idx)
 
 
 class CycledSelector(BaseStateSelector):
@@ -25,9 +38,9 @@ class CycledSelector(BaseStateSelector):
     def next_state(self):
         next_idx = self._current_idx + 1
         if next_idx > len(self._sequence) - 1:
-            self._current_idx = 0
+            self._set_idx(0)
         else:
-            self._current_idx = next_idx
+            self._set_idx(next_idx)
         # self._current_state = self._sequence[self._current_idx]
 
 
@@ -39,21 +52,78 @@ class SequentialSelector(CycledSelector):
         next_idx = self._current_idx + 1
         print("FAN_SPEED next_idx: {}".format(next_idx))
         if self._check_next_idx(next_idx):
-            self._current_idx = next_idx
+            self._set_idx(next_idx)
             # self._current_state = self._sequence[self._current_idx]
 
     def prev_state(self):
         prev_idx = self._current_idx - 1
         print("FAN_SPEED prev_idx: {}".format(prev_idx))
         if self._check_next_idx(prev_idx):
-            self._current_idx = prev_idx
+            self._set_idx(prev_idx)
             # self._current_state = self._sequence[self._current_idx]
 
 
+def packed_field(byte, shift=0, mask=0x01, convert=None, raw=None):
+    """Controller attribute kept in bits of its packed data: the setter patches `mask` << `shift` of
+    byte `byte` with the value, the getter reads the bits back. With `convert` the bits hold
+    convert(value), the value itself is kept in state byte `raw`."""
+    if convert is None:
+        def getter(self):
+            return (self._state[byte] >> shift) & mask
+
+        def setter(self, value):
+            self._pack(byte, shift, mask, value)
+    else:
+        def getter(self):
+            return self._state[raw]
+
+        def setter(self, value):
+            self._state[raw] = value
+            self._pack(byte, shift, mask, convert(value))
+
+    return property(getter, setter)
+
+
+def state_field(offset, fmt='B'):
+    """Controller attribute kept in its state buffer at `offset` as struct `fmt`, not sent to HU"""
+    def getter(self):
+        return unpack_from(fmt, self._state, offset)[0]
+
+    def setter(self, value):
+        pack_into(fmt, self._state, offset, value)
+
+    return property(getter, setter)
+
+
 class BaseController(ControllerNotifier):
-    def __init__(self, controller_type):
+    STATE_LENGTH = 0  # bytes of the `state_field`s after the packed data
+
+    def __init__(self, controller_type, packed_length=0):
         super(BaseController, self).__init__()
         self._controller_type = controller_type
+        # the whole controller state: data sent to HU, patched by the field setters (see `packed_field`),
+        # followed by the fields HU does not get (see `state_field`)
+        self._state = bytearray(packed_length + self.STATE_LENGTH)
+        self._packed_view = memoryview(self._state)[:packed_length]
+
+    def _pack(self, byte, shift, mask, value):
+        state = self._state
+        state[byte] = (state[byte] & ~(mask << shift) & 0xff) | ((value & mask) << shift)
+
+    def _field_packer(self, byte, shift=0, mask=0xff):
+        """`on_change` callback of a selector packed into the data"""
+        return lambda value: self._pack(byte, shift, mask, value)
+
+    def snapshot(self, buf=None):
+        """Copy of the whole state for `restore`, written into `buf` (as long as the state) if given"""
+        if buf is None:
+            return bytes(self._state)
+        buf[:] = self._state
+        return buf
+
+    def restore(self, snapshot):
+        """Set the state saved by `snapshot`. Observers are not notified, call `send_update` for that."""
+        self._state[:] = snapshot
 
     @property
     def controller_type(self):
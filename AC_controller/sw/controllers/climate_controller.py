@@ -1,12 +1,15 @@
+from struct import pack_into, unpack_from
+
 from machine import Timer
 
 import settings
 # import commands
 from constants import (
     UART_TYPES, AC_CYCLE_MODE, AC_STATUS, AC_COOL_MODE, AC_COOL_MODE_AUTO, AC_DUAL_MODE, AC_WINDOW_MAX,
-    AC_FAN_DIR, AC_REAR_WINDOW_HEAT, CONTROLLER_TYPES, SUN_SENSOR_STATUS
+    AC_FAN_DIR, AC_REAR_WINDOW_HEAT, CONTROLLER_TYPES, SUN_SENSOR_STATUS, CLIMATE_FIELDS
 )
-from controllers.base_controller import BaseController, SequentialSelector, CycledSelector, BaseStateSelector
+from controllers.base_controller import (BaseController, SequentialSelector, CycledSelector, BaseStateSelector,
+                                         packed_field, state_field)
 
 from settings import FAN_SPEED_RANGE, SEAT_HEAT_RANGE, AC_TEMP_RANGE, EXT_TEMP_RANGE
 
@@ -16,37 +19,75 @@ from settings import FAN_SPEED_RANGE, SEAT_HEAT_RANGE, AC_TEMP_RANGE, EXT_TEMP_R
 
 class ClimateController(BaseController):
     DATA_FIELD_LENGTH = 7
+    # (CLIMATE_FIELDS bit, value getter) compared with the last published values on send_update
+    FIELD_GETTERS = (
+        (CLIMATE_FIELDS.AC_STATUS, lambda c: c.ac_status),
+        (CLIMATE_FIELDS.AC, lambda c: c.ac),
+        (CLIMATE_FIELDS.AUTO, lambda c: c.auto),
+        (CLIMATE_FIELDS.DUAL, lambda c: c.dual),
+        (CLIMATE_FIELDS.L_TEMP, lambda c: c.l_temp.state),
+        (CLIMATE_FIELDS.R_TEMP, lambda c: c.r_temp.state),
+        (CLIMATE_FIELDS.FAN_SPEED, lambda c: c.fan_speed.state),
+        (CLIMATE_FIELDS.L_SEAT_HEAT, lambda c: c.l_seat_heat.state),
+        (CLIMATE_FIELDS.R_SEAT_HEAT, lambda c: c.r_seat_heat.state),
+        (CLIMATE_FIELDS.EXT_TEMP, lambda c: c.ext_temp.state),
+        (CLIMATE_FIELDS.FAN_DIR, lambda c: c.fan_dir),
+        (CLIMATE_FIELDS.CYCLE, lambda c: c.cycle),
+        (CLIMATE_FIELDS.WINDOW_MAX, lambda c: c.window_max),
+        (CLIMATE_FIELDS.REAR_WINDOW_HEAT, lambda c: c.rear_window_heat),
+        (CLIMATE_FIELDS.SUN_SENSOR, lambda c: c.sun_sensor),
+        (CLIMATE_FIELDS.ACC_VOLTAGE, lambda c: c.acc_voltage),
+    )
+
+    # packed data layout: data[byte] bits (mask << shift)
+    ac_status = packed_field(0, 7)
+    ac = packed_field(0, 6)
+    cycle = packed_field(0, 5)
+    rear_window_heat = packed_field(0, 4)
+    dual = packed_field(1, 5)
+    window_max = packed_field(1, 4)
+    fan_dir = packed_field(1, 0, 0x0f)
+    auto = packed_field(6, 1)
+    # selector attribute, byte, shift, mask
+    SELECTORS = (
+        ('_fan_speed', 0, 0, 0x0f),
+        ('l_temp', 2, 0, 0xff),
+        ('r_temp', 3, 0, 0xff),
+        ('l_seat_heat', 4, 4, 0x0f),
+        ('r_seat_heat', 4, 0, 0x0f),
+        ('ext_temp', 5, 0, 0xff),
+    )
+    # not sent to HU, kept after the packed data
+    STATE_LENGTH = 5
+    sun_sensor = state_field(7)
+    acc_voltage = state_field(8, '<f')
 
     def __init__(self):
-        super(ClimateController, self).__init__(UART_TYPES.AC)
+        super(ClimateController, self).__init__(UART_TYPES.AC, self.DATA_FIELD_LENGTH)
+        self._published = [None] * len(self.FIELD_GETTERS)
+        self.changed = 0  # CLIMATE_FIELDS changed by the last update
         self.ac_status = AC_STATUS.OFF
         self.ac = AC_COOL_MODE.OFF
         self.auto = AC_COOL_MODE_AUTO.OFF
         self.dual = AC_DUAL_MODE.ON  # Dual is always on because of one climate zone in current car
+        self._fan_speed = SequentialSelector(FAN_SPEED_RANGE, min(FAN_SPEED_RANGE))
         self.l_temp = SequentialSelector(AC_TEMP_RANGE, min(AC_TEMP_RANGE))
         self.r_temp = SequentialSelector(AC_TEMP_RANGE, min(AC_TEMP_RANGE))
-        self._fan_speed = SequentialSelector(FAN_SPEED_RANGE, min(FAN_SPEED_RANGE))
         self.l_seat_heat = CycledSelector(SEAT_HEAT_RANGE, min(SEAT_HEAT_RANGE))
         self.r_seat_heat = CycledSelector(SEAT_HEAT_RANGE, min(SEAT_HEAT_RANGE))
         self.ext_temp = BaseStateSelector(EXT_TEMP_RANGE, 0)
+        for name, byte, shift, mask in self.SELECTORS:
+            selector = getattr(self, name)
+            selector.on_change = self._field_packer(byte, shift, mask)
+            selector.on_change(selector.state)
         self.fan_dir = AC_FAN_DIR.AC_FAN_DIR_UP_DOWN_CENTER
         self.cycle = AC_CYCLE_MODE.EXTERIOR
-        self._window_max = AC_WINDOW_MAX.OFF
+        self.window_max = AC_WINDOW_MAX.OFF
         self.rear_window_heat = AC_REAR_WINDOW_HEAT.OFF
         self.sun_sensor = SUN_SENSOR_STATUS.OFF
         self.acc_voltage = 0
         # self._sid_text = get_sid_text_device()
 
-    @property
-    def window_max(self):
-        return self._window_max
-
-    @window_max.setter
-    def window_max(self, value):
-        self._window_max = value
-        # if self.auto == AC_COOL_MODE_AUTO.ON and self.sun_sensor == SUN_SENSOR_STATUS.OFF:
-        #     self.auto = AC_COOL_MODE_AUTO.OFF
-
     @property
     def fan_speed(self):
         return self._fan_speed
@@ -54,71 +95,69 @@ class ClimateController(BaseController):
     @fan_speed.setter
     def fan_speed(self, value):
         self._fan_speed = value
+        value.on_change = self._field_packer(0, 0, 0x0f)
+        value.on_change(value.state)
         # if self.auto == AC_COOL_MODE_AUTO.ON:
         #     self.auto = AC_COOL_MODE_AUTO.OFF
 
-    def acc_voltage(self, value):
-        self._acc_voltage = value
-        if self._acc_voltage < settings.ACC_VOLTAGE_THRESHOLD and self.ac_status == AC_STATUS.ON:
-            pass
-            # commands.INITED_COMMANDS[commands.COMMAND_NAMES.ACStatusOnCommand]()
-            # self._sid_text.show_text('Low Battery')
-
+    # def acc_voltage(self, value):
+    #     if value < settings.ACC_VOLTAGE_THRESHOLD and self.ac_status == AC_STATUS.ON:
+    #         commands.INITED_COMMANDS[commands.COMMAND_NAMES.ACStatusOnCommand]()
+    #         self._sid_text.show_text('Low Battery')
+
+    def restore(self, snapshot):
+        super(ClimateController, self).restore(snapshot)
+        for name, byte, shift, mask in self.SELECTORS:
+            selector = getattr(self, name)
+            value = (self._state[byte] >> shift) & mask
+            if value not in selector:
+                value -= mask + 1  # negative states are packed in two's complement
+            selector.state = value
+
+    def send_update(self):
+        """Notify the observers of the fields changed since the last update"""
+        changed = 0
+        published = self._published
+        for idx in range(len(self.FIELD_GETTERS)):
+            field, getter = self.FIELD_GETTERS[idx]
+            value = getter(self)
+            if value != published[idx]:
+                published[idx] = value
+                changed |= field
+        self.changed = changed
+        self.notify(self.controller_type, self, changed)
 
     def get_packed_data(self):
-        data = [0x00] * self.DATA_FIELD_LENGTH
-
-        data[0] |= self.ac_status << 7
-        data[0] |= self.ac << 6
-        data[0] |= (self.fan_speed.state << 0) & 0x0f
-        data[0] |= self.cycle << 5
-        data[0] |= self.rear_window_heat << 4
-        #data[0] |= 1 << 3   # Auto in cycle mode. Nothig to show?
-
-        data[1] |= self.dual << 5
-        data[1] |= self.window_max << 4
-        data[1] |= self.fan_dir << 0
-
-        data[2] |= self.l_temp.state
-        data[3] |= self.r_temp.state
-
-        data[4] |= (self.r_seat_heat.state << 0)
-        data[4] |= (self.l_seat_heat.state << 4)
-        data[5] |= self.ext_temp.state
-        data[6] |= self.auto << 1
-        # data[6] |= 1 << 0  # Nothig to show?
-
-        return data
+        """Packed state for HU, kept up to date by the field setters. The view is shared, copy to keep."""
+        return self._packed_view
 
 
 class TempController(BaseController):
+    # sensor -> offset of its temperature ('<f') in the state buffer
+    SENSOR_OFFSETS = {
+        settings.TEMP_SENSORS.INT: 0,
+        settings.TEMP_SENSORS.INT_L: 4,
+        settings.TEMP_SENSORS.INT_R: 8,
+        settings.TEMP_SENSORS.COOLER: 12,
+        settings.TEMP_SENSORS.MIXED: 16,
+    }
+    STATE_LENGTH = 22
+    coolant = state_field(20, '<h')
+
     def __init__(self):
         super(TempController, self).__init__(CONTROLLER_TYPES.TEMP)
-        self.coolant = 0
-        self._int_temp = 0
-        self._int_l_temp = 0
-        self._int_r_temp = 0
-        self._mixed_temp = 0
-        self._cooler_temp = 0
-        self._sensors_state = {
-            settings.TEMP_SENSORS.INT: self._int_temp,
-            settings.TEMP_SENSORS.INT_L: self._int_l_temp,
-            settings.TEMP_SENSORS.INT_R: self._int_r_temp,
-            settings.TEMP_SENSORS.COOLER: self._cooler_temp,
-            settings.TEMP_SENSORS.MIXED: self._mixed_temp,
-        }
-
-    @property
-    def sensors_state(self):
-        return self._sensors_state
 
     @property
     def int_temp(self):
-        return self.sensors_state[settings.TEMP_SENSORS.INT]
+        return self.get_temp(settings.TEMP_SENSORS.INT)
+
+    def get_temp(self, sensor_name):
+        return unpack_from('<f', self._state, self.SENSOR_OFFSETS[sensor_name])[0]
 
     def set_temp(self, sensor_name, temp):
-        if sensor_name in self._sensors_state:
-            self._sensors_state[sensor_name] = temp
+        offset = self.SENSOR_OFFSETS.get(sensor_name)
+        if offset is not None:
+            pack_into('<f', self._state, offset, temp)
         else:
             print("[TempController] Cannot assign temp to sensor: {}".format(sensor_name))
 
@@ -1,10 +1,18 @@
-from constants import DOOR_STATUS, UART_TYPES, DOOR_HEX_VALUE
-from controllers.base_controller import BaseController
+from constants import DOOR_STATUS, UART_TYPES
+from controllers.base_controller import BaseController, packed_field
 
 
 class DoorController(BaseController):
+    DATA_FIELD_LENGTH = 1
+    # DOOR_HEX_VALUE bits of data[0], set when the door is open
+    trunk = packed_field(0, 3)
+    rl = packed_field(0, 4)
+    rr = packed_field(0, 5)
+    fl = packed_field(0, 6)
+    fr = packed_field(0, 7)
+
     def __init__(self,):
-        super(DoorController, self).__init__(UART_TYPES.DOOR)
+        super(DoorController, self).__init__(UART_TYPES.DOOR, self.DATA_FIELD_LENGTH)
         self.fl = DOOR_STATUS.CLOSE
         self.fr = DOOR_STATUS.CLOSE
         self.rl = DOOR_STATUS.CLOSE
@@ -12,18 +20,8 @@ class DoorController(BaseController):
         self.trunk = DOOR_STATUS.CLOSE
 
     def get_packed_data(self):
-        data = [0x00]
-        if self.trunk == DOOR_STATUS.OPEN:
-            data[0] |= DOOR_HEX_VALUE.TRUNK
-        if self.rl == DOOR_STATUS.OPEN:
-            data[0] |= DOOR_HEX_VALUE.RL
-        if self.rr == DOOR_STATUS.OPEN:
-            data[0] |= DOOR_HEX_VALUE.RR
-        if self.fl == DOOR_STATUS.OPEN:
-            data[0] |= DOOR_HEX_VALUE.FL
-        if self.fr == DOOR_STATUS.OPEN:
-            data[0] |= DOOR_HEX_VALUE.FR
-        return data
+        """Packed door states for HU, kept up to date by the setters. The view is shared, copy to keep."""
+        return self._packed_view
 
 
 door_controller = None
@@ -1,16 +1,31 @@
 from constants import UART_TYPES
 from settings import F_PARKING_RANGE, R_PARKING_RANGE
-from controllers.base_controller import BaseController
+from controllers.base_controller import BaseController, packed_field, state_field
 
-from helpers.utils import scale
+from helpers.utils import linear_scaler
 from settings import PARKING_SENSOR_VALUES_RANGE
 
 
+def _sensor_converter(sensor_range):
+    """Distance reported on CAN (in 10 cm) -> HU value"""
+    scaler = linear_scaler(PARKING_SENSOR_VALUES_RANGE, sensor_range)
+    return lambda value: scaler(value * 10)
+
+
 class FrontParkingController(BaseController):
     DATA_FIELD_LENGTH = 4
+    # HU gets two fixed bytes for now, the distances are kept after them
+    PACKED_LENGTH = 2
+    STATE_LENGTH = 4
+    l = state_field(2)
+    lc = state_field(3)
+    rc = state_field(4)
+    r = state_field(5)
 
     def __init__(self,):
-        super(FrontParkingController, self).__init__(UART_TYPES.F_PARK)
+        super(FrontParkingController, self).__init__(UART_TYPES.F_PARK, self.PACKED_LENGTH)
+        self._state[0] = 100
+        self._state[1] = 100
         self.r = min(F_PARKING_RANGE.R)
         self.rc = min(F_PARKING_RANGE.RC)
         self.lc = min(F_PARKING_RANGE.LC)
@@ -29,28 +44,29 @@ class FrontParkingController(BaseController):
     #     return data
 
     def get_packed_data(self):
-        data = [0x00] * 2
-        data[0] = 100
-        data[1] = 100
-        return data
+        """Packed data for HU. The view is shared, copy to keep."""
+        return self._packed_view
+
 
 class RearParkingController(BaseController):
     DATA_FIELD_LENGTH = 4
+    # distances as reported on CAN, kept after the packed data
+    STATE_LENGTH = 4
+    l = packed_field(0, 0, 0xff, _sensor_converter(R_PARKING_RANGE.L), raw=4)
+    lc = packed_field(1, 0, 0xff, _sensor_converter(R_PARKING_RANGE.LC), raw=5)
+    rc = packed_field(2, 0, 0xff, _sensor_converter(R_PARKING_RANGE.RC), raw=6)
+    r = packed_field(3, 0, 0xff, _sensor_converter(R_PARKING_RANGE.R), raw=7)
 
     def __init__(self,):
-        super(RearParkingController, self).__init__(UART_TYPES.R_PARK)
+        super(RearParkingController, self).__init__(UART_TYPES.R_PARK, self.DATA_FIELD_LENGTH)
         self.r = min(R_PARKING_RANGE.R)
         self.rc = min(R_PARKING_RANGE.RC)
         self.lc = min(R_PARKING_RANGE.LC)
         self.l = min(R_PARKING_RANGE.L)
 
     def get_packed_data(self):
-        data = [0x00] * self.DATA_FIELD_LENGTH
-        data[0] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.L, self.l*10)
-        data[1] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.LC, self.lc*10)
-        data[2] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.RC, self.rc*10)
-        data[3] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.R, self.r*10)
-        return data
+        """Packed distances for HU, kept up to date by the setters. The view is shared, copy to keep."""
+        return self._packed_view
 
 
 front_parking_controller = None
@@ -2,8 +2,8 @@ from machine import Pin, PWM
 
 import settings
 from helpers.observer import Observer
-from helpers.utils import scale, convert_gui_temp, get_corrected_temp
-from constants import UART_TYPES, AC_FAN_DIR, FAN_DIR_SERVO_POSITION, CONTROLLER_TYPES, AC_STATUS, AC_COOL_MODE_AUTO
+from helpers.utils import scale, linear_scaler, convert_gui_temp, get_corrected_temp
+from constants import UART_TYPES, CLIMATE_FIELDS, AC_FAN_DIR, FAN_DIR_SERVO_POSITION, CONTROLLER_TYPES, AC_STATUS, AC_COOL_MODE_AUTO
 from controllers.climate_controller import get_climate_controller, get_temp_controller
 
 
@@ -58,12 +58,16 @@ class FanDirTemp(Observer):
     """
     switch between cold and heated air
     """
+    TOPICS = (UART_TYPES.AC, CONTROLLER_TYPES.TEMP)
+    FIELDS = CLIMATE_FIELDS.L_TEMP | CLIMATE_FIELDS.R_TEMP
+
     def __init__(self):
         self._desired_l_temp = None
         self._desired_r_temp = None
         # self._ac_status = None
         # self._current_temp = None
         self._servo = TemperatureServo()
+        self._temp_to_duty = linear_scaler(settings.AC_TEMP_RANGE, self._servo.duty_range)
         self.subscribe(get_climate_controller())
         self.subscribe(get_temp_controller())
 
@@ -90,12 +94,12 @@ class FanDirTemp(Observer):
             # if self._ac_status == AC_STATUS.OFF:
             #     self._current_temp = None
             #     return
-            mixed_temp = subject.sensors_state.get(settings.TEMP_SENSORS.MIXED)
+            mixed_temp = subject.get_temp(settings.TEMP_SENSORS.MIXED)
 
             if mixed_temp:
                 corrected_temp = get_corrected_temp(self._desired_l_temp, mixed_temp)
                 print('current_state: {}'.format(corrected_temp))
-                duty = scale(settings.AC_TEMP_RANGE, self._servo.duty_range, corrected_temp)
+                duty = self._temp_to_duty(corrected_temp)
                 print("duty: {}".format(duty))
                 self._servo.state = duty
 
@@ -112,6 +116,9 @@ class FanDirWindow(Observer):
     """
     switch air between window and other directions
     """
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.FAN_DIR
+
     def __init__(self):
         self._servo = FanDirWindowServo()
         self.subscribe(get_climate_controller())
@@ -138,6 +145,9 @@ class FanDirDownMiddle(Observer):
     """
     switch air between down and middle
     """
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.FAN_DIR
+
     def __init__(self):
         self._servo = FanDirDownMiddleServo()
         self.subscribe(get_climate_controller())
@@ -164,6 +174,9 @@ class SeatHeatLPWM(BaseDutyRangePWM):
 
 
 class SeatHeatL(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.L_SEAT_HEAT
+
     def __init__(self):
         self._heater = SeatHeatLPWM()
         self.subscribe(get_climate_controller())
@@ -185,6 +198,9 @@ class SeatHeatRPWM(BaseDutyRangePWM):
 
 
 class SeatHeatR(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.R_SEAT_HEAT
+
     def __init__(self):
         self._heater = SeatHeatRPWM()
         self.subscribe(get_climate_controller())
@@ -206,8 +222,12 @@ class ACFanPWM(BaseDutyRangePWM):
 
 
 class ACFan(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.FAN_SPEED | CLIMATE_FIELDS.AUTO
+
     def __init__(self):
         self._fan = ACFanPWM()
+        self._temp_to_duty = linear_scaler(settings.AC_TEMP_RANGE, self._fan.duty_range)
         self._ac_auto_mode = None
         self.subscribe(get_climate_controller())
 
@@ -218,10 +238,10 @@ class ACFan(Observer):
 
         if subject_type == CONTROLLER_TYPES.TEMP:
             if self._ac_auto_mode == AC_COOL_MODE_AUTO.ON:
-                corrected_temp = get_corrected_temp(subject.sensors_state[settings.TEMP_SENSORS.MIXED],
-                                                    subject.sensors_state[settings.TEMP_SENSORS.INT])
+                corrected_temp = get_corrected_temp(subject.get_temp(settings.TEMP_SENSORS.MIXED),
+                                                    subject.get_temp(settings.TEMP_SENSORS.INT))
                 print('ACFan corrected temp: {}'.format(corrected_temp))
-                duty = scale(settings.AC_TEMP_RANGE, self._fan.duty_range, corrected_temp)
+                duty = self._temp_to_duty(corrected_temp)
                 print("ACFan duty: {}".format(duty))
                 self._fan.state = duty
                 # TODO maybe send update to controller to show new fan state on gui
@@ -2,7 +2,7 @@ from machine import Pin, Timer
 
 import settings
 from helpers.observer import Observer
-from constants import UART_TYPES, AC_COOL_MODE, AC_STATUS, AC_CYCLE_MODE, AC_REAR_WINDOW_HEAT, RELAY_STATUS
+from constants import UART_TYPES, CLIMATE_FIELDS, AC_COOL_MODE, AC_STATUS, AC_CYCLE_MODE, AC_REAR_WINDOW_HEAT, RELAY_STATUS
 from controllers.climate_controller import get_climate_controller
 
 
@@ -37,6 +37,9 @@ class BaseRelay:
 
 
 class ACCompressorRelay(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.AC
+
     def __init__(self):
         self._relay = BaseRelay('ACCompressorRelay', settings.PINS.AC_COMPRESSOR_RELAY)
         self.subscribe(get_climate_controller())
@@ -47,6 +50,9 @@ class ACCompressorRelay(Observer):
 
 
 class ACCompressorFanRelay(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.AC
+
     def __init__(self):
         self._relay = BaseRelay('ACCompressorFanRelay', settings.PINS.AC_COMPRESSOR_FAN_RELAY)
         self.subscribe(get_climate_controller())
@@ -61,6 +67,9 @@ class ACCompressorFanRelay(Observer):
 
 
 class ACCycleRelay(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.CYCLE
+
     def __init__(self):
         self._relay = BaseRelay('ACCycleRelay', settings.PINS.AC_CYCLE_RELAY)
         self.subscribe(get_climate_controller())
@@ -77,6 +86,9 @@ class ACCoolantRelay(Observer):
     """
     Turn on vacuum valve in engine bay to prevent coolant circulation in internal radiator
     """
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.AC
+
     def __init__(self):
         self._relay = BaseRelay('ACCoolantRelay', settings.PINS.AC_COOLANT_RELAY)
         self.subscribe(get_climate_controller())
@@ -87,6 +99,9 @@ class ACCoolantRelay(Observer):
 
 
 class ACRearWindowHeatRelay(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.REAR_WINDOW_HEAT
+
     def __init__(self):
         self._relay = BaseRelay('ACRearWindowHeatRelay', settings.PINS.AC_REAR_WINDOW_HEAT_RELAY)
         self.subscribe(get_climate_controller())
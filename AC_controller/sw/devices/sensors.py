@@ -3,8 +3,9 @@ import onewire, ds18x20
 
 import settings
 from libs.ads1x15 import ADS1115
-from constants import UART_TYPES, AC_STATUS, SUN_SENSOR_STATUS, AC_COOL_MODE_AUTO
+from constants import UART_TYPES, CLIMATE_FIELDS, AC_STATUS, SUN_SENSOR_STATUS, AC_COOL_MODE_AUTO
 from controllers.climate_controller import get_climate_controller, get_temp_controller
+from helpers.executor import get_command_executor
 from helpers.observer import Observer
 from helpers.utils import round_float
 
@@ -48,6 +49,9 @@ class OneWireTempSensor:
 
 
 class TempSensors(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.AC_STATUS
+
     def __init__(self):
         self._sensors = OneWireTempSensor('OneWireTempSensors', settings.PINS.ONE_WIRE_TEMP_SENSORS_PIN)
         self.subscribe(get_climate_controller())
@@ -55,8 +59,13 @@ class TempSensors(Observer):
         self._temp_controller = get_temp_controller()
         self._timer = Timer()
         self._measured_temps = {}
+        self._executor = get_command_executor()
+        self._update_sensors_token = self._update_sensors
+
+    def _on_timer(self, _):
+        self._executor.submit(self._update_sensors_token)
 
-    def _update_sensors(self, _):
+    def _update_sensors(self):
         new_temps = self._sensors.measure()
         if self._measured_temps.values() == new_temps.values():
             return
@@ -70,7 +79,7 @@ class TempSensors(Observer):
         if subject_type == UART_TYPES.AC:
             if subject.ac_status == AC_STATUS.ON:
                 self._timer.init(mode=Timer.PERIODIC,
-                                 callback=self._update_sensors,
+                                 callback=self._on_timer,
                                  period=settings.ONE_WIRE_MEASURE_PERIOD)
             else:
                 self._timer.deinit()
@@ -86,17 +95,22 @@ class ADCSensors:
         self._i2c_bus = I2C(settings.I2C.ID, scl=Pin(settings.PINS.ADC_SCL), sda=Pin(settings.PINS.ADC_SDA))
         self._adc = ADS1115(self._i2c_bus, address=self.ADC_ADDRESS, gain=self.ADC_GAIN)
         self._measured_values = {}
+        self._climate_controller = get_climate_controller()
+        self._executor = get_command_executor()
+        self._measure_token = self._measure
         self._timer = Timer()
         self._timer.init(mode=Timer.PERIODIC,
-                         callback=self._measure,
+                         callback=self._on_timer,
                          period=settings.ADC_MEASURING_PERIOD)
-        self._climate_controller = get_climate_controller()
 
     @property
     def acc_voltage(self):
         return self._measured_values.get(self.ACC_VOLTAGE_INDEX, 0) * self.ADC_VOLTAGE_CONVERSION_CONSTANT
 
-    def _measure(self, _):
+    def _on_timer(self, _):
+        self._executor.submit(self._measure_token)
+
+    def _measure(self):
         for i in range(4):
             self._measured_values[i] = self._adc.raw_to_v(self._adc.read(channel1=i))
         self._climate_controller.acc_voltage = self.acc_voltage
@@ -107,11 +121,23 @@ class SunSensor(Observer):
     def __init__(self):
         self._pin = Pin(settings.PINS.SUN_SENSOR_PIN)
         self._sun_state = SUN_SENSOR_STATUS.OFF
-        self._pin.irq(trigger=Pin.IRQ_FALLING, handler=self._handle_sensor_update)
         self._climate_controller = get_climate_controller()
+        self._executor = get_command_executor()
+        self._update_token = self._update_sun_state
+        self._retry_timer = Timer()
+        self._pin.irq(trigger=Pin.IRQ_FALLING, handler=self._handle_sensor_update)
 
     def _handle_sensor_update(self, pin):
         self._sun_state = SUN_SENSOR_STATUS.ON if pin == 1 else SUN_SENSOR_STATUS.OFF
+        self._submit_update()
+
+    def _submit_update(self, _=None):
+        if not self._executor.submit(self._update_token):
+            # executor queue full: the edge is not repeated, submit again shortly
+            self._retry_timer.init(period=settings.EXECUTOR_RETRY_MS, mode=Timer.ONE_SHOT,
+                                   callback=self._submit_update)
+
+    def _update_sun_state(self):
         if self._climate_controller.auto == AC_COOL_MODE_AUTO.ON:
             self._climate_controller.sun_sensor = self._sun_state
             self._climate_controller.send_update()
@@ -0,0 +1,104 @@
+from time import ticks_us, ticks_diff
+
+import uasyncio
+from machine import disable_irq, enable_irq
+
+import settings
+
+NO_ARG = None  # tokens without an argument are called without one
+
+
+class CommandExecutor:
+    """Runs commands and controller updates in an asyncio task instead of the interrupt that asked for them.
+
+    Timer and pin callbacks only `submit` a token (callable + argument) into a fixed-size ring and
+    return; `run` executes the tokens in order, so the PWM writes, relay switching, prints and UART/CAN
+    queueing triggered by controller notifications never happen inside an interrupt. A token equal
+    to one already waiting is not queued twice (a periodic timer that fires while the loop is busy
+    does not pile up), so callers pass the same bound method object every time. When the ring is
+    full the new token is dropped and `submit` returns False: a periodic timer submits again on its
+    next tick, a one-shot or edge-triggered callback has to retry (see `settings.EXECUTOR_RETRY_MS`).
+
+    `max_submit_us` is the longest time spent in `submit` (what is left of the ISR) and
+    `max_run_us` the longest token run, i.e. the ISR duration without the executor.
+    """
+
+    def __init__(self, size=settings.EXECUTOR_QUEUE_SIZE):
+        self._fns = [None] * size
+        self._args = [None] * size
+        self._head = 0
+        self._count = 0
+        self._work = uasyncio.ThreadSafeFlag()
+
+        self.executed_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self.max_submit_us = 0
+        self.max_run_us = 0
+
+    @property
+    def stats(self):
+        return {'queued': self._count, 'executed': self.executed_count, 'coalesced': self.coalesced_count,
+                'dropped': self.dropped_count, 'max_submit_us': self.max_submit_us, 'max_run_us': self.max_run_us}
+
+    def submit(self, fn, arg=NO_ARG, coalesce=True):
+        """Queue `fn(arg)` (`fn()` without `arg`). Safe to call from timer and pin callbacks.
+        False if the token was dropped because the ring is full."""
+        start = ticks_us()
+        size = len(self._fns)
+        state = disable_irq()
+        try:
+            for i in range(self._count if coalesce else 0):
+                idx = (self._head + i) % size
+                if self._fns[idx] is fn and self._args[idx] == arg:
+                    self.coalesced_count += 1
+                    return True
+            if self._count == size:
+                self.dropped_count += 1
+                return False
+            idx = (self._head + self._count) % size
+            self._fns[idx] = fn
+            self._args[idx] = arg
+            self._count += 1
+        finally:
+            enable_irq(state)
+        self._work.set()
+        self.max_submit_us = max(self.max_submit_us, ticks_diff(ticks_us(), start))
+        return True
+
+    async def run(self):
+        while True:
+            await self._work.wait()
+            while self._count:
+                state = disable_irq()
+                fn = self._fns[self._head]
+                arg = self._args[self._head]
+                self._fns[self._head] = None
+                self._args[self._head] = None
+                self._head = (self._head + 1) % len(self._fns)
+                self._count -= 1
+                enable_irq(state)
+
+                start = ticks_us()
+                try:
+                    if arg is NO_ARG:
+                        fn()
+                    else:
+                        fn(arg)
+                except Exception as e:
+                    print('[CommandExecutor] {} failed: {}'.format(fn, e))
+                self.max_run_us = max(self.max_run_us, ticks_diff(ticks_us(), start))
+                self.executed_count += 1
+                # give the receive/send tasks a turn between commands
+                await uasyncio.sleep_ms(0)
+
+
+command_executor = None
+
+
+def get_command_executor():
+    global command_executor
+    if command_executor is None:
+        command_executor = CommandExecutor()
+
+    return command_executor
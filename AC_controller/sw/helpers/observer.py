@@ -1,5 +1,10 @@
 
 class Observer:
+    # subject types the observer consumes, None for all
+    TOPICS = None
+    # fields (change mask bits of the subject) the observer consumes, None for all
+    FIELDS = None
+
     def subscribe(self, subject):
         if subject:
             subject.attach(self)
@@ -19,20 +24,46 @@ class Subject:
     def detach(self, observer):
         pass
 
-    def notify(self, subject_type, subject):
+    def notify(self, subject_type, subject, changed=None):
         pass
 
 
 class ControllerNotifier(Subject):
+    """Calls `update` of the attached observers that consume the notified subject type (`TOPICS`).
+
+    The bound `update` methods of every subject type are collected on its first notify and kept until
+    an observer is attached or detached, so a notify only touches the interested observers. A subject
+    that tracks its changes passes a `changed` mask; observers whose `FIELDS` did not change are
+    skipped (counted in `skipped_count`).
+    """
+
     def __init__(self):
         self._observers = []
+        self._updates_by_topic = {}  # subject type -> [observer.update, observer.FIELDS, ...]
+        self.delivered_count = 0
+        self.skipped_count = 0
 
     def attach(self, observer):
         self._observers.append(observer)
+        self._updates_by_topic = {}
 
     def detach(self, observer):
         self._observers.remove(observer)
+        self._updates_by_topic = {}
 
-    def notify(self, subject_type, subject):
-        for observer in self._observers:
-            observer.update(subject_type, subject)
+    def notify(self, subject_type, subject, changed=None):
+        updates = self._updates_by_topic.get(subject_type)
+        if updates is None:
+            updates = []
+            for observer in self._observers:
+                if observer.TOPICS is None or subject_type in observer.TOPICS:
+                    updates.append(observer.update)
+                    updates.append(observer.FIELDS)
+            self._updates_by_topic[subject_type] = updates
+        for idx in range(0, len(updates), 2):
+            fields = updates[idx + 1]
+            if changed is not None and fields is not None and not changed & fields:
+                self.skipped_count += 1
+                continue
+            self.delivered_count += 1
+            updates[idx](subject_type, subject)
@@ -0,0 +1,52 @@
+class ArithmeticSequence:
+    """Read-only sequence start, start + step, ... (up to `stop`, exclusive like `range`) followed by `extras`.
+
+    Only the bounds are kept, so a selector over it holds no list: `[idx]`, `in` and `index` are
+    computed instead of scanned. Iterating (`min`, `max`, `scale`) yields the same values as the
+    equivalent list.
+    """
+
+    def __init__(self, start, stop, step=1, extras=()):
+        self._start = start
+        self._step = step
+        self._count = len(range(start, stop, step))
+        self._extras = tuple(extras)
+
+    def __len__(self):
+        return self._count + len(self._extras)
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if 0 <= idx < self._count:
+            return self._start + idx * self._step
+        if self._count <= idx < len(self):
+            return self._extras[idx - self._count]
+        raise IndexError(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __contains__(self, value):
+        return self._find(value) >= 0
+
+    def index(self, value):
+        idx = self._find(value)
+        if idx < 0:
+            raise ValueError(value)
+        return idx
+
+    def _find(self, value):
+        offset = value - self._start
+        idx = offset // self._step
+        if 0 <= idx < self._count and idx * self._step == offset:
+            return int(idx)
+        for i in range(len(self._extras)):
+            if self._extras[i] == value:
+                return self._count + i
+        return -1
+
+    def __repr__(self):
+        return 'ArithmeticSequence({}, {}, {}, extras={})'.format(
+            self._start, self._start + self._count * self._step, self._step, self._extras)
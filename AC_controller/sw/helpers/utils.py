@@ -13,6 +13,9 @@ state_to_fan_dir_map = {
 
 fan_dir_to_state_map = {v: k for k, v in state_to_fan_dir_map.items()}
 
+AC_TEMP_MIN = min(AC_TEMP_RANGE)
+AC_TEMP_MAX = max(AC_TEMP_RANGE)
+
 
 def pack_fan_dir(up, middle, down):
     dir_state = [up, middle, down]
@@ -25,6 +28,15 @@ def unpack_fan_dir(state):
     return [int(x) for x in '{0:03b}'.format(resulted_state)]
 
 
+def linear_scaler(old_range, new_range):
+    """`scale` with the range bounds computed once: returns f(old_value) -> new value"""
+    old_min = min(old_range)
+    old_span = max(old_range) - old_min
+    new_min = min(new_range)
+    new_span = max(new_range) - new_min
+    return lambda old_value: int(((old_value - old_min) * new_span / old_span) + new_min)
+
+
 def scale(old_range, new_range, old_value):
     return int(((old_value - min(old_range)) * (max(new_range) - min(new_range)) /
                 (max(old_range) - min(old_range))) + min(new_range))
@@ -61,7 +73,7 @@ def convert_gui_temp(value):
 def get_corrected_temp(desired_temp, actual_temp):
     temp_delta = desired_temp - actual_temp
     if temp_delta > 0:
-        return min(desired_temp + temp_delta, max(AC_TEMP_RANGE))
+        return min(desired_temp + temp_delta, AC_TEMP_MAX)
     else:
-        return max(desired_temp + temp_delta, min(AC_TEMP_RANGE))
+        return max(desired_temp + temp_delta, AC_TEMP_MIN)
 
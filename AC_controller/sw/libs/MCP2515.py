@@ -1,9 +1,9 @@
 
 from collections import namedtuple
-from struct import unpack_from, pack_into
-from time import sleep, sleep_ms
+from time import sleep, sleep_ms, ticks_ms, ticks_us, ticks_diff
 from micropython import const
-from machine import SPI, Pin
+import uasyncio
+from machine import SPI, Pin, disable_irq, enable_irq
 from libs.myTimer import Timer
 from libs.canio import *
 
@@ -26,6 +26,7 @@ _LOAD_TX1 = const(0x42)
 _LOAD_TX2 = const(0x44)
 
 _READ_STATUS = const(0xA0)
+_RX_STATUS = const(0xB0)
 
 _SEND_TX0 = const(0x81)
 _SEND_TX1 = const(0x82)
@@ -63,6 +64,7 @@ _RXB1SIDH = const(0x71)
 _TX0IF = const(0x04)
 _TX1IF = const(0x08)
 _TX2IF = const(0x10)
+_TXIF_MASK = const(_TX0IF | _TX1IF | _TX2IF)
 
 # Filters & Masks
 _RXM0SIDH = const(0x20)
@@ -76,15 +78,25 @@ _RXF3SIDH = const(0x10)
 _RXF4SIDH = const(0x14)
 _RXF5SIDH = const(0x18)
 FILTERS = [[_RXF0SIDH, _RXF1SIDH], [_RXF2SIDH, _RXF3SIDH, _RXF4SIDH, _RXF5SIDH]]
+# index of the first filter of each mask's bank in the flat RXF0-RXF5 numbering
+FILTER_BANK_OFFSETS = [0, 2]
+# Filter/mask registers are three runs of consecutive addresses: RXF0-RXF2, RXF3-RXF5, RXM0-RXM1.
+# FilterConfig keeps them in this order in one 32 byte image and writes each run with one burst.
+_ACCEPTANCE_BLOCKS = ((_RXF0SIDH, 0, 12), (_RXF3SIDH, 12, 12), (_RXM0SIDH, 24, 8))
+_ACCEPTANCE_IMAGE_SIZE = const(32)
+_MASKS_IMAGE_OFFSET = const(24)
 # bits/flags
 _RX0IF = const(0x01)
 _RX1IF = const(0x02)
+_ERRIF = const(0x20)
 _WAKIF = const(0x40)
 # _MERRF = const(0x80)
 
 # Standard/Extended ID Buffers, Masks, Flags
 _TXB_EXIDE_M_16 = const(0x08)
 _TXB_TXREQ_M = const(0x08)  # TX request/completion bit
+_TXB_TXP_MASK = const(0x03)  # TX buffer priority, 3 is the highest
+_CANCTRL_ABAT = const(0x10)  # abort all pending transmissions
 
 EXTID_TOP_11_WRITE_MASK = 0x1FFC0000
 EXTID_TOP_11_READ_MASK = 0xFFE00000
@@ -107,6 +119,12 @@ _RXB_RX_STDEXT = const(0x00)
 _STAT_RXIF_MASK = const(0x03)
 _RTR_MASK = const(0x40)
 
+# RX STATUS: which RX buffers hold a message and the filter that accepted it
+_RX_STATUS_RXB0 = const(0x40)
+_RX_STATUS_RXB1 = const(0x80)
+_RX_STATUS_FILTER_MASK = const(0x07)  # 0-5: RXF0-RXF5, 6/7: RXF0/RXF1 rolled over into RXB1
+NO_FILTER_HIT = const(0xFF)
+
 _STAT_TXIF_MASK = const(0xA8)
 _STAT_TX0_PENDING = const(0x04)
 _STAT_TX1_PENDING = const(0x10)
@@ -121,10 +139,36 @@ _TEC = const(0x1C)
 _REC = const(0x1D)
 # REC: RECEIVE ERROR COUNTER REGISTER (ADDRESS: 1Dh)
 _EFLG = const(0x2D)
+_EFLG_RX0OVR = const(0x40)
+_EFLG_RX1OVR = const(0x80)
 
 ############ Misc Consts #########
 _SEND_TIMEOUT_MS = const(5)  # 500ms
 _MAX_CAN_MSG_LEN = 8  # ?!
+# raw RX frame as clocked in during READ RX: <byte shifted in with the command>, SIDH, SIDL, EID8,
+# EID0, DLC, D0..D7. Keeping the first byte lets the whole read be one write_readinto into a slot;
+# it is then overwritten with the index of the filter that accepted the frame (or NO_FILTER_HIT).
+_RX_FRAME_SIZE = const(14)
+# TX frame: command or TXBnCTRL value, SIDH, SIDL, EID8, EID0, DLC, D0..D7
+_TX_FRAME_SIZE = const(14)
+_TX_HEADER_SIZE = const(6)
+# WRITE command and TXBnCTRL address in front of the TX frame
+_TX_WRITE_PREFIX = const(2)
+# WRITE command, address and up to 12 registers (all filters of one bank)
+_WRITE_BURST_SIZE = const(14)
+_TX_BUFFERS_COUNT = const(3)
+
+# SPI transaction counters
+SPI_OP_RESET = const(0)
+SPI_OP_READ = const(1)
+SPI_OP_READ_STATUS = const(2)
+SPI_OP_WRITE = const(3)
+SPI_OP_BIT_MODIFY = const(4)
+SPI_OP_READ_RX = const(5)
+SPI_OP_RTS = const(6)
+SPI_OP_RX_STATUS = const(7)
+SPI_OP_NAMES = ("reset", "read", "read_status", "write", "bit_modify", "read_rx", "rts", "rx_status")
+_RX_RING_SIZE = const(16)
 # perhaps this will be stateful later?
 TransmitBuffer = namedtuple(
     "TransmitBuffer",
@@ -138,7 +182,7 @@ ReceiveBuffer = namedtuple(
 )
 
 # This is magic, don't disturb the dragon
-# expects a 16Mhz crystal
+# expects a 16Mhz crystal, only used without `crystal_freq` (see calc_bit_timing)
 _BAUD_RATES = {
     # CNF1, CNF2, CNF3
     1000000: (0x00, 0xD0, 0x82),
@@ -163,19 +207,371 @@ _BAUD_RATES = {
     47619: (0x06, 0x9b, 0x02)
 }
 
+# bit timing limits, in time quanta (TQ = 2 * (BRP + 1) / crystal)
+_CNF2_BTLMODE = const(0x80)  # PS2 length taken from CNF3
+_MAX_BRP = const(63)
+_MIN_SEG = const(1)
+_MAX_SEG = const(8)
+_MIN_PS2 = const(2)
+_MIN_TQ_PER_BIT = const(5)
+_MAX_TQ_PER_BIT = const(25)
+_MAX_SJW = const(4)
+BAUD_RATE_TOLERANCE = 0.005
+
+
+def calc_bit_timing(baudrate, crystal_freq, sample_point=0.75, sjw=1):
+    """Compute the CNF1, CNF2, CNF3 register values for a bit rate.
+
+    Searches every prescaler/bit length combination and keeps the one closest to `baudrate`, then
+    to `sample_point`, preferring longer bits (more time quanta to place the sample point). The bit
+    is split into sync (1 TQ), propagation, phase 1 and phase 2 segments with phase 2 >= SJW and
+    propagation + phase 1 >= phase 2.
+
+    Raises:
+        ValueError: if no timing is within `BAUD_RATE_TOLERANCE` of `baudrate`
+    """
+    if not 1 <= sjw <= _MAX_SJW:
+        raise ValueError("SJW must be 1-{}".format(_MAX_SJW))
+
+    best = None
+    for brp in range(_MAX_BRP + 1):
+        tq_per_bit = round(crystal_freq / (2 * (brp + 1) * baudrate))
+        if not _MIN_TQ_PER_BIT <= tq_per_bit <= _MAX_TQ_PER_BIT:
+            continue
+        rate_error = abs(crystal_freq / (2 * (brp + 1) * tq_per_bit) - baudrate) / baudrate
+        if rate_error > BAUD_RATE_TOLERANCE:
+            continue
+
+        ps2 = tq_per_bit - round(sample_point * tq_per_bit)
+        ps2 = max(ps2, _MIN_PS2, sjw)
+        tseg1 = tq_per_bit - 1 - ps2  # propagation + phase 1
+        if ps2 > _MAX_SEG or tseg1 < ps2 or tseg1 > 2 * _MAX_SEG:
+            continue
+        sample_error = abs((tq_per_bit - ps2) / tq_per_bit - sample_point)
+
+        cost = (rate_error, sample_error, -tq_per_bit)
+        if best is None or cost < best[0]:
+            best = (cost, brp, tseg1, ps2)
+
+    if best is None:
+        raise ValueError("No bit timing for {} bps with a {} Hz crystal".format(baudrate, crystal_freq))
+
+    _, brp, tseg1, ps2 = best
+    prop_seg = min(_MAX_SEG, max(_MIN_SEG, tseg1 // 2))
+    ps1 = tseg1 - prop_seg
+    if ps1 > _MAX_SEG:
+        prop_seg, ps1 = tseg1 - _MAX_SEG, _MAX_SEG
+
+    cnf1 = ((sjw - 1) << 6) | brp
+    cnf2 = _CNF2_BTLMODE | ((ps1 - 1) << 3) | (prop_seg - 1)
+    cnf3 = ps2 - 1
+    return cnf1, cnf2, cnf3
+
+
+class FrameRing:
+    """Fixed-size ring of raw RX frames.
+
+    Frames are written by `MCP2515._service_interrupts`, which runs from the pin IRQ, from the task
+    side when INT stayed low (`wait_for_messages`/`wait_for_tx_complete`) and from
+    `SharedSPI.run_deferred` at the end of another transaction - so a drain can start while another
+    one is between `write_slot` and `commit`. `write_slot` therefore reserves the slot (moves
+    `_reserved`), and `_head`, which the reader sees, only moves once every reserved slot is
+    committed, so the reader never gets a slot that is still being filled and no two writers share
+    one. The asyncio side is the only reader (moves `_tail`). Indexes run modulo twice the size to
+    tell a full ring from an empty one. Nothing is allocated after construction.
+    """
+
+    def __init__(self, size=_RX_RING_SIZE):
+        self._size = size
+        self._buffer = bytearray(size * _RX_FRAME_SIZE)
+        buffer_view = memoryview(self._buffer)
+        self._slots = [buffer_view[i * _RX_FRAME_SIZE:(i + 1) * _RX_FRAME_SIZE] for i in range(size)]
+        # frames that do not fit are still clocked out of the chip (to release the RX buffer) into here
+        self._discard_slot = bytearray(_RX_FRAME_SIZE)
+        self._head = 0
+        self._reserved = 0
+        self._writing = 0  # reserved slots not committed yet
+        self._tail = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return (self._head - self._tail) % (2 * self._size)
+
+    @property
+    def size(self):
+        return self._size
+
+    def write_slot(self):
+        """Reserve the slot the next frame should be read into and return it. Returns the discard
+        slot if the ring is full. Every returned slot must be passed to `commit`"""
+        state = disable_irq()
+        if (self._reserved - self._tail) % (2 * self._size) == self._size:
+            enable_irq(state)
+            return self._discard_slot
+        slot = self._slots[self._reserved % self._size]
+        self._reserved = (self._reserved + 1) % (2 * self._size)
+        self._writing += 1
+        enable_irq(state)
+        return slot
+
+    def commit(self, slot):
+        """Publish the frame read into `slot`, together with the frames of nested writers"""
+        if slot is self._discard_slot:
+            self.dropped += 1
+            return
+        state = disable_irq()
+        self._writing -= 1
+        if not self._writing:
+            self._head = self._reserved
+        enable_irq(state)
+
+    def read_slot(self):
+        """Oldest unread frame or None"""
+        if self._head == self._tail:
+            return None
+        return self._slots[self._tail % self._size]
+
+    def release(self):
+        """Free the slot returned by `read_slot`"""
+        if self._head != self._tail:
+            self._tail = (self._tail + 1) % (2 * self._size)
+
+    def clear(self):
+        self._tail = self._head
+
+
+class SharedSPI:
+    """An SPI peripheral and the state of the transaction running on it.
+
+    Several MCP2515s (separate CS pins) can share one SPI: while any of them has its CS low `busy`
+    is set. An interrupt handler that finds the bus busy defers its work with `defer`; deferred
+    callbacks are run as soon as the transaction ends.
+    """
+
+    def __init__(self, spi):
+        self.spi = spi
+        self.busy = False
+        self._deferred = []
+
+    def defer(self, callback):
+        if callback not in self._deferred:
+            self._deferred.append(callback)
+
+    def run_deferred(self):
+        while self._deferred:
+            self._deferred.pop(0)()
+
+
+class SPITransport:
+    """MCP2515 SPI instructions on preallocated command buffers.
+
+    Every instruction is a single CS-low transaction done with one `write`/`write_readinto` call,
+    so no `bytes` objects are built per call. Transactions are counted per instruction, see
+    `transaction_counts`.
+
+    While a transaction is running `busy` is set on the `SharedSPI`, see `SharedSPI.defer`.
+    """
+
+    def __init__(self, shared_spi, cs):
+        self._shared_spi = shared_spi
+        self._spi = shared_spi.spi
+        self._cs = cs
+        self._counts = [0] * len(SPI_OP_NAMES)
+
+        self._command = bytearray(1)
+        self._status_tx = bytearray((_READ_STATUS, 0))
+        self._status_rx = bytearray(2)
+        self._rx_status_tx = bytearray((_RX_STATUS, 0))
+        self._register_tx = bytearray((_READ, 0, 0))
+        self._register_rx = bytearray(3)
+        self._bit_modify = bytearray((_BITMOD, 0, 0, 0))
+        self._rx_tx = bytearray(_RX_FRAME_SIZE)
+
+        self._burst = bytearray(_WRITE_BURST_SIZE)
+        self._burst[0] = _WRITE
+        burst_view = memoryview(self._burst)
+        self._burst_views = [burst_view[:length] for length in range(_WRITE_BURST_SIZE + 1)]
+
+        # `tx_frame` is a view into `_tx_write` behind the WRITE prefix, so the frame goes out as one
+        # WRITE from TXBnCTRL (priority + header + data)
+        self._tx_write = bytearray(_TX_WRITE_PREFIX + _TX_FRAME_SIZE)
+        self._tx_write[0] = _WRITE
+        tx_write_view = memoryview(self._tx_write)
+        self.tx_frame = tx_write_view[_TX_WRITE_PREFIX:]
+        self._tx_write_views = [tx_write_view[:_TX_WRITE_PREFIX + _TX_HEADER_SIZE + length]
+                                for length in range(_MAX_CAN_MSG_LEN + 1)]
+        # what each TX buffer holds since its last WRITE (TX buffers keep their frame after sending)
+        self._tx_loaded = [bytearray(_TX_WRITE_PREFIX + _TX_FRAME_SIZE) for _ in range(_TX_BUFFERS_COUNT)]
+        self._tx_loaded_valid = [False] * _TX_BUFFERS_COUNT
+
+    @property
+    def busy(self):
+        return self._shared_spi.busy
+
+    def defer(self, callback):
+        self._shared_spi.defer(callback)
+
+    def _begin(self, op):
+        self._counts[op] += 1
+        self._shared_spi.busy = True
+        self._cs.off()
+
+    def _end(self):
+        self._cs.on()
+        self._shared_spi.busy = False
+        self._shared_spi.run_deferred()
+
+    @property
+    def transaction_counts(self):
+        """SPI transactions issued per instruction since the last `reset_counts`"""
+        return {name: self._counts[op] for op, name in enumerate(SPI_OP_NAMES)}
+
+    @property
+    def transaction_count(self):
+        return sum(self._counts)
+
+    def reset_counts(self):
+        for op in range(len(self._counts)):
+            self._counts[op] = 0
+
+    def reset(self):
+        self._command[0] = _RESET
+        self._begin(SPI_OP_RESET)
+        self._spi.write(self._command)
+        self._end()
+
+    def read_register(self, register_addr):
+        self._register_tx[1] = register_addr
+        self._begin(SPI_OP_READ)
+        self._spi.write_readinto(self._register_tx, self._register_rx)
+        self._end()
+        return self._register_rx[2]
+
+    def read_status(self):
+        self._begin(SPI_OP_READ_STATUS)
+        self._spi.write_readinto(self._status_tx, self._status_rx)
+        self._end()
+        return self._status_rx[1]
+
+    def rx_status(self):
+        self._begin(SPI_OP_RX_STATUS)
+        self._spi.write_readinto(self._rx_status_tx, self._status_rx)
+        self._end()
+        return self._status_rx[1]
+
+    def write_register(self, register_addr, value):
+        self._burst[1] = register_addr
+        self._burst[2] = value
+        self._begin(SPI_OP_WRITE)
+        self._spi.write(self._burst_views[3])
+        self._end()
+
+    def write_registers(self, register_addr, values):
+        """Burst write `values` into consecutive registers starting at `register_addr`"""
+        burst = self._burst
+        burst[1] = register_addr
+        for i in range(len(values)):
+            burst[2 + i] = values[i]
+        self._begin(SPI_OP_WRITE)
+        self._spi.write(self._burst_views[2 + len(values)])
+        self._end()
+
+    def modify_register(self, register_addr, mask, value):
+        self._bit_modify[1] = register_addr
+        self._bit_modify[2] = mask
+        self._bit_modify[3] = value
+        self._begin(SPI_OP_BIT_MODIFY)
+        self._spi.write(self._bit_modify)
+        self._end()
+
+    def read_rx(self, read_command, frame):
+        """READ RX into a `_RX_FRAME_SIZE` byte `frame`. Clears the matching RXnIF"""
+        self._rx_tx[0] = read_command
+        self._begin(SPI_OP_READ_RX)
+        self._spi.write_readinto(self._rx_tx, frame)
+        self._end()
+
+    def request_to_send(self, send_command):
+        self._command[0] = send_command
+        self._begin(SPI_OP_RTS)
+        self._spi.write(self._command)
+        self._end()
+
+    def write_tx(self, ctrl_register, ctrl, length):
+        """WRITE `ctrl` (the TXP priority bits) into TXBnCTRL followed by the header and `length` data
+        bytes of `tx_frame`, in a single transaction"""
+        self._tx_write[1] = ctrl_register
+        self.tx_frame[0] = ctrl
+        self._begin(SPI_OP_WRITE)
+        self._spi.write(self._tx_write_views[length])
+        self._end()
+
+    def write_and_send(self, buffer_index, ctrl_register, ctrl, send_command, length):
+        """Load `tx_frame` into a TX buffer and request to send it.
+
+        RTS is an instruction of its own, so loading and sending take two transactions (WRITE, RTS).
+        When the buffer still holds this very frame (periodic frames with unchanged data) the WRITE
+        is skipped and the frame is sent with the RTS alone. Data bytes past `length` must be zero.
+        """
+        self._tx_write[1] = ctrl_register
+        self.tx_frame[0] = ctrl
+        loaded = self._tx_loaded[buffer_index]
+        if not self._tx_loaded_valid[buffer_index] or loaded != self._tx_write:
+            self.write_tx(ctrl_register, ctrl, length)
+            loaded[:] = self._tx_write
+            self._tx_loaded_valid[buffer_index] = True
+        self.request_to_send(send_command)
+
+    def forget_tx_buffers(self):
+        """The TX buffer registers were changed behind `write_and_send` (reset, initialization)"""
+        for idx in range(len(self._tx_loaded_valid)):
+            self._tx_loaded_valid[idx] = False
+
+
+class FilterConfig:
+    """Mask and filter values collected for a single config-mode session.
+
+    Get one from `MCP2515.configure_filters` and use it as a context manager: nothing is written
+    while values are set, everything is burst-written on exit, then the controller returns to its
+    previous mode. Unset registers keep their current values.
+    """
+
+    def __init__(self, can, max_blind_ms=None):
+        self._can = can
+        self._max_blind_ms = max_blind_ms
+        self._image = bytearray(can._acceptance_image)
+
+    def set_mask(self, mask_index, mask, extended=False):
+        self._can._load_id_buffer(mask, extended, self._image, _MASKS_IMAGE_OFFSET + mask_index * 4)
+
+    def set_filter(self, filter_index, address, extended=False):
+        """`filter_index` is 0-5: RXF0-RXF1 belong to mask 0, RXF2-RXF5 to mask 1"""
+        self._can._load_id_buffer(address, extended, self._image, filter_index * 4)
+
+    def clear(self):
+        for i in range(_ACCEPTANCE_IMAGE_SIZE):
+            self._image[i] = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, unused2, unused3):
+        if exc_type is None:
+            self._can._apply_filter_config(self._image, self._max_blind_ms)
 
 
 class MCP2515:
     """MCP2515"""
 
     def __init__(self, spi_id, baud, sck, mosi, miso, cs, baudrate, loopback: bool = False,
-                 silent: bool = False, debug: bool = False):
+                 silent: bool = False, debug: bool = False, interrupt_pin=None, rx_ring_size=_RX_RING_SIZE,
+                 rx_pool_size=0, filter_hits=False, crystal_freq=None, sample_point=0.75, spi=None):
         """A common shared-bus protocol.
 
         :param int spiBlock: The SPI bus used to communicate with the MCP2515
         :param int csPin:  SPI bus enable pin
-        :param int baudrate: The bit rate of the bus in Hz, using a 16Mhz crystal. All devices on\
-            the bus must agree on this value. Defaults to 250000.
+        :param int baudrate: The bit rate of the bus in Hz. All devices on the bus must agree on\
+            this value.
         :param bool loopback: Receive only packets sent from this device, and send only to this\
         device. Requires that `silent` is also set to `True`, but only prevents transmission to\
         other devices. Otherwise the send/receive behavior is normal.
@@ -187,6 +583,20 @@ class MCP2515:
         bus-off state. Defaults to `False`.
 
         :param bool debug: If `True`, will enable printing debug information. Defaults to `False`.
+        :param int interrupt_pin: Pin wired to the MCP2515 INT output. When given, received frames are\
+            drained from the chip by the pin IRQ into a fixed-size ring instead of being polled, and\
+            TX buffers are released by their TX-complete interrupts.
+        :param int rx_ring_size: Number of frames the RX ring can hold. Defaults to 16.
+        :param int rx_pool_size: When non-zero, `read_message` returns recycled `canio.Message`\
+            objects from a pool of this size instead of allocating one per frame. A message is only\
+            valid until `rx_pool_size` further messages have been read. Defaults to 0.
+        :param bool filter_hits: Probe pending frames with RX STATUS so the index of the acceptance\
+            filter that matched is known for each frame, see `next_filter_hit`. Defaults to False.
+        :param int crystal_freq: MCP2515 oscillator frequency in Hz. When given the CNF registers\
+            are computed by `calc_bit_timing`, otherwise taken from the `_BAUD_RATES` table.
+        :param float sample_point: Sample point target for `calc_bit_timing`. Defaults to 0.75.
+        :param SharedSPI spi: SPI bus of another MCP2515 (its `shared_spi`) to share instead of\
+            creating one from `spi_id`/`baud`/`sck`/`mosi`/`miso`.
         """
 
         if loopback and not silent:
@@ -194,24 +604,42 @@ class MCP2515:
         
         self._debug = debug
 
-        self.spi = SPI(spi_id, baud, sck=Pin(sck), mosi=Pin(mosi), miso=Pin(miso))
-        self.spi.init()
+        if spi is None:
+            self.spi = SPI(spi_id, baud, sck=Pin(sck), mosi=Pin(mosi), miso=Pin(miso))
+            self.spi.init()
+            spi = SharedSPI(self.spi)
+        else:
+            self.spi = spi.spi
+        self._shared_spi = spi
         
         self.cs = Pin(cs, Pin.OUT)
         self.cs.on()
 
-        self._buffer = bytearray(20)
+        self._transport = SPITransport(spi, self.cs)
         self._id_buffer = bytearray(4)
-        self._unread_message_queue = []
+        self._rx_ring = FrameRing(rx_ring_size)
+        self._rx_pool = MessagePool(rx_pool_size) if rx_pool_size else None
+        self._rx_flag = uasyncio.ThreadSafeFlag()
+        self._rx_overflow_count = 0
+        self._filter_hits = filter_hits
+        self._interrupt_pin = None
+        self._tx_interrupts = interrupt_pin is not None
+        self._tx_flag = uasyncio.ThreadSafeFlag()
+        self._tx_busy = [False, False, False]
+        self._tx_abort_count = 0
         self._timer = Timer()
         self._tx_buffers = []
         self._rx0_overflow = False
         self._rx1_overflow = False
         self._masks_in_use = []
         self._filters_in_use = [[], []]
+        self._acceptance_image = bytearray(_ACCEPTANCE_IMAGE_SIZE)
+        self._filter_blind_window_us = 0
         self._mode = None
         self._bus_state = BusState.ERROR_ACTIVE
         self._baudrate = baudrate
+        self._crystal_freq = crystal_freq
+        self._sample_point = sample_point
         self._loopback = loopback
         self._silent = silent
         self._baudrate = baudrate
@@ -219,6 +647,10 @@ class MCP2515:
         self._init_buffers()
         self.initialize()
 
+        if interrupt_pin is not None:
+            self._interrupt_pin = Pin(interrupt_pin, Pin.IN, Pin.PULL_UP)
+            self._interrupt_pin.irq(trigger=Pin.IRQ_FALLING, handler=self._handle_interrupt)
+
     def _init_buffers(self):
 
         self._tx_buffers = [
@@ -248,6 +680,7 @@ class MCP2515:
     def initialize(self):
         """Return the sensor to the default configuration"""
         self._reset()
+        self._transport.forget_tx_buffers()
         # our mode set skips checking for sleep
         self._set_mode(_MODE_CONFIG)
 
@@ -259,11 +692,17 @@ class MCP2515:
             self._set_register(_TXB1CTRL + idx, 0)
             self._set_register(_TXB2CTRL + idx, 0)
 
+        for idx in range(len(self._tx_busy)):
+            self._tx_busy[idx] = False
+
         self._set_register(_RXB0CTRL, 0)
         self._set_register(_RXB1CTRL, 0)
-        # # # interrupt mode
-        # TODO: WHAT IS THIS
-        self._set_register(_CANINTE, _RX0IF | _RX1IF)
+        # INT pin goes low while a frame is waiting in RXB0/RXB1 or an error flag (RX overflow) is set,
+        # and when interrupts are used at all, after every completed transmission
+        interrupts = _RX0IF | _RX1IF | _ERRIF
+        if self._tx_interrupts:
+            interrupts |= _TXIF_MASK
+        self._set_register(_CANINTE, interrupts)
 
         sleep(0.010)
 
@@ -283,22 +722,98 @@ class MCP2515:
 
         self._set_mode(new_mode)
 
-    def send(self, message_obj):
+    def send(self, message_obj, priority=0):
         """Send a message on the bus with the given data and id. If the message could not be sent
          due to a full fifo or a bus error condition, RuntimeError is raised.
 
         Args:
             message (canio.Message): The message to send. Must be a valid `canio.Message`
+            priority (int): TXP priority 0 (lowest) - 3 (highest) among the pending TX buffers
         """
-
-        tx_buff = self._get_tx_buffer()  # info = addr.
-        if tx_buff is None:
+        if self.transmit(message_obj, priority) is None:
             print("No transmit buffer available to send")
             return False
+        return True
 
-        #print("\t\tTX Buffer:", tx_buff)
+    def transmit(self, message_obj, priority=0):
+        """Load the message into a free TX buffer and request its transmission.
 
-        return self._write_message(tx_buff, message_obj)
+        Returns:
+            int: index of the TX buffer used (see `abort_tx`) or None if all three are pending
+        """
+        buffer_index = self._get_tx_buffer_index()
+        if buffer_index is None:
+            return None
+
+        self._tx_busy[buffer_index] = True
+        self._write_message(buffer_index, message_obj, priority)
+        return buffer_index
+
+    @property
+    def tx_buffers_busy(self):
+        """Pending transmission flag per TX buffer (do not modify the returned list)"""
+        self._update_tx_busy()
+        return self._tx_busy
+
+    @property
+    def free_tx_buffer_count(self):
+        """Number of TX buffers without a pending transmission"""
+        return self.tx_buffers_busy.count(False)
+
+    def abort_tx(self, buffer_index):
+        """Abort the pending transmission of one TX buffer by clearing its TXREQ bit.
+
+        Returns:
+            bool: False if the frame was already on the wire, it is then still completed and the
+            buffer stays busy until its TX-complete interrupt
+        """
+        self._mod_register(self._tx_buffers[buffer_index].CTRL_REG, _TXB_TXREQ_M, 0)
+        if self._tx_buffers_in_use[buffer_index]:
+            return False
+        self._release_aborted(1 << buffer_index)
+        return True
+
+    def abort_all_tx(self):
+        """Abort all pending transmissions (ABAT). Frames already on the wire are still completed."""
+        self._mod_register(_CANCTRL, _CANCTRL_ABAT, _CANCTRL_ABAT)
+        txs_busy = self._tx_buffers_in_use
+        self._mod_register(_CANCTRL, _CANCTRL_ABAT, 0)
+        aborted = 0
+        for idx in range(len(txs_busy)):
+            if self._tx_busy[idx] and not txs_busy[idx]:
+                aborted |= 1 << idx
+        self._release_aborted(aborted)
+
+    def _release_aborted(self, buffer_bits):
+        tx_flags = 0
+        for idx, tx_buffer in enumerate(self._tx_buffers):
+            if buffer_bits & (1 << idx):
+                tx_flags |= tx_buffer.INT_FLAG_MASK
+                self._tx_busy[idx] = False
+                self._tx_abort_count += 1
+        if tx_flags:
+            # a frame that completed while being aborted must not release the buffer again later
+            self._mod_register(_CANINTF, tx_flags, 0)
+
+    @property
+    def tx_abort_count(self):
+        """Transmissions aborted by `abort_tx`/`abort_all_tx`"""
+        return self._tx_abort_count
+
+    async def wait_for_tx_buffer(self):
+        """Wait until at least one TX buffer is free"""
+        while self.free_tx_buffer_count == 0:
+            await self.wait_for_tx_complete()
+
+    async def wait_for_tx_complete(self):
+        """Wait until a pending transmission may have completed (polls every ms without interrupts)"""
+        if not self._tx_interrupts:
+            await uasyncio.sleep_ms(1)
+        elif self._interrupt_pin.value() == 0:
+            # INT is still asserted, so the edge was missed: service it from the task instead
+            self._service_interrupts()
+        else:
+            await self._tx_flag.wait()
 
     @property
     def unread_message_count(self):
@@ -307,61 +822,170 @@ class MCP2515:
         Returns:
             int: The unread message count
         """
-        self._read_from_rx_buffers()
+        if self._interrupt_pin is None:
+            self._read_from_rx_buffers()
 
-        return len(self._unread_message_queue)
+        return len(self._rx_ring)
 
-    def read_message(self):
+    def read_message(self, can_id=None):
         """Read the next available message
 
+        Args:
+            can_id (int): standard ID of the message when already known (e.g. from an exact
+                `next_filter_hit`); skips decoding it from the ID registers
+
         Returns:
             `canio.Message`: The next available message or None if one is not available
         """
         if self.unread_message_count == 0:
             return None
 
-        return self._unread_message_queue.pop(0)
+        frame_obj = self._decode_frame(self._rx_ring.read_slot(), can_id)
+        self._rx_ring.release()
+        return frame_obj
+
+    @property
+    def next_filter_hit(self):
+        """Index (0-5, RXF0-RXF5) of the acceptance filter that matched the message `read_message`
+        returns next, or None if unknown (no message, `filter_hits` off or both RX buffers were full)
+        """
+        if len(self._rx_ring) == 0:
+            return None
+        filter_hit = self._rx_ring.read_slot()[0]
+        if filter_hit == NO_FILTER_HIT:
+            return None
+        return filter_hit
+
+    @property
+    def interrupt_mode(self):
+        """True if frames are drained by the INT pin IRQ"""
+        return self._interrupt_pin is not None
 
-    def _read_rx_buffer(self, read_command):
-        for i in range(len(self._buffer)):
-            self._buffer[i] = 0
+    @property
+    def dropped_frame_count(self):
+        """Frames read from the chip but thrown away because the RX ring was full"""
+        return self._rx_ring.dropped
 
-        # read from buffer
-        tmp = bytearray(1)
-        self.cs.off() 
-        self.spi.write_readinto(bytes([read_command]), tmp)
-        self._buffer = bytearray(self.spi.read(15))
-        self.cs.on() 
+    @property
+    def rx_overflow_count(self):
+        """Frames lost inside the chip because both RX buffers were full (RX0OVR/RX1OVR)"""
+        return self._rx_overflow_count
+
+    async def wait_for_messages(self):
+        """Wait until at least one received frame is in the RX ring"""
+        while len(self._rx_ring) == 0:
+            if self._interrupt_pin.value() == 0:
+                # INT is still asserted, so the edge was missed: drain from the task instead
+                self._service_interrupts()
+                continue
+            await self._rx_flag.wait()
+
+    def _handle_interrupt(self, _):
+        if self._transport.busy:
+            # a transaction is in progress (maybe of another MCP2515 on the SPI); drain when it ends
+            self._transport.defer(self._service_interrupts)
+            return
+        self._service_interrupts()
+
+    def _service_interrupts(self):
+        while True:
+            if self._filter_hits and self._read_rx_with_filter_hit():
+                continue
+            flags = self._read_register(_CANINTF)
+            if flags & _ERRIF:
+                self._clear_rx_overflow()
+            if flags & _TXIF_MASK:
+                self._release_tx_buffers(flags & _TXIF_MASK)
+            if not flags & (_RX0IF | _RX1IF):
+                break
+            if flags & _RX0IF:
+                self._read_rx_buffer(_READ_RX0)
+            if flags & _RX1IF:
+                self._read_rx_buffer(_READ_RX1)
+
+        if len(self._rx_ring):
+            self._rx_flag.set()
+
+    def _release_tx_buffers(self, tx_flags):
+        self._mod_register(_CANINTF, tx_flags, 0)
+        for idx, tx_buffer in enumerate(self._tx_buffers):
+            if tx_flags & tx_buffer.INT_FLAG_MASK:
+                self._tx_busy[idx] = False
+        self._tx_flag.set()
+
+    def _clear_rx_overflow(self):
+        bus_flags = self._read_register(_EFLG)
+        if bus_flags & _EFLG_RX0OVR:
+            self._rx_overflow_count += 1
+        if bus_flags & _EFLG_RX1OVR:
+            self._rx_overflow_count += 1
+        if bus_flags & (_EFLG_RX0OVR | _EFLG_RX1OVR):
+            self._mod_register(_EFLG, _EFLG_RX0OVR | _EFLG_RX1OVR, 0)
+        self._mod_register(_CANINTF, _ERRIF, 0)
+
+    def _read_rx_buffer(self, read_command, filter_hit=NO_FILTER_HIT):
+        # READ RX clears the matching RXnIF once CS goes high
+        slot = self._rx_ring.write_slot()
+        self._transport.read_rx(read_command, slot)
+        slot[0] = filter_hit
+        self._rx_ring.commit(slot)
+
+    def _read_rx_with_filter_hit(self):
+        """Read one pending RX buffer tagged with its filter hit. Returns False if none is pending"""
+        status = self._transport.rx_status()
+        pending = status & (_RX_STATUS_RXB0 | _RX_STATUS_RXB1)
+        if not pending:
+            return False
+        if pending == _RX_STATUS_RXB1:
+            filter_hit = status & _RX_STATUS_FILTER_MASK
+            if filter_hit > 5:
+                # rollover from RXB0
+                filter_hit -= 6
+            self._read_rx_buffer(_READ_RX1, filter_hit)
+        elif pending == _RX_STATUS_RXB0:
+            self._read_rx_buffer(_READ_RX0, status & _RX_STATUS_FILTER_MASK)
+        else:
+            # with both buffers full the reported filter is ambiguous; RXB1 is exact next time
+            self._read_rx_buffer(_READ_RX0)
+        return True
 
+    def _decode_frame(self, frame, sender_id=None):
         ######### Unpack IDs/ set Extended #######
-        raw_ids = unpack_from(">I", self._buffer)[0]
-        extended, sender_id = self._unload_ids(raw_ids)
+        # done on the register bytes directly: unpacking a 32-bit int would allocate a long int
+        if sender_id is not None:
+            extended = False
+        else:
+            sidl = frame[2]
+            sender_id = (frame[1] << 3) | (sidl >> 5)
+            extended = (sidl & _TXB_EXIDE_M_16) > 0
+            if extended:
+                sender_id = (sender_id << 18) | ((sidl & 0x03) << 16) | (frame[3] << 8) | frame[4]
         ############# Length/RTR Size #########
-        dlc = self._buffer[4]
+        dlc = frame[5]
         # length is max 8
         message_length = min(8, dlc & 0xF)
 
         if (dlc & _RTR_MASK) > 0:
-            frame_obj = RemoteTransmissionRequest(
+            return RemoteTransmissionRequest(
                 sender_id, message_length, extended=extended
             )
-        else:
-            frame_obj = Message(
-                sender_id,
-                data=bytes(self._buffer[5 : 5 + message_length]),
-                extended=extended,
-            )
-        self._unread_message_queue.append(frame_obj)
+        if self._rx_pool is not None:
+            return self._rx_pool.take(sender_id, extended, frame, 6, message_length)
+        return Message(
+            sender_id,
+            data=bytes(frame[6 : 6 + message_length]),
+            extended=extended,
+        )
 
     def _read_from_rx_buffers(self):
-        """Read the next available message into the given `bytearray`
+        """Move every frame waiting in RXB0/RXB1 into the RX ring"""
+        if self._filter_hits:
+            while self._read_rx_with_filter_hit():
+                pass
+            return
 
-        Args:
-            msg_buffer (bytearray): The buffer to load the message into
-        """
         status = self._read_status()
         #self._dbg("Read Status byte:", "{:#010b}".format(status))
-        # TODO: read and store all available messages
         if status & 0b1:
             self._read_rx_buffer(_READ_RX0)
             self._dbg('\tRead Buffer 0')
@@ -370,10 +994,8 @@ class MCP2515:
             self._read_rx_buffer(_READ_RX1)
             self._dbg('\tRead Buffer 1')
 
-
-
-    def _write_message(self, tx_buffer, message_obj):
-        if tx_buffer is None:
+    def _write_message(self, buffer_index, message_obj, priority=0):
+        if buffer_index is None:
             raise RuntimeError("No transmit buffer available to send")
         if isinstance(message_obj, RemoteTransmissionRequest):
             dlc = message_obj.length
@@ -382,46 +1004,44 @@ class MCP2515:
 
         if dlc > _MAX_CAN_MSG_LEN:
             raise AttributeError("Message/RTR length must be <=%d" % _MAX_CAN_MSG_LEN)
-        load_command = tx_buffer.LOAD_CMD
 
         if isinstance(message_obj, RemoteTransmissionRequest):
             dlc |= _RTR_MASK
 
         # this splits up the id header, dlc (len, rtr status), and message buffer
-        self._load_id_buffer(message_obj.id, message_obj.extended)
-
-        # "load_command"  is the LOAD_TX_BUFFER SPI command  
-        #    here we are using this command to start writing to the TXBnSIDH register onwards 
-        #print("\t\tID Buffer:", self._id_buffer)
-        #print("\t\tdls      :", dlc)
-        self.cs.off() 
-        self.spi.write(bytes([tx_buffer.LOAD_CMD]))
-        self.spi.write(self._id_buffer)                            # write the 4 bytes of the ID: TXBnSIDH, TXBnSIDL, TXBnEID8, TXBnEID0
-        self.spi.write(bytes([dlc]))
-
+        # tx_frame[0] is TXBnCTRL, followed by TXBnSIDH, TXBnSIDL, TXBnEID8, TXBnEID0, TXBnDLC, TXBnD0-7
+        tx_frame = self._transport.tx_frame
+        self._load_id_buffer(message_obj.id, message_obj.extended, tx_frame, 1)
+        tx_frame[5] = dlc
+        length = 0
         if isinstance(message_obj, Message):
-            self.spi.write(message_obj.data)                   # write the data to the registers: TXBnD0-7
-        self.cs.on() 
+            data = message_obj.data
+            length = len(data)
+            for i in range(length):
+                tx_frame[_TX_HEADER_SIZE + i] = data[i]
+        # unused data bytes are zeroed so an unchanged frame compares equal to the loaded one
+        for i in range(length, _MAX_CAN_MSG_LEN):
+            tx_frame[_TX_HEADER_SIZE + i] = 0
+
+        # write priority and frame from TXBnCTRL on (unless the buffer holds it already) and send it
+        tx_buffer = self._tx_buffers[buffer_index]
+        self._transport.write_and_send(buffer_index, tx_buffer.CTRL_REG, priority & _TXB_TXP_MASK,
+                                       tx_buffer.SEND_CMD, length)
 
-        # send the frame based on the current buffers
-        self._start_transmit(tx_buffer)
-        
         return True     # the message was submitted successfully.  There is no guarantee that it was received. 
 
+    @property
+    def shared_spi(self):
+        """The `SharedSPI` of this controller, pass it as `spi` to put another MCP2515 on the same SPI"""
+        return self._shared_spi
 
-    def _start_transmit(self, tx_buffer):
-        # SPI command RTS (Request to send) for the specified transmit buffer
-        self.cs.off() 
-        self.spi.write(bytes([tx_buffer.SEND_CMD]))
-        self.cs.on() 
-
-    def _set_filter_register(self, filter_index, mask, extended):
-        filter_reg_addr = FILTERS[filter_index]
-        self._write_id_to_register(filter_reg_addr, mask, extended)
+    @property
+    def spi_transaction_counts(self):
+        """SPI transactions issued per instruction, see `SPITransport.transaction_counts`"""
+        return self._transport.transaction_counts
 
-    def _set_mask_register(self, mask_index, mask, extended):
-        mask_reg_addr = MASKS[mask_index]
-        self._write_id_to_register(mask_reg_addr, mask, extended)
+    def reset_spi_transaction_counts(self):
+        self._transport.reset_counts()
 
     @staticmethod
     def _unload_ids(raw_ids):
@@ -441,57 +1061,24 @@ class MCP2515:
             sender_id = top_chunk >> (18 + 3)
         return (extended, sender_id)
 
-    def _load_id_buffer(self, can_id, extended=False):
-        self._id_buffer[0] = 0
-        self._id_buffer[1] = 0
-        self._id_buffer[2] = 0
-        self._id_buffer[3] = 0
+    def _load_id_buffer(self, can_id, extended=False, buffer=None, offset=0):
+        """Write the SIDH, SIDL, EID8, EID0 register values of `can_id` into `buffer` at `offset`
+        (`_id_buffer` by default). Built byte by byte: a packed 32-bit value would be a long int."""
+        if buffer is None:
+            buffer = self._id_buffer
 
         if extended:
-            extended_id = can_id
-            # mask off top 11
-            high_11 = extended_id & EXTID_TOP_11_WRITE_MASK
-            # mask off bottom 18
-            low_18 = extended_id & EXTID_BOTTOM_18_MASK
-            # shift up high piece to fill MSBits and make space for extended flag
-            high_11 <<= 3
-            # or 'em together!
-            extended_id_shifted = high_11 | low_18
-            final_id = extended_id_shifted | EXTID_FLAG_MASK
-            # set dat FLAG
-
+            # top 11 bits go to SIDH/SIDL, bottom 18 to SIDL[1:0]/EID8/EID0, plus the EXIDE flag
+            buffer[offset] = (can_id >> 21) & 0xFF
+            buffer[offset + 1] = (((can_id >> 18) & 0x07) << 5) | _TXB_EXIDE_M_16 | ((can_id >> 16) & 0x03)
+            buffer[offset + 2] = (can_id >> 8) & 0xFF
+            buffer[offset + 3] = can_id & 0xFF
         else:
             std_id = can_id & STDID_BOTTOM_11_MASK  # The actual ID?
-            # shift up to fit all 4 bytes
-            final_id = std_id << (16 + 5)
-
-        # top = (final_id & EXTID_TOP_11_READ_MASK) >> 21
-        # flags = (final_id & (0x7 << 18)) >> 18
-        # bottom = final_id & EXTID_BOTTOM_18_MASK
-        # print(
-        #     "final final_id: 0b{top:011b} {flags:03b} {bottom:018b}".format(
-        #         top=top, flags=flags, bottom=bottom
-        #     )
-        # )
-        pack_into(">I", self._id_buffer, 0, final_id)
-
-    def _write_id_to_register(self, register, can_id, extended=False):
-        # load register in to ID buffer
-
-        current_mode = self._mode
-        self._set_mode(_MODE_CONFIG)
-        # set the mask in the ID buffer
-
-        self._load_id_buffer(can_id, extended)
-
-        #tmp = bytearray(2)
-        self.cs.off() 
-        #self.spi.write_readinto(bytes([_WRITE, register]), tmp)
-        self.spi.write(bytes([_WRITE, register]))
-        self.spi.write(self._id_buffer)
-        self.cs.on() 
-
-        self._set_mode(current_mode)
+            buffer[offset] = std_id >> 3
+            buffer[offset + 1] = (std_id & 0x07) << 5
+            buffer[offset + 2] = 0
+            buffer[offset + 3] = 0
 
     @property
     def _tx_buffers_in_use(self):
@@ -507,24 +1094,29 @@ class MCP2515:
             bool(status & _STAT_TX2_PENDING),
         )
 
-    def _get_tx_buffer(self):
-        """Get the address of the next available tx buffer and unset
-        its interrupt bit in _CANINTF"""
-        # check all buffers by looking for match on
+    def _update_tx_busy(self):
+        # with TX interrupts the buffers are released by _service_interrupts, no need to ask the chip
+        if self._tx_interrupts:
+            return
         txs_busy = self._tx_buffers_in_use
-        if all(txs_busy):
+        for idx in range(len(txs_busy)):
+            self._tx_busy[idx] = txs_busy[idx]
+
+    def _get_tx_buffer_index(self):
+        """Get the index of the next available tx buffer"""
+        self._update_tx_busy()
+        if all(self._tx_busy):
             self._dbg("none available!")
             return None
-        buffer_index = txs_busy.index(False)  # => self._tx_buffers
-        tx_buffer = self._tx_buffers[buffer_index]
-
-        self._mod_register(_CANINTF, tx_buffer.INT_FLAG_MASK, 0)
-        return tx_buffer
+        return self._tx_busy.index(False)
 
     def _set_baud_rate(self):
 
         # *******8 set baud rate ***********
-        cnf1, cnf2, cnf3 = _BAUD_RATES[self.baudrate]
+        if self._crystal_freq is None:
+            cnf1, cnf2, cnf3 = _BAUD_RATES[self.baudrate]
+        else:
+            cnf1, cnf2, cnf3 = calc_bit_timing(self.baudrate, self._crystal_freq, self._sample_point)
 
         self._set_register(_CNF1, cnf1)
         self._set_register(_CNF2, cnf2)
@@ -532,9 +1124,7 @@ class MCP2515:
         sleep(0.010)
 
     def _reset(self):
-        self.cs.off() 
-        self.spi.write(bytes([_RESET]))
-        self.cs.on() 
+        self._transport.reset()
         sleep(0.010)
 
     def _set_mode(self, mode):
@@ -542,6 +1132,7 @@ class MCP2515:
         current_mode = stat_reg & _MODE_MASK
 
         if current_mode == mode:
+            self._mode = mode
             return
         self._timer.setTimer(5)
         while not self._timer.expired:
@@ -570,65 +1161,16 @@ class MCP2515:
     def _mod_register(self, register_addr, mask, new_value):
         """There appears to be an interface on the MCP2515 that allows for
         setting a register using a mask"""
-        self._buffer[0] = _BITMOD
-        self._buffer[1] = register_addr
-        self._buffer[2] = mask
-        self._buffer[3] = new_value
-
-        self.cs.off() 
-        self.spi.write(bytes([_BITMOD, register_addr, mask, new_value]))
-        self.cs.on() 
-
+        self._transport.modify_register(register_addr, mask, new_value)
 
     def _read_register(self, regsiter_addr):
-        """
-        self._buffer[0] = _READ
-        self._buffer[1] = regsiter_addr
-
-        self.cs.off() 
-        self.spi.write(bytes([_READ, regsiter_addr]))
-        self._buffer[0] = 0
-        tmp = bytearray(1)
-        self.spi.write_readinto(bytes([0]), tmp)
-        self.cs.on() 
-        self._buffer[0] = tmp[0]
-
-        return self._buffer[0]
-        """
-        self.cs.off() 
-        self.spi.write(bytes([_READ, regsiter_addr]))
-        regVal = self.spi.read(1)
-        self.cs.on()
-
-        return int.from_bytes(regVal, 'big')
-
-
-
+        return self._transport.read_register(regsiter_addr)
 
     def _read_status(self):
-        """
-        self._buffer[0] = _READ_STATUS
-        self.cs.off() 
-        self.spi.write(bytes([_READ_STATUS]))
-        var = self.spi.read(1)
-        self.cs.on() 
-        self._buffer[0] = var[0]
-        return self._buffer[0]
-        """
-        self.cs.off() 
-        self.spi.write(bytes([_READ_STATUS]))
-        regVal = self.spi.read(1)
-        self.cs.on()
-
-        return int.from_bytes(regVal, 'big')
-        
-
+        return self._transport.read_status()
 
     def _set_register(self, regsiter_addr, register_value):
-        self.cs.off()
-        self.spi.write(bytes([_WRITE, regsiter_addr, register_value]))
-        self.cs.on()
-
+        self._transport.write_register(regsiter_addr, register_value)
 
     def _get_bus_status(self):
         """Get the status flags that report the state of the bus"""
@@ -648,7 +1190,8 @@ class MCP2515:
             self._rx0_overflow,
             self._rx1_overflow,
         ) = flags
-        if self._rx0_overflow or self._rx0_overflow:
+        if self._rx0_overflow or self._rx1_overflow:
+            self._rx_overflow_count += self._rx0_overflow + self._rx1_overflow
             self._mod_register(
                 _EFLG, 0xC0, 0
             )  # clear overflow bits now that we've recorded them
@@ -662,7 +1205,7 @@ class MCP2515:
         else:
             self._bus_state = BusState.ERROR_ACTIVE
 
-    def _create_mask(self, match):
+    def _create_mask(self, match, config):
         mask = match.mask
         if mask == 0:
             if match.extended:
@@ -674,13 +1217,13 @@ class MCP2515:
         if masks_used < len(MASKS):
             next_mask_index = masks_used
 
-            self._set_mask_register(next_mask_index, mask, match.extended)
+            config.set_mask(next_mask_index, mask, match.extended)
             self._masks_in_use.append(MASKS[next_mask_index])
             return next_mask_index
 
         raise RuntimeError("No Masks Available")
 
-    def _create_filter(self, match, mask_index):
+    def _create_filter(self, match, mask_index, config):
 
         next_filter_index = len(self._filters_in_use[mask_index])
         if next_filter_index == len(FILTERS[mask_index]):
@@ -688,17 +1231,76 @@ class MCP2515:
 
         filter_register = FILTERS[mask_index][next_filter_index]
 
-        self._write_id_to_register(filter_register, match.address, match.extended)
+        config.set_filter(FILTER_BANK_OFFSETS[mask_index] + next_filter_index, match.address, match.extended)
         self._filters_in_use[mask_index].append(filter_register)
 
-    def deinit_filtering_registers(self):
-        """Clears the Receive Mask and Filter Registers"""
+    def configure_filters(self, max_blind_ms=None):
+        """Start a filter configuration transaction, see `FilterConfig`.
+
+        The controller does not receive while it is in config mode. With `max_blind_ms` set (for
+        reprogramming at runtime) a RuntimeError is raised and the old filters stay in place if
+        config mode cannot be entered within that time; otherwise the mode switch may take up to
+        200 ms while the controller waits for the bus.
+
+        Usage::
+
+            with can.configure_filters(max_blind_ms=5) as config:
+                config.set_mask(0, 0x7FF)
+                config.set_filter(0, 0x520)
+        """
+        return FilterConfig(self, max_blind_ms)
+
+    @property
+    def filter_blind_window_us(self):
+        """How long the controller was out of normal mode for the last filter configuration"""
+        return self._filter_blind_window_us
+
+    def _apply_filter_config(self, image, max_blind_ms=None):
+        current_mode = self._mode if self._mode is not None else _MODE_NORMAL
+        start = ticks_us()
+        if max_blind_ms is None:
+            self._set_mode(_MODE_CONFIG)
+        elif not self._request_mode_within(_MODE_CONFIG, max_blind_ms):
+            self._mod_register(_CANCTRL, _MODE_MASK, current_mode)
+            raise RuntimeError("Config mode not reached within {} ms".format(max_blind_ms))
+
+        image_view = memoryview(image)
+        for register, offset, length in _ACCEPTANCE_BLOCKS:
+            self._transport.write_registers(register, image_view[offset:offset + length])
+
+        self._set_mode(current_mode)
+        self._filter_blind_window_us = ticks_diff(ticks_us(), start)
+        self._acceptance_image[:] = image
+
+    def _request_mode_within(self, mode, timeout_ms):
+        start = ticks_ms()
+        while ticks_diff(ticks_ms(), start) < timeout_ms:
+            self._mod_register(_CANCTRL, _MODE_MASK, mode)
+            if (self._read_register(_CANSTAT) & _MODE_MASK) == mode:
+                self._mode = mode
+                return True
+        return False
+
+    def program_filters(self, masks, filters, extended=False):
+        """Write both masks and all six filters in a single config-mode session.
 
-        for mask_index, mask_reg in enumerate(MASKS):
-            self._set_register(mask_reg, 0)
+        Args:
+            masks (Sequence[int]): [RXM0, RXM1]
+            filters (Sequence[Sequence[int]]): [[RXF0, RXF1], [RXF2, RXF3, RXF4, RXF5]]
+            extended (bool): True if the values are extended IDs
+        """
+        with self.configure_filters() as config:
+            for mask_index, mask in enumerate(masks):
+                config.set_mask(mask_index, mask, extended)
+                for filter_index, filter_value in enumerate(filters[mask_index]):
+                    config.set_filter(FILTER_BANK_OFFSETS[mask_index] + filter_index, filter_value, extended)
+        self._masks_in_use = list(MASKS)
+        self._filters_in_use = [list(bank) for bank in FILTERS]
 
-            for filter_reg in FILTERS[mask_index]:
-                self._set_register(filter_reg, 0)
+    def deinit_filtering_registers(self):
+        """Clears the Receive Mask and Filter Registers"""
+        with self.configure_filters() as config:
+            config.clear()
         self._masks_in_use = []
         self._filters_in_use = [[], []]
 
@@ -754,8 +1356,14 @@ class MCP2515:
         return self._silent
 
     def restart(self):
-        """If the device is in the bus off state, restart it."""
+        """If the device is in the bus off state, restart it.
+
+        The controller is reset and reinitialized; the last programmed masks/filters are written
+        back and the RX/TX interrupts are enabled again.
+        """
         self.initialize()
+        if any(self._acceptance_image):
+            self._apply_filter_config(bytearray(self._acceptance_image))
 
     def listen(self, matches=None, *, timeout: float = 10):
         """Start receiving messages that match any one of the filters.
@@ -791,19 +1399,23 @@ class MCP2515:
                 `silent`==`True` and `loopback` == `False`"
             )
 
-        for match in matches:
-            self._dbg("match:", match)
-            mask_index_used = self._create_mask(match)
-            self._create_filter(match, mask_index=mask_index_used)
-
-        used_masks = len(self._masks_in_use)
-        # if matches were made and there are unused masks
-        # set the unused masks to prevent them from leaking packets
-        if len(matches) > 0 and used_masks < len(MASKS):
-            next_mask_index = used_masks
-            for idx in range(next_mask_index, len(MASKS)):
-                #print("using unused mask index:", idx)
-                self._create_mask(matches[-1])
+        if not matches:
+            return Listener(self, timeout)
+
+        # all masks and filters are written in one config-mode session when the block exits
+        with self.configure_filters() as config:
+            for match in matches:
+                self._dbg("match:", match)
+                mask_index_used = self._create_mask(match, config)
+                self._create_filter(match, mask_index_used, config)
+
+            used_masks = len(self._masks_in_use)
+            # if there are unused masks set them to prevent them from leaking packets
+            if used_masks < len(MASKS):
+                next_mask_index = used_masks
+                for idx in range(next_mask_index, len(MASKS)):
+                    #print("using unused mask index:", idx)
+                    self._create_mask(matches[-1], config)
 
         return Listener(self, timeout)
 
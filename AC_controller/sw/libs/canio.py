@@ -8,7 +8,13 @@ from libs.myTimer import Timer
 
 
 class Message:
-    """A class representing a CANbus data frame"""
+    """A class representing a CANbus data frame
+
+    Messages received with a `MessagePool` (`MCP2515(rx_pool_size=...)`) are recycled: the object and
+    its `data`, a memoryview, are overwritten by the frame read `rx_pool_size` messages later. Handlers
+    that keep the data or the message beyond their call (or print it later) must copy it first, e.g.
+    `bytes(msg.data)`.
+    """
 
     # pylint:disable=too-many-arguments,invalid-name,redefined-builtin
     def __init__(self, id: int, data: bytes, extended=False):
@@ -49,6 +55,49 @@ class Message:
         self._data = bytearray(new_data)
 
 
+class MessagePool:
+    """A fixed set of `Message` objects that are handed out round-robin and refilled in place.
+
+    A message taken from the pool stays valid only until the pool wraps around, so a consumer must
+    be done with it before `size` more messages are taken. `data` of a pooled message is a
+    memoryview of the right length over a preallocated 8 byte buffer, so it is overwritten in place
+    as well: copy it (`bytes(msg.data)`) to keep it.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._next = 0
+        self._messages = []
+        self._buffers = []
+        self._views = []
+        for _ in range(size):
+            buffer = bytearray(8)
+            buffer_view = memoryview(buffer)
+            message = Message(0, buffer)
+            message._data = buffer_view[:0]
+            self._messages.append(message)
+            self._buffers.append(buffer)
+            # one view per possible length, so handing out a message never slices
+            self._views.append([buffer_view[:length] for length in range(9)])
+
+    @property
+    def size(self):
+        return self._size
+
+    def take(self, id, extended, raw_data, offset, length):
+        """Refill the next message of the pool with `length` bytes of `raw_data` from `offset`"""
+        idx = self._next
+        self._next = (idx + 1) % self._size
+        buffer = self._buffers[idx]
+        for i in range(length):
+            buffer[i] = raw_data[offset + i]
+        message = self._messages[idx]
+        message.id = id
+        message.extended = extended
+        message._data = self._views[idx][length]
+        return message
+
+
 class RemoteTransmissionRequest:
     """A class representing a CANbus remote frame"""
 
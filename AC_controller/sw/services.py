@@ -3,8 +3,9 @@ from machine import Pin, Timer
 import settings
 from controllers.climate_controller import get_climate_controller
 from commands import CANCmdHandlers, INITED_COMMANDS, COMMAND_NAMES
-from constants import CAN_COMMANDS_IDS, UART_TYPES, RELAY_STATUS, AC_STATUS
+from constants import CAN_COMMANDS_IDS, UART_TYPES, CLIMATE_FIELDS, RELAY_STATUS, AC_STATUS
 from devices.relays import BaseRelay
+from helpers.executor import get_command_executor
 from helpers.observer import Observer
 
 from can.can_bus import get_CAN_bus
@@ -14,12 +15,17 @@ class CanStatusReporterService:
     def __init__(self,):
         self._periodic_commands = [CAN_COMMANDS_IDS.ACC_AND_INSIDE_TEMP]
         self._can_bus = get_CAN_bus()
+        self._executor = get_command_executor()
+        self._send_status_token = self._send_status
         self._timer = Timer()
         self._timer.init(mode=Timer.PERIODIC,
                          callback=self._on_timer,
                          period=settings.CAN_STATUS_MESSAGE_SEND_PERIOD)
 
     def _on_timer(self, _):
+        self._executor.submit(self._send_status_token)
+
+    def _send_status(self):
         for commandName in self._periodic_commands:
             command = CANCmdHandlers.get(commandName)
             if command:
@@ -31,10 +37,17 @@ class ShutDownService:
         self._vcc_relay = BaseRelay('VccRelay', settings.PINS.VCC_RELAY_PIN)
         self._timer = Timer()
         self._is_shutting_down = False
+        self._executor = get_command_executor()
+        self._shutdown_token = self._shutdown
+        self._start_shutdown_token = self._start_shutdown
         self._power_supply_pin = Pin(settings.PINS.POWER_SUPPLY_PIN, Pin.IN, Pin.PULL_UP)
         self._power_supply_pin.irq(trigger=Pin.IRQ_RISING, handler=self._handle_power_interrupt)
 
     def shutdown(self, _):
+        if not self._executor.submit(self._shutdown_token):
+            self._timer.init(period=settings.EXECUTOR_RETRY_MS, mode=Timer.ONE_SHOT, callback=self.shutdown)
+
+    def _shutdown(self):
         self._is_shutting_down = False
         self._timer.deinit()
         self._vcc_relay.state = RELAY_STATUS.OFF
@@ -42,13 +55,26 @@ class ShutDownService:
     def _handle_power_interrupt(self, pin):
         if pin.value() == 1 and not self._is_shutting_down:
             self._is_shutting_down = True
-            self._vcc_relay.state = RELAY_STATUS.ON
-            self._timer.init(period=settings.SHUTTING_DOWN_TIMEOUT, mode=Timer.ONE_SHOT, callback=self.shutdown)
+            if not self._executor.submit(self._start_shutdown_token):
+                # executor queue full: no further interrupt comes, check the pin again shortly
+                self._is_shutting_down = False
+                self._timer.init(period=settings.EXECUTOR_RETRY_MS, mode=Timer.ONE_SHOT,
+                                 callback=self._retry_power_interrupt)
+
+    def _retry_power_interrupt(self, _):
+        self._handle_power_interrupt(self._power_supply_pin)
+
+    def _start_shutdown(self):
+        self._vcc_relay.state = RELAY_STATUS.ON
+        self._timer.init(period=settings.SHUTTING_DOWN_TIMEOUT, mode=Timer.ONE_SHOT, callback=self.shutdown)
             # with open('/state.txt', 'w') as f:
             #    f.write('ON')
 
 
 class AccVoltageControlService(Observer):
+    TOPICS = (UART_TYPES.AC,)
+    FIELDS = CLIMATE_FIELDS.ACC_VOLTAGE | CLIMATE_FIELDS.AC_STATUS
+
     def __init__(self):
         self._timer = Timer()
         self._acc_voltage = 0
@@ -1,8 +1,10 @@
-from constants import AC_TEMP, FAN_DIR_SERVO_POSITION
+from constants import AC_TEMP, FAN_DIR_SERVO_POSITION, CAN_COMMANDS_IDS, UART_TYPES
+from helpers.sequence import ArithmeticSequence
 
 DUBUG_MODE = 1  # 0 (off), 1 (on)
 
 UART_COMMAND_DEBOUNCE_TIMEOUT = 100
+UART_COMMAND_UPDATE_TICK = 100  # ms, HU commands within a tick cause one controller update
 CAN_COMMAND_DEBOUNCE_TIMEOUT = 10
 
 
@@ -22,6 +24,8 @@ class PINS:
     CAN_SPI_MOSI_PIN = 11  # RP -> TX
     CAN_SPI_MISO_PIN = 12  # RP -> RX
     CAN_SPI_CS_PIN = 13
+    P_CAN_SPI_CS_PIN = 14  # second MCP2515 (P-bus) on the same SPI
+    P_CAN_INTERRUPT_PIN = 15
 
     AC_COMPRESSOR_RELAY = 16
     AC_REAR_WINDOW_HEAT_RELAY = 17
@@ -59,9 +63,11 @@ ONE_WIRE_MEASURE_PERIOD = 1000  # ms
 CAN_STATUS_MESSAGE_SEND_PERIOD = 1000  # ms
 SHUTTING_DOWN_TIMEOUT = 2000
 ADC_MEASURING_PERIOD = 5000
+EXECUTOR_QUEUE_SIZE = 16  # commands and updates waiting to run outside of interrupts
+EXECUTOR_RETRY_MS = 10  # one-shot and pin callbacks submit again after this if the executor queue was full
 AC_AUTO_MODE_PERIOD = 30000  # 30 sec
 
-EXT_TEMP_RANGE = [x for x in range(-39, 80)]  # [-39, ... 79]
+EXT_TEMP_RANGE = ArithmeticSequence(-39, 80)  # [-39, ... 79]
 
 AC_LOWEST_TEMP = 16.5
 AC_HIGHEST_TEMP = 31
@@ -79,7 +85,7 @@ FAN_DIR_DOWN_MIDDLE_DUTIES = {FAN_DIR_SERVO_POSITION.LEFT: 1600,
                               FAN_DIR_SERVO_POSITION.MIDDLE:  4320,
                               FAN_DIR_SERVO_POSITION.RIGHT: 7040}
 
-AC_TEMP_RANGE = [x for x in range(0, 29)] + [AC_TEMP.AC_TEMP_HI]  # will be converted to [LO, 17.0, 17.5, ... 30.5, HI]
+AC_TEMP_RANGE = ArithmeticSequence(0, 29, extras=(AC_TEMP.AC_TEMP_HI,))  # [0, ... 28, HI] will be converted to [LO, 17.0, 17.5, ... 30.5, HI]
 #res = max(AC_LOWEST_TEMP, min(AC_HIGHEST_TEMP, AC_LOWEST_TEMP + (temp-1) * 0.5))
 AC_TEMP_DUTIES_RANGE = [1600, 7040]
 
@@ -100,16 +106,62 @@ class UART:
     ID = 0
     BAUDRATE = 38400
     RESPONSE_TIMEOUT = 0.2
+    RX_CHUNK_SIZE = 64  # bytes read from the UART at once
+    MAX_PAYLOAD = 32  # longer frames are treated as garbage by the parser
+    HEARTBEAT_MS = 2000  # an unchanged frame is not sent again until this long after the last send
+    TX_BUFFER_SIZE = 256  # UART driver TX ring buffer, a write only waits for the wire when it is full
+    TX_PRIORITIES = {UART_TYPES.R_PARK: 1, UART_TYPES.F_PARK: 1}  # higher is sent first, 0 by default
+    # frame type: (min interval, max interval) ms between frames. Other types: (0, HEARTBEAT_MS)
+    STREAM_LIMITS = {
+        UART_TYPES.R_PARK: (50, 1000),
+        UART_TYPES.F_PARK: (50, 1000),
+        UART_TYPES.AC: (100, 2000),
+        UART_TYPES.DOOR: (100, 2000),
+    }
+    LINK_BUDGET = 0.6  # share of the link priority 0 frames may use
+    LINK_WINDOW_MS = 250  # link budget and utilisation window
+    LINK_MAX_BACKLOG_US = 10000  # frames are written at most this far ahead of the wire
+    RELIABLE = False  # wait for HU ACKs of sent frames and retransmit frames not acknowledged
+    ACK_WINDOW = 1  # frames sent without an ACK yet, HU ACKs carry no type so they are matched in order
+    ACK_TIMEOUT_MS = 100
+    ACK_MAX_RETRIES = 2  # a frame not acknowledged after so many retransmissions is given up
 
 
 class CAN:
     ID = 1
     SPI_BAUDRATE = 10000000
     BAUDRATE = 47619  # bps
+    CRYSTAL_FREQ = 8000000  # Hz, MCP2515 oscillator. None uses the CNF table in libs/MCP2515.py
+    SAMPLE_POINT = 0.75
     IDS_TO_FILTER = []  # [int(0x368)]
+    AUTO_FILTERS = True  # program MCP2515 masks/filters from commands.CANCmdHandlers if IDS_TO_FILTER is empty
+    USE_INTERRUPT = True  # drain RX buffers from PINS.CAN_INTERRUPT_PIN IRQ instead of polling
+    RX_RING_SIZE = 16  # frames
+    RX_POOL_SIZE = 4  # recycled canio.Message objects (data overwritten 4 frames later), 0 allocates per frame
+    FAST_DISPATCH = True  # pick handlers by MCP2515 filter hit for filters accepting a single ID (AUTO_FILTERS)
+    TX_QUEUE_SIZE = 8  # frames per TX priority
+    TX_DEADLINE_MS = 500  # frames not sent within this time are dropped/aborted
+    TX_PRIORITIES = {  # MCP2515 TXP priority 0 (lowest, default) - 3 (highest) by CAN ID
+        CAN_COMMANDS_IDS.ACC_AND_INSIDE_TEMP: 3,
+        CAN_COMMANDS_IDS.ACC_TO_SID_TEXT_CONTROL: 2,
+        CAN_COMMANDS_IDS.ACC_TO_SID_TEXT: 1,
+    }
+    TX_ORDERED_IDS = (CAN_COMMANDS_IDS.ACC_TO_SID_TEXT,)  # multi-frame IDs, all other IDs keep only the latest frame
+    SUPERVISOR_PERIOD_MS = 250  # TEC/REC/EFLG sampling period
+    RESTART_BACKOFF_MS = 500  # bus-off time before the controller is restarted, doubled per failed restart
+    RESTART_BACKOFF_MAX_MS = 8000
     # 47619 bps I-bus, 500000 bps P-bus
 
 
+class P_CAN(CAN):
+    ENABLED = False  # second MCP2515 on PINS.P_CAN_SPI_CS_PIN/P_CAN_INTERRUPT_PIN
+    BAUDRATE = 500000  # bps
+    RX_RING_SIZE = 32  # frames, engine data comes at a much higher rate than on the I-bus
+    FAST_DISPATCH = False
+    TX_PRIORITIES = {}
+    TX_ORDERED_IDS = ()
+
+
 class I2C:
     ID = 1
 
@@ -0,0 +1,29 @@
+"""Run the firmware modules on the host: MicroPython-only modules come from `stubs`, the `time.ticks_*`
+functions are added to the host `time` module and `const` (a compiler builtin there) to the builtins."""
+import builtins
+import os
+import sys
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, 'stubs'))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+_TICKS_PERIOD = 1 << 30
+
+
+def _ticks(scale):
+    return lambda: int(time.monotonic() * scale) % _TICKS_PERIOD
+
+
+def _ticks_diff(end, start):
+    return ((end - start + _TICKS_PERIOD // 2) % _TICKS_PERIOD) - _TICKS_PERIOD // 2
+
+
+time.ticks_ms = _ticks(1000)
+time.ticks_us = _ticks(1000000)
+time.ticks_add = lambda ticks, delta: (ticks + delta) % _TICKS_PERIOD
+time.ticks_diff = _ticks_diff
+time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+builtins.const = lambda value: value
@@ -0,0 +1,58 @@
+"""The controllers, devices and buses boot.py creates, built fresh for a test: the singletons are
+replaced for the test only, the CAN bus runs on the fake MCP2515."""
+from types import SimpleNamespace
+
+import settings
+from can import can_bus
+from commands import ControllerUpdateCoalescer
+from controllers import climate_controller, door_controller, parking_controller
+from devices import sid_text
+from helpers import executor
+from libs.MCP2515 import SharedSPI
+from uart import uart_bus
+
+from fake_mcp2515 import FakeMCP2515, patch_driver
+
+SINGLETONS = (
+    (climate_controller, 'climate_controller'),
+    (climate_controller, 'temp_controller'),
+    (door_controller, 'door_controller'),
+    (parking_controller, 'front_parking_controller'),
+    (parking_controller, 'rear_parking_controller'),
+    (executor, 'command_executor'),
+    (can_bus, 'CAN_bus'),
+    (uart_bus, 'UART_bus'),
+    (sid_text, 'sid_text_device'),
+)
+
+
+def boot_device_set(monkeypatch):
+    """init_controllers, init_CAN, init_UART and init_devices of boot.py, without the loop tasks"""
+    from devices.relays import ACCycleRelay, ACCoolantRelay
+    from devices.pwm_devices import FanDirTemp, FanDirWindow, FanDirDownMiddle, SeatHeatL, SeatHeatR, ACFan
+    from devices.sensors import TempSensors, ADCSensors
+
+    monkeypatch.setattr(settings, 'DUBUG_MODE', 0)
+    monkeypatch.setattr(can_bus, 'DUBUG_MODE', 0)
+    for module, name in SINGLETONS:
+        monkeypatch.setattr(module, name, None)
+    chip = FakeMCP2515()
+    patch_driver(monkeypatch, chip)
+    monkeypatch.setattr(can_bus, 'CAN_bus', can_bus.CanBus(spi=SharedSPI(chip.spi)))
+
+    devices = [device() for device in (ACCycleRelay, ACCoolantRelay, ACFan, FanDirTemp, FanDirWindow,
+                                       FanDirDownMiddle, SeatHeatL, SeatHeatR, TempSensors, ADCSensors)]
+    devices.append(sid_text.get_sid_text_device())
+    return SimpleNamespace(
+        climate=climate_controller.get_climate_controller(),
+        temp=climate_controller.get_temp_controller(),
+        door=door_controller.get_door_controller(),
+        front_parking=parking_controller.get_front_parking_controller(),
+        rear_parking=parking_controller.get_rear_parking_controller(),
+        executor=executor.get_command_executor(),
+        coalescer=ControllerUpdateCoalescer(),
+        can=can_bus.get_CAN_bus(),
+        chip=chip,
+        uart=uart_bus.get_UART_bus(),
+        devices=devices,
+    )
@@ -0,0 +1,231 @@
+"""Register-level MCP2515 stand-in behind a fake SPI and INT pin, for driving `libs.MCP2515` on the host"""
+import machine
+
+from libs import MCP2515 as mcp2515_module
+from libs.MCP2515 import MCP2515, SharedSPI
+
+_READ = 0x03
+_WRITE = 0x02
+_BITMOD = 0x05
+_RESET = 0xC0
+_READ_STATUS = 0xA0
+_RX_STATUS = 0xB0
+_READ_RX = {0x90: 0, 0x94: 1}
+_RTS = {0x81: 0b001, 0x82: 0b010, 0x84: 0b100, 0x87: 0b111}
+
+CANSTAT = 0x0E
+CANCTRL = 0x0F
+CANINTE = 0x2B
+CANINTF = 0x2C
+EFLG = 0x2D
+RXB_SIDH = (0x61, 0x71)
+TXB_CTRL = (0x30, 0x40, 0x50)
+TXREQ = 0x08
+RXIF = (0x01, 0x02)
+TXIF = (0x04, 0x08, 0x10)
+ERRIF = 0x20
+RXOVR = (0x40, 0x80)
+
+
+class CountingSPI:
+    """SPI bus that hands every transfer to the chip and counts them. One call is one CS-low
+    transaction, as `SPITransport` never splits an instruction."""
+
+    def __init__(self, chip):
+        self._chip = chip
+        self.transfers = 0
+        self.on_transfer = None  # called after each transfer, e.g. to raise an interrupt mid-read
+
+    def write(self, data):
+        self.transfers += 1
+        self._chip.transfer(bytes(data), None)
+        self._after_transfer()
+
+    def write_readinto(self, data, into):
+        self.transfers += 1
+        self._chip.transfer(bytes(data), into)
+        self._after_transfer()
+
+    def _after_transfer(self):
+        if self.on_transfer is not None:
+            self.on_transfer()
+
+
+class FakeMCP2515:
+    """Registers, RX/TX buffers and the INT output of one MCP2515.
+
+    Frames come in with `receive` (filter hit `filter_hit`) and frames requested with RTS stay
+    pending until `complete_tx`. `fire_irq` calls the INT pin handler while INT is low.
+    """
+
+    def __init__(self):
+        self.registers = bytearray(128)
+        self.rx_filter_hits = [0, 0]
+        self.sent = []  # (buffer index, id, data)
+        self.int_pin = None
+        self.last_instruction = None
+        self.spi = CountingSPI(self)
+        self.reset()
+
+    def reset(self):
+        self.registers[:] = bytearray(128)
+        self.registers[CANCTRL] = 0x87
+        self.registers[CANSTAT] = 0x80
+
+    @property
+    def pin_class(self):
+        """`machine.Pin` replacement: input pins are the INT output of this chip"""
+        chip = self
+
+        class ChipPin(machine.Pin):
+            def __new__(cls, pin_id=None, mode=-1, pull=None):
+                if mode == machine.Pin.IN:
+                    chip.int_pin = IntPin(chip)
+                    return chip.int_pin
+                return machine.Pin(pin_id, mode)
+
+        return ChipPin
+
+    # bus side
+
+    def receive(self, can_id, data, filter_hit=0):
+        """A frame accepted by filter `filter_hit` arrives. False if it was lost to an overflow"""
+        flags = self.registers[CANINTF]
+        for idx in range(2):
+            if not flags & RXIF[idx]:
+                self._load_rx(idx, can_id, data)
+                self.rx_filter_hits[idx] = filter_hit
+                self.registers[CANINTF] |= RXIF[idx]
+                return True
+        self.registers[EFLG] |= RXOVR[1]
+        self.registers[CANINTF] |= ERRIF
+        return False
+
+    def _load_rx(self, idx, can_id, data):
+        base = RXB_SIDH[idx]
+        self.registers[base] = can_id >> 3
+        self.registers[base + 1] = (can_id & 0x07) << 5
+        self.registers[base + 2] = 0
+        self.registers[base + 3] = 0
+        self.registers[base + 4] = len(data)
+        for i, byte in enumerate(data):
+            self.registers[base + 5 + i] = byte
+
+    def pending_tx(self):
+        return [idx for idx in range(3) if self.registers[TXB_CTRL[idx]] & TXREQ]
+
+    def complete_tx(self, idx=None):
+        """Put the pending frame of TX buffer `idx` (the highest TXP one by default) on the wire"""
+        pending = self.pending_tx()
+        if idx is None:
+            # highest priority first, then the lowest buffer number, as the chip does
+            idx = max(pending, key=lambda i: (self.registers[TXB_CTRL[i]] & 0x03, -i))
+        ctrl = TXB_CTRL[idx]
+        self.registers[ctrl] &= ~TXREQ & 0xFF
+        self.registers[CANINTF] |= TXIF[idx]
+        sidh, sidl, dlc = self.registers[ctrl + 1], self.registers[ctrl + 2], self.registers[ctrl + 5]
+        can_id = (sidh << 3) | (sidl >> 5)
+        self.sent.append((idx, can_id, bytes(self.registers[ctrl + 6:ctrl + 6 + (dlc & 0x0F)])))
+        return can_id
+
+    # INT output
+
+    @property
+    def int_level(self):
+        return 0 if self.registers[CANINTF] & self.registers[CANINTE] else 1
+
+    def fire_irq(self):
+        if self.int_pin is not None and self.int_pin.handler is not None and not self.int_level:
+            self.int_pin.handler(self.int_pin)
+
+    # SPI side
+
+    def transfer(self, data, into):
+        instruction = self.last_instruction = data[0]
+        regs = self.registers
+        if instruction == _RESET:
+            self.reset()
+        elif instruction == _READ:
+            for i in range(2, len(data)):
+                into[i] = regs[data[1] + i - 2]
+        elif instruction == _WRITE:
+            for i in range(2, len(data)):
+                self._write(data[1] + i - 2, data[i])
+        elif instruction == _BITMOD:
+            address, mask, value = data[1], data[2], data[3]
+            self._write(address, (regs[address] & ~mask) | (value & mask))
+        elif instruction == _READ_STATUS:
+            into[1] = self._status()
+        elif instruction == _RX_STATUS:
+            into[1] = self._rx_status()
+        elif instruction in _READ_RX:
+            idx = _READ_RX[instruction]
+            base = RXB_SIDH[idx]
+            for i in range(1, len(data)):
+                into[i] = regs[base + i - 1]
+            # RXnIF is cleared when CS goes high after READ RX
+            regs[CANINTF] &= ~RXIF[idx] & 0xFF
+        elif instruction in _RTS:
+            for idx in range(3):
+                if _RTS[instruction] & (1 << idx):
+                    regs[TXB_CTRL[idx]] |= TXREQ
+        else:
+            raise ValueError('unknown instruction {:#04x}'.format(instruction))
+
+    def _write(self, address, value):
+        self.registers[address] = value & 0xFF
+        if address == CANCTRL:
+            # the requested mode is entered at once
+            self.registers[CANSTAT] = (self.registers[CANSTAT] & 0x1F) | (value & 0xE0)
+
+    def _status(self):
+        regs = self.registers
+        flags = regs[CANINTF]
+        status = flags & 0x03
+        for idx, (req_bit, if_bit) in enumerate(((0x04, 0x08), (0x10, 0x20), (0x40, 0x80))):
+            if regs[TXB_CTRL[idx]] & TXREQ:
+                status |= req_bit
+            if flags & TXIF[idx]:
+                status |= if_bit
+        return status
+
+    def _rx_status(self):
+        flags = self.registers[CANINTF]
+        status = 0
+        if flags & RXIF[0]:
+            status |= 0x40 | self.rx_filter_hits[0]
+        if flags & RXIF[1]:
+            status |= 0x80
+            if not flags & RXIF[0]:
+                status |= self.rx_filter_hits[1]
+        return status
+
+
+class IntPin(machine.Pin):
+    def __init__(self, chip):
+        super().__init__()
+        self._chip = chip
+        self.handler = None
+
+    def irq(self, trigger=None, handler=None):
+        self.handler = handler
+
+    def value(self, *args):
+        return self._chip.int_level
+
+
+def patch_driver(monkeypatch, chip):
+    """Wire the pins `libs.MCP2515` creates to `chip` and skip its settle delays"""
+    monkeypatch.setattr(mcp2515_module, 'Pin', chip.pin_class)
+    monkeypatch.setattr(mcp2515_module, 'sleep', lambda seconds: None)
+
+
+def make_can(monkeypatch, chip=None, interrupts=True, **kwargs):
+    """An `MCP2515` driver on `chip` (a new `FakeMCP2515` by default), with the INT pin wired if
+    `interrupts`"""
+    if chip is None:
+        chip = FakeMCP2515()
+    patch_driver(monkeypatch, chip)
+    can = MCP2515(0, 0, 0, 0, 0, 1, 500000, spi=SharedSPI(chip.spi),
+                  interrupt_pin=2 if interrupts else None, **kwargs)
+    return can, chip
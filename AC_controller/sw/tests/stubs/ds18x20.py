@@ -0,0 +1,15 @@
+"""Host stand-in for the MicroPython `ds18x20` module: no sensors answer on the bus"""
+
+
+class DS18X20:
+    def __init__(self, onewire):
+        self.ow = onewire
+
+    def scan(self):
+        return self.ow.scan()
+
+    def convert_temp(self):
+        pass
+
+    def read_temp(self, rom):
+        return None
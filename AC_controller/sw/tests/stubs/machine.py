@@ -0,0 +1,49 @@
+"""Host stand-in for the MicroPython `machine` module: peripherals accept any call and do nothing"""
+
+
+class _Peripheral:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class Pin(_Peripheral):
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def value(self, *args):
+        return 0
+
+
+class Timer(_Peripheral):
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+
+class UART(_Peripheral):
+    pass
+
+
+class SPI(_Peripheral):
+    pass
+
+
+class I2C(_Peripheral):
+    pass
+
+
+class PWM(_Peripheral):
+    pass
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
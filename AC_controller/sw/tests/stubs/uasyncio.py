@@ -0,0 +1,23 @@
+"""Host stand-in for the MicroPython `uasyncio` module on top of `asyncio`"""
+from asyncio import *  # noqa: F401,F403
+import asyncio
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(awaitable, ms):
+    return await asyncio.wait_for(awaitable, ms / 1000)
@@ -0,0 +1,2 @@
+"""Host stand-in for the MicroPython `utime` module: the host `time` with the ticks functions of conftest"""
+from time import *  # noqa: F401,F403
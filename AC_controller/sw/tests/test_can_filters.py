@@ -0,0 +1,82 @@
+import random
+
+from can.can_filters import FilterPlanner, STD_ID_MASK
+from commands import CANCmdHandlers
+from constants import CAN_COMMANDS_NAMES
+
+from fake_mcp2515 import CANSTAT, make_can
+
+KNOWN_IDS = list(CAN_COMMANDS_NAMES)
+MODE_NORMAL = 0x00
+MODE_CONFIG = 0x80
+
+
+def known_unhandled_accepted(plan, handled_ids):
+    return [can_id for can_id in KNOWN_IDS if can_id not in handled_ids and plan.accepts(can_id)]
+
+
+def test_firmware_handlers_get_one_exact_filter_each():
+    handled_ids = list(CANCmdHandlers)
+    plan = FilterPlanner(handled_ids, KNOWN_IDS).plan()
+
+    assert all(plan.accepts(can_id) for can_id in handled_ids)
+    assert known_unhandled_accepted(plan, handled_ids) == []
+    assert plan.false_accept_ratio == 0
+    assert sorted(can_id for can_id in plan.exact_ids() if can_id is not None) == sorted(handled_ids)
+
+
+def test_fewer_ids_than_filters_accept_only_them():
+    handled_ids = [0x320, 0x5c0, 0x7a0]
+    plan = FilterPlanner(handled_ids).plan()
+
+    assert plan.masks == [STD_ID_MASK, STD_ID_MASK]
+    assert set(plan.filters[0] + plan.filters[1]) == set(handled_ids)
+    assert plan.accepted_space == len(handled_ids)
+
+
+def test_more_ids_than_filters_are_all_accepted():
+    for seed in range(20):
+        rng = random.Random(seed)
+        handled_ids = rng.sample(range(STD_ID_MASK + 1), rng.randint(7, 16))
+        plan = FilterPlanner(handled_ids).plan()
+
+        assert all(plan.accepts(can_id) for can_id in handled_ids)
+        assert not all(plan.accepts(can_id) for can_id in range(STD_ID_MASK + 1))
+
+
+def test_known_ids_keep_unhandled_traffic_out():
+    handled_ids = list(CANCmdHandlers) + [0x368, 0x460, 0x290]
+    with_known = FilterPlanner(handled_ids, KNOWN_IDS).plan()
+    without_known = FilterPlanner(handled_ids).plan()
+
+    assert all(with_known.accepts(can_id) for can_id in handled_ids)
+    assert len(known_unhandled_accepted(with_known, handled_ids)) <= \
+        len(known_unhandled_accepted(without_known, handled_ids))
+    assert with_known.false_accept_ratio < 0.2
+
+
+def test_no_handled_ids_accept_everything():
+    plan = FilterPlanner([]).plan()
+
+    assert plan.masks == [0, 0]
+    assert all(plan.accepts(can_id) for can_id in range(0, STD_ID_MASK + 1, 97))
+
+
+def test_filter_setup_is_one_config_mode_session(monkeypatch):
+    """The boot-time filter setup of the firmware plan. Run with `-s` for its SPI transactions and
+    blind window, the time the controller receives nothing."""
+    can, chip = make_can(monkeypatch)
+    plan = FilterPlanner(list(CANCmdHandlers), KNOWN_IDS).plan()
+    modes = []
+    chip.spi.on_transfer = lambda: modes.append(chip.registers[CANSTAT] & 0xE0)
+    transfers = chip.spi.transfers
+    can.program_filters(plan.masks, plan.filters)
+    transfers = chip.spi.transfers - transfers
+
+    print('\nfilter setup: {} SPI transactions, controller blind for {} us'.format(
+        transfers, can.filter_blind_window_us))
+    config_entries = [mode for previous, mode in zip([MODE_NORMAL] + modes, modes)
+                      if mode == MODE_CONFIG and previous != MODE_CONFIG]
+    assert len(config_entries) == 1
+    assert modes[-1] == MODE_NORMAL
+    assert can.filter_blind_window_us >= 0
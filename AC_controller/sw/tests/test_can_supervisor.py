@@ -0,0 +1,126 @@
+import asyncio
+
+from can import can_supervisor
+from can.can_supervisor import CanBusSupervisor
+from libs.canio import BusState
+
+
+class BusSettings:
+    SUPERVISOR_PERIOD_MS = 10
+    RESTART_BACKOFF_MS = 500
+    RESTART_BACKOFF_MAX_MS = 2000
+
+
+class FaultyCAN:
+    """MCP2515 stand-in: goes bus-off on `fail` and recovers after `restarts_to_recover` restarts"""
+
+    def __init__(self):
+        self.state = BusState.ERROR_ACTIVE
+        self.transmit_error_count = 0
+        self.receive_error_count = 0
+        self.rx_overflow_count = 0
+        self.restarts = 0
+        self._restarts_to_recover = None
+
+    def fail(self, restarts_to_recover):
+        self.state = BusState.BUS_OFF
+        self.transmit_error_count = 255
+        self._restarts_to_recover = self.restarts + restarts_to_recover
+
+    def restart(self):
+        self.restarts += 1
+        if self.restarts >= self._restarts_to_recover:
+            self.state = BusState.ERROR_ACTIVE
+            self.transmit_error_count = 0
+
+
+def run_for(supervisor, start, end, step=10):
+    for now in range(start, end, step):
+        supervisor.on_sample(supervisor._can.state, now)
+
+
+def test_bus_off_recovering_by_itself_is_not_restarted():
+    can = FaultyCAN()
+    supervisor = CanBusSupervisor(can, bus_settings=BusSettings)
+    can.fail(restarts_to_recover=1)
+    run_for(supervisor, 0, 300)
+    can.state = BusState.ERROR_PASSIVE
+    supervisor.on_sample(can.state, 300)
+
+    assert can.restarts == 0
+    assert supervisor.bus_off_count == 1
+    assert supervisor.last_recovery_ms == 300
+
+
+def test_stuck_bus_off_is_restarted_with_exponential_backoff():
+    can = FaultyCAN()
+    restarted = []
+    supervisor = CanBusSupervisor(can, on_restart=lambda: restarted.append(True), bus_settings=BusSettings)
+    can.fail(restarts_to_recover=100)
+    restart_times = []
+    for now in range(0, 6000, 10):
+        before = can.restarts
+        supervisor.on_sample(can.state, now)
+        if can.restarts != before:
+            restart_times.append(now)
+
+    # 500 ms, then doubled up to the 2000 ms maximum
+    assert restart_times[:4] == [500, 1500, 3500, 5500]
+    assert len(restarted) == can.restarts == supervisor.restart_count
+    assert supervisor.state == BusState.BUS_OFF
+    assert supervisor.last_recovery_ms is None
+
+
+def test_recovery_after_restart_resets_backoff():
+    can = FaultyCAN()
+    supervisor = CanBusSupervisor(can, bus_settings=BusSettings)
+    can.fail(restarts_to_recover=2)
+    run_for(supervisor, 0, 1600)
+
+    assert can.restarts == 2
+    assert supervisor.state == BusState.ERROR_ACTIVE
+    assert supervisor.last_recovery_ms == 1510
+
+    # the next bus-off starts over with the initial backoff
+    can.fail(restarts_to_recover=1)
+    run_for(supervisor, 2000, 2510)
+    assert can.restarts == 3
+    assert supervisor.bus_off_count == 2
+
+
+def test_health_reports_counters():
+    can = FaultyCAN()
+    supervisor = CanBusSupervisor(can, bus_settings=BusSettings)
+    can.fail(restarts_to_recover=1)
+    supervisor.check()
+
+    health = supervisor.health
+    assert health['state'] == 'BUS_OFF'
+    assert health['tec'] == 255
+    assert health['bus_off_count'] == 1
+    assert health['restarts'] == 0
+
+
+def test_run_task_restarts_controller(monkeypatch):
+    class FastSettings(BusSettings):
+        SUPERVISOR_PERIOD_MS = 1
+        RESTART_BACKOFF_MS = 20
+        RESTART_BACKOFF_MAX_MS = 40
+
+    can = FaultyCAN()
+    supervisor = CanBusSupervisor(can, bus_settings=FastSettings)
+    can.fail(restarts_to_recover=1)
+
+    async def main():
+        task = asyncio.create_task(supervisor.run())
+        for _ in range(200):
+            await asyncio.sleep(0.005)
+            if supervisor.last_recovery_ms is not None:
+                break
+        task.cancel()
+
+    monkeypatch.setattr(can_supervisor, 'DUBUG_MODE', 0)
+    asyncio.run(main())
+    assert can.restarts == 1
+    assert supervisor.state == BusState.ERROR_ACTIVE
+    assert supervisor.last_recovery_ms >= FastSettings.RESTART_BACKOFF_MS
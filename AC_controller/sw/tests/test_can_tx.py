@@ -0,0 +1,218 @@
+import pytest
+
+import settings
+from can import can_tx
+from can.can_tx import CanTxScheduler, TxQueue, TX_QUEUED, TX_COALESCED, TX_DROPPED_OLDEST
+from libs.canio import Message
+
+from fake_mcp2515 import make_can, TXB_CTRL
+
+TEXT = 0x32c  # ordered
+TEXT_CONTROL = 0x34c
+REPORT = 0x520
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+def frame(can_id, value=0):
+    return Message(can_id, bytes((value,)))
+
+
+def ids(queue):
+    return [queue.peek(i)[0].id for i in range(len(queue))]
+
+
+def values(queue):
+    return [queue.peek(i)[0].data[0] for i in range(len(queue))]
+
+
+# TxQueue
+
+def test_coalescing_replaces_the_queued_frame_in_place():
+    queue = TxQueue(4)
+    assert queue.push(frame(0x100, 1), 0) == TX_QUEUED
+    assert queue.push(frame(0x200, 1), 0) == TX_QUEUED
+    assert queue.push(frame(0x100, 2), 0) == TX_COALESCED
+    assert ids(queue) == [0x100, 0x200]
+    assert values(queue) == [2, 1]
+
+
+def test_ordered_frames_are_appended():
+    queue = TxQueue(4)
+    for value in range(3):
+        assert queue.push(frame(TEXT, value), 0, coalesce=False) == TX_QUEUED
+    assert values(queue) == [0, 1, 2]
+
+
+def test_full_queue_drops_the_oldest():
+    queue = TxQueue(3)
+    for can_id in (0x100, 0x200, 0x300):
+        queue.push(frame(can_id), 0)
+    assert queue.push(frame(0x400), 0) == TX_DROPPED_OLDEST
+    assert ids(queue) == [0x200, 0x300, 0x400]
+    # the dropped ID is no longer coalesced into a stale slot
+    assert queue.push(frame(0x100), 0) == TX_DROPPED_OLDEST
+    assert ids(queue) == [0x300, 0x400, 0x100]
+
+
+def test_slot_bookkeeping_survives_wraparound():
+    queue = TxQueue(3)
+    for round_ in range(10):
+        queue.push(frame(0x100, round_), 0)
+        queue.push(frame(0x200, round_), 0)
+        queue.pop()
+        # 0x200 now sits at a wrapped slot: coalescing must still find it
+        assert queue.push(frame(0x200, 99), 0) == TX_COALESCED
+        assert queue.pop()[0].data[0] == 99
+        assert len(queue) == 0
+        assert queue._slot_by_id == {}
+
+
+def test_pop_from_the_middle_keeps_order_and_bookkeeping():
+    queue = TxQueue(4)
+    queue.push(frame(0x100), 0)
+    queue.pop()  # start off slot 0 so the entries wrap
+    for can_id in (0x200, 0x300, 0x400, 0x500):
+        queue.push(frame(can_id), 0)
+    assert queue.pop(2)[0].id == 0x400
+    assert ids(queue) == [0x200, 0x300, 0x500]
+    for can_id in (0x200, 0x300, 0x500):
+        assert queue.push(frame(can_id, 7), 0) == TX_COALESCED
+    assert values(queue) == [7, 7, 7]
+    assert queue.push(frame(0x400), 0) == TX_QUEUED
+    assert ids(queue) == [0x200, 0x300, 0x500, 0x400]
+
+
+# CanTxScheduler on the fake MCP2515
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(can_tx, 'ticks_ms', clock)
+    return clock
+
+
+def make_scheduler(monkeypatch, **bus_settings):
+    can, chip = make_can(monkeypatch)
+    bus_settings = type('TestCAN', (settings.CAN,), bus_settings)
+    return CanTxScheduler(can, bus_settings, 'TestCAN'), can, chip
+
+
+def step(scheduler):
+    scheduler._update_in_flight()
+    scheduler._refill()
+
+
+def complete(scheduler, chip, idx=None):
+    can_id = chip.complete_tx(idx)
+    chip.fire_irq()
+    step(scheduler)
+    return can_id
+
+
+def test_all_three_buffers_are_used(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch)
+    for can_id in (0x100, 0x200, 0x300, 0x400):
+        scheduler.submit(frame(can_id))
+    step(scheduler)
+    assert chip.pending_tx() == [0, 1, 2]
+    assert scheduler.queued_count == 1
+
+
+def test_in_flight_id_does_not_stall_other_ids(monkeypatch, clock):
+    # all in one priority queue
+    scheduler, can, chip = make_scheduler(monkeypatch, TX_PRIORITIES={})
+    for value in range(3):
+        scheduler.submit(frame(TEXT, value))
+    scheduler.submit(frame(REPORT))
+    scheduler.submit(frame(0x100))
+    step(scheduler)
+
+    # one TEXT frame at a time; the report and 0x100 are loaded past the queued TEXT frames
+    assert sorted(entry[0] for entry in scheduler._in_flight if entry) == sorted((TEXT, REPORT, 0x100))
+    while chip.pending_tx():
+        complete(scheduler, chip)
+    text = [data[0] for _, can_id, data in chip.sent if can_id == TEXT]
+    assert text == [0, 1, 2]
+    assert scheduler.sent_count == 5
+
+
+def test_queued_frame_past_its_deadline_expires(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch, TX_DEADLINE_MS=50)
+    for value in range(4):
+        scheduler.submit(frame(TEXT, value))
+    step(scheduler)
+    clock.now += 60
+    complete(scheduler, chip)
+
+    assert scheduler.expired_count == 3
+    assert scheduler.queued_count == 0
+    assert chip.pending_tx() == []
+
+
+def test_pending_frame_past_its_deadline_is_aborted(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch, TX_DEADLINE_MS=50)
+    scheduler.submit(frame(0x100))
+    step(scheduler)
+    assert chip.pending_tx() == [0]
+
+    clock.now += 60
+    step(scheduler)
+    assert chip.pending_tx() == []
+    assert scheduler.aborted_count == 1
+    assert can.tx_abort_count == 1
+    assert scheduler._in_flight == [None, None, None]
+
+
+def test_controller_restart_forgets_pending_frames(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch)
+    for value in range(2):
+        scheduler.submit(frame(TEXT, value))
+    step(scheduler)
+    can.restart()
+    scheduler.controller_restarted()
+    step(scheduler)
+
+    assert scheduler.aborted_count == 1
+    # the next TEXT frame is no longer held back by the lost one
+    assert chip.pending_tx() == [0]
+    assert complete(scheduler, chip) == TEXT
+    assert chip.sent[-1][2] == bytes((1,))
+
+
+def test_higher_priority_frame_goes_ahead_of_a_queued_text_burst(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch)
+    for value in range(4):
+        scheduler.submit(frame(TEXT, value))  # TX_PRIORITIES: 1
+    scheduler.submit(frame(0x100))
+    scheduler.submit(frame(0x200))
+    step(scheduler)
+    assert chip.pending_tx() == [0, 1, 2]
+
+    scheduler.submit(frame(TEXT_CONTROL))  # TX_PRIORITIES: 2
+    scheduler.submit(frame(REPORT))  # TX_PRIORITIES: 3
+    while chip.pending_tx():
+        complete(scheduler, chip)
+
+    sent = [can_id for _, can_id, _ in chip.sent]
+    # each freed buffer goes to the highest queued priority, and the chip sends the highest TXP first
+    assert sent == [TEXT, REPORT, TEXT_CONTROL, TEXT, TEXT, TEXT, 0x100, 0x200]
+
+
+def test_priority_is_written_to_the_txp_bits(monkeypatch, clock):
+    scheduler, can, chip = make_scheduler(monkeypatch)
+    for can_id in (0x100, TEXT, TEXT_CONTROL):
+        scheduler.submit(frame(can_id))
+    step(scheduler)
+
+    txp = {}
+    for idx in chip.pending_tx():
+        ctrl = TXB_CTRL[idx]
+        txp[(chip.registers[ctrl + 1] << 3) | (chip.registers[ctrl + 2] >> 5)] = chip.registers[ctrl] & 0x03
+    assert txp == {0x100: 0, TEXT: 1, TEXT_CONTROL: 2}
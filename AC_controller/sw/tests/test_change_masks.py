@@ -0,0 +1,97 @@
+"""One minute of driving replayed into the climate controller with the boot.py observers attached,
+notified with change masks and without. Run with `-s` for the figures."""
+import pytest
+
+from uart.uart_bus import UARTBus
+
+from device_set import boot_device_set
+
+REPLAY_MS = 60000
+TICK_MS = 100  # UART_COMMAND_UPDATE_TICK: one update per tick of a held button
+
+
+def drive(climate):
+    """(ms, change) of the replay, every change is followed by one climate update"""
+    events = []
+    for ms in range(0, REPLAY_MS, 5000):  # ADC measurement
+        events.append((ms, lambda ms=ms: setattr(climate, 'acc_voltage', 12.5 + ms % 3 / 10)))
+    for ms in range(0, REPLAY_MS, 1000):  # outside temperature from CAN, one degree up half way
+        events.append((ms + 500, lambda ms=ms: setattr(climate.ext_temp, 'state', 5 if ms < 30000 else 6)))
+    for ms in range(10000, 11000, TICK_MS):  # temp+ held for a second
+        events.append((ms, climate.l_temp.next_state))
+    events.append((20000, climate.fan_speed.next_state))
+    events.append((40000, climate.l_seat_heat.next_state))
+    return sorted(events, key=lambda event: event[0])
+
+
+def count_updates(monkeypatch, observers):
+    """observer class -> calls of its update"""
+    counts = {}
+    for cls in {type(observer) for observer in observers}:
+        def update(self, subject_type, subject, _update=cls.update, _name=cls.__name__):
+            counts[_name] = counts.get(_name, 0) + 1
+            _update(self, subject_type, subject)
+        counts[cls.__name__] = 0
+        monkeypatch.setattr(cls, 'update', update)
+    return counts
+
+
+def actuator_states(devices):
+    """State of the relays and PWM outputs the devices drive"""
+    states = []
+    for device in devices:
+        for name, part in sorted(vars(device).items()):
+            if hasattr(type(part), 'state') and isinstance(getattr(type(part), 'state'), property):
+                states.append((type(device).__name__, name, part.state))
+    return states
+
+
+def replay(monkeypatch, masks):
+    bench = boot_device_set(monkeypatch)
+    climate = bench.climate
+    counts = count_updates(monkeypatch, climate._observers)
+    for _, change in drive(climate):
+        change()
+        if masks:
+            climate.send_update()
+        else:
+            climate.notify(climate.controller_type, climate)
+    return counts, climate, actuator_states(bench.devices)
+
+
+@pytest.fixture
+def replays(monkeypatch):
+    with monkeypatch.context() as patch:
+        before = replay(patch, masks=False)
+    after = replay(monkeypatch, masks=True)
+    return before, after
+
+
+def test_masks_cut_device_updates_and_uart_packs(replays):
+    (before, climate, _), (after, _, _) = replays
+    uart = UARTBus.__name__
+    updates = len(drive(climate))
+    devices_before = sum(count for name, count in before.items() if name != uart)
+    devices_after = sum(count for name, count in after.items() if name != uart)
+    print('\n{} climate updates. device updates: {} -> {}, UART packs: {} -> {}'.format(
+        updates, devices_before, devices_after, before[uart], after[uart]))
+    assert updates == 84
+    assert before[uart] == updates
+    assert devices_before == updates * (len(before) - 2)  # the CAN bus consumes no topic
+
+    # the first update has every field changed
+    assert after['FanDirTemp'] == 1 + 10
+    assert after['ACFan'] == 1 + 1
+    assert after['SeatHeatL'] == 1 + 1
+    assert after['SeatHeatR'] == 1
+    assert after['ACCycleRelay'] == after['FanDirWindow'] == 1
+    # the ACC voltage is not sent to HU, the outside temperature changed twice (0 -> 5 -> 6)
+    assert after[uart] == 1 + 2 + 10 + 1 + 1
+    assert devices_after < devices_before // 10
+
+
+def test_masked_replay_leaves_the_actuators_in_the_same_state(replays):
+    (_, before_climate, before_states), (_, after_climate, after_states) = replays
+    assert after_states
+    assert after_states == before_states
+    assert after_climate.snapshot() == before_climate.snapshot()
@@ -0,0 +1,38 @@
+from constants import CLIMATE_FIELDS, AC_STATUS, AC_CYCLE_MODE
+from controllers.climate_controller import ClimateController
+
+
+def test_field_getters_cover_every_field_once():
+    fields = [field for field, _ in ClimateController.FIELD_GETTERS]
+    assert len(set(fields)) == len(fields)
+    mask = 0
+    for field in fields:
+        mask |= field
+    assert mask == CLIMATE_FIELDS.PACKED | CLIMATE_FIELDS.SUN_SENSOR | CLIMATE_FIELDS.ACC_VOLTAGE
+
+
+def test_send_update_reports_changed_fields():
+    controller = ClimateController()
+    controller.send_update()
+    controller.send_update()
+    assert controller.changed == 0
+
+    controller.ac_status = AC_STATUS.ON
+    controller.cycle = AC_CYCLE_MODE.INTERIOR
+    controller.l_temp.next_state()
+    controller.send_update()
+    assert controller.changed == CLIMATE_FIELDS.AC_STATUS | CLIMATE_FIELDS.CYCLE | CLIMATE_FIELDS.L_TEMP
+
+
+def test_snapshot_restores_packed_fields_and_selectors():
+    controller = ClimateController()
+    controller.ac_status = AC_STATUS.ON
+    controller.l_temp.next_state()
+    controller.acc_voltage = 12.5
+    snapshot = controller.snapshot()
+
+    restored = ClimateController()
+    restored.restore(snapshot)
+    assert restored.get_packed_data() == controller.get_packed_data()
+    assert restored.l_temp.state == controller.l_temp.state
+    assert restored.acc_voltage == 12.5
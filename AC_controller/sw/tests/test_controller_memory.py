@@ -0,0 +1,42 @@
+"""Heap and state size of the controllers boot.py creates. Run with `-s` for the figures: the heap is
+what CPython keeps per controller (tracemalloc), a rough guide for the gc.mem_free() figures of the board."""
+import tracemalloc
+
+import pytest
+
+from controllers.climate_controller import ClimateController, TempController
+from controllers.door_controller import DoorController
+from controllers.parking_controller import FrontParkingController, RearParkingController
+
+CONTROLLERS = (ClimateController, TempController, DoorController, FrontParkingController, RearParkingController)
+
+
+def kept_bytes(create):
+    """Bytes still allocated after `create()`, the object kept alive"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        created = create()
+        after = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    finally:
+        tracemalloc.stop()
+    return created, sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+
+@pytest.mark.parametrize('controller_class', CONTROLLERS)
+def test_controller_heap_and_state(controller_class):
+    controller, heap = kept_bytes(controller_class)
+    state = controller.snapshot()
+    print('\n{}: {} bytes of heap, {} bytes of state'.format(controller_class.__name__, heap, len(state)), end='')
+    assert 0 < len(state) <= 64
+    assert heap > 0
+
+
+@pytest.mark.parametrize('controller_class', CONTROLLERS)
+def test_snapshot_into_a_buffer_keeps_nothing(controller_class):
+    controller = controller_class()
+    buf = bytearray(len(controller.snapshot()))
+    controller.snapshot(buf)
+    copied, heap = kept_bytes(lambda: controller.snapshot(buf))
+    assert copied is buf
+    assert heap == 0
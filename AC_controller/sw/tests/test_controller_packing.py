@@ -0,0 +1,114 @@
+"""Bit-patched packed data against the list packing it replaced. Run with `-s` for packs per second."""
+import random
+import time
+
+import settings
+from controllers.climate_controller import ClimateController
+from controllers.parking_controller import FrontParkingController, RearParkingController
+from helpers.utils import scale
+from settings import R_PARKING_RANGE, PARKING_SENSOR_VALUES_RANGE
+
+CHANGES = 5000
+PACKS = 20000
+
+
+def old_climate_packing(c):
+    """ClimateController.get_packed_data before the packed bytearray"""
+    data = [0x00] * 7
+    data[0] |= c.ac_status << 7
+    data[0] |= c.ac << 6
+    data[0] |= (c.fan_speed.state << 0) & 0x0f
+    data[0] |= c.cycle << 5
+    data[0] |= c.rear_window_heat << 4
+    data[1] |= c.dual << 5
+    data[1] |= c.window_max << 4
+    data[1] |= c.fan_dir << 0
+    data[2] |= c.l_temp.state
+    data[3] |= c.r_temp.state
+    data[4] |= (c.r_seat_heat.state << 0)
+    data[4] |= (c.l_seat_heat.state << 4)
+    data[5] |= c.ext_temp.state
+    data[6] |= c.auto << 1
+    return data
+
+
+def old_rear_parking_packing(p):
+    """RearParkingController.get_packed_data before the packed bytearray"""
+    data = [0x00] * 4
+    data[0] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.L, p.l * 10)
+    data[1] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.LC, p.lc * 10)
+    data[2] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.RC, p.rc * 10)
+    data[3] = scale(PARKING_SENSOR_VALUES_RANGE, R_PARKING_RANGE.R, p.r * 10)
+    return data
+
+
+def climate_changes(rng):
+    """Random changes of every packed field, through its setter or selector method (the flags are 0/1)"""
+    selectors = ('fan_speed', 'l_temp', 'r_temp', 'l_seat_heat', 'r_seat_heat')
+    flags = ('ac_status', 'ac', 'auto', 'dual', 'cycle', 'window_max', 'rear_window_heat')
+
+    def change(c):
+        kind = rng.randrange(5)
+        if kind == 0:
+            getattr(c, rng.choice(selectors)).next_state()
+        elif kind == 1:
+            getattr(c, rng.choice(selectors[:3])).prev_state()
+        elif kind == 2:
+            c.ext_temp.state = rng.choice(list(settings.EXT_TEMP_RANGE))
+        elif kind == 3:
+            c.fan_dir = rng.randint(1, 9)
+        else:
+            setattr(c, rng.choice(flags), rng.randint(0, 1))
+    return change
+
+
+def test_climate_packing_matches_the_old_packing():
+    rng = random.Random(23)
+    controller = ClimateController()
+    change = climate_changes(rng)
+    for _ in range(CHANGES):
+        change(controller)
+        # the old list held a negative outside temperature as is, the UART frame byte is its low 8 bits
+        assert bytes(controller.get_packed_data()) == bytes(value & 0xff for value in old_climate_packing(controller))
+
+
+def test_rear_parking_packing_matches_the_old_packing():
+    rng = random.Random(24)
+    controller = RearParkingController()
+    for _ in range(CHANGES):
+        setattr(controller, rng.choice(('l', 'lc', 'rc', 'r')), rng.randint(0, 25))
+        assert bytes(controller.get_packed_data()) == bytes(old_rear_parking_packing(controller))
+
+
+def packs_per_second(pack):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(PACKS):
+            pack()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return PACKS / best
+
+
+def test_packs_per_second():
+    climate, parking = ClimateController(), RearParkingController()
+    rates = {
+        'climate': (packs_per_second(climate.get_packed_data), packs_per_second(lambda: old_climate_packing(climate))),
+        'rear parking': (packs_per_second(parking.get_packed_data),
+                         packs_per_second(lambda: old_rear_parking_packing(parking))),
+    }
+    for name, (new, old) in rates.items():
+        print('\n{} packs/s: {:.2f}M, old packing {:.2f}M'.format(name, new / 1e6, old / 1e6), end='')
+        assert new > old * 3
+    print()
+
+
+def test_front_parking_packed_data_is_a_preallocated_view():
+    controller = FrontParkingController()
+    data = controller.get_packed_data()
+    assert isinstance(data, memoryview)
+    assert controller.get_packed_data() is data
+    controller.l, controller.r = 4, 8
+    assert bytes(controller.get_packed_data()) == bytes((100, 100))
+    assert (controller.l, controller.r) == (4, 8)
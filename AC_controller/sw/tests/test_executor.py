@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+from machine import Timer
+
+import services
+import settings
+from constants import RELAY_STATUS
+from helpers.executor import CommandExecutor
+
+
+class FakeTimer(Timer):
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.callback = None
+
+    def init(self, period=None, mode=None, callback=None):
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+    def fire(self):
+        callback, self.callback = self.callback, None
+        callback(self)
+
+
+class FakePin:
+    def __init__(self, value=1):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+
+def drain(executor):
+    async def main():
+        task = asyncio.create_task(executor.run())
+        for _ in range(20):
+            await asyncio.sleep(0)
+        task.cancel()
+    asyncio.run(main())
+
+
+def test_submit_reports_dropped_tokens():
+    executor = CommandExecutor(size=2)
+    calls = []
+    first, second, third = (lambda: calls.append(1)), (lambda: calls.append(2)), (lambda: calls.append(3))
+
+    assert executor.submit(first)
+    assert executor.submit(first)  # coalesced with the waiting one
+    assert executor.submit(second)
+    assert not executor.submit(third)
+    assert (executor.coalesced_count, executor.dropped_count) == (1, 1)
+
+    drain(executor)
+    assert calls == [1, 2]
+
+
+def test_uncoalesced_tokens_keep_every_argument():
+    executor = CommandExecutor(size=4)
+    values = []
+    assert executor.submit(values.append, 1, coalesce=False)
+    assert executor.submit(values.append, 1, coalesce=False)
+    drain(executor)
+    assert values == [1, 1]
+
+
+@pytest.fixture
+def shutdown_service(monkeypatch):
+    executor = CommandExecutor(size=1)
+    monkeypatch.setattr(services, 'get_command_executor', lambda: executor)
+    monkeypatch.setattr(services, 'Timer', FakeTimer)
+    monkeypatch.setattr(settings, 'DUBUG_MODE', 0)
+    service = services.ShutDownService()
+    service._power_supply_pin = FakePin(1)
+    return service, executor
+
+
+def test_power_loss_with_full_executor_is_retried(shutdown_service):
+    service, executor = shutdown_service
+    assert executor.submit(lambda: None)  # the ring is full
+
+    service._handle_power_interrupt(service._power_supply_pin)
+    assert executor.dropped_count == 1
+    assert not service._is_shutting_down
+    assert service._timer.callback is not None
+
+    drain(executor)
+    service._timer.fire()  # retry after EXECUTOR_RETRY_MS
+    assert service._is_shutting_down
+    drain(executor)
+    assert service._vcc_relay.state == RELAY_STATUS.ON
+
+
+def test_shutdown_timer_with_full_executor_is_retried(shutdown_service):
+    service, executor = shutdown_service
+    service._handle_power_interrupt(service._power_supply_pin)
+    drain(executor)
+    assert service._vcc_relay.state == RELAY_STATUS.ON
+
+    assert executor.submit(lambda: None)
+    service._timer.fire()  # SHUTTING_DOWN_TIMEOUT passed, but the token is dropped
+    assert service._timer.callback is not None
+    drain(executor)
+    service._timer.fire()
+    drain(executor)
+    assert service._vcc_relay.state == RELAY_STATUS.OFF
+    assert not service._is_shutting_down
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[int(len(samples) * fraction)]
+
+
+def test_callback_only_pays_for_the_submit(monkeypatch):
+    """ISR duration of a fan speed change with the climate notify to the boot.py device set, run in
+    the callback as before the executor and submitted to it. Run with `-s` for the figures."""
+    from device_set import boot_device_set
+
+    bench = boot_device_set(monkeypatch)
+    climate = bench.climate
+    steps = [climate.fan_speed.next_state] * 3 + [climate.fan_speed.prev_state] * 3
+
+    def change_fan_speed(step):
+        steps[step % len(steps)]()
+        climate.send_update()
+
+    edges = 2000
+    direct = []
+    for step in range(edges):
+        start = time.perf_counter()
+        change_fan_speed(step)
+        direct.append((time.perf_counter() - start) * 1e6)
+
+    executor = bench.executor
+    submitted = []
+
+    async def main():
+        task = asyncio.create_task(executor.run())
+        for step in range(edges):
+            start = time.perf_counter()
+            executor.submit(change_fan_speed, step)
+            submitted.append((time.perf_counter() - start) * 1e6)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        task.cancel()
+
+    asyncio.run(main())
+    for fraction in (0.5, 0.99, 0.999):
+        print('\ncallback p{}: in the callback {:.1f} us, submitted {:.1f} us'.format(
+            fraction * 100, percentile(direct, fraction), percentile(submitted, fraction)), end='')
+    print('\nexecutor max_submit_us {}, max_run_us {}'.format(executor.max_submit_us, executor.max_run_us))
+    assert executor.executed_count == edges
+    # p99.9 is left to the printout: a single host scheduler hiccup decides it
+    assert percentile(submitted, 0.99) < percentile(direct, 0.99)
+    assert percentile(submitted, 0.5) * 2 < percentile(direct, 0.5)
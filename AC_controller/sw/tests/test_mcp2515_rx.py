@@ -0,0 +1,98 @@
+import asyncio
+
+from fake_mcp2515 import make_can
+
+READ_RX0 = 0x90
+
+
+def read_all(can):
+    messages = []
+    while True:
+        message = can.read_message()
+        if message is None:
+            return messages
+        messages.append((message.id, bytes(message.data)))
+
+
+def test_irq_drains_both_rx_buffers_into_the_ring(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    chip.receive(0x500, b'\x01\x02')
+    chip.receive(0x520, b'\x03')
+    chip.fire_irq()
+
+    assert chip.int_level == 1
+    assert can.unread_message_count == 2
+    assert read_all(can) == [(0x500, b'\x01\x02'), (0x520, b'\x03')]
+
+
+def test_quiet_bus_costs_no_spi_transactions(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    transfers = chip.spi.transfers
+
+    async def main():
+        waiter = asyncio.create_task(can.wait_for_messages())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        chip.receive(0x500, b'\x07')
+        chip.fire_irq()
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
+    assert can.unread_message_count == 1
+    # CANINTF, READ RX0, CANINTF again: nothing while the bus was quiet
+    assert chip.spi.transfers - transfers == 3
+
+
+def test_nested_drain_during_read_rx_keeps_both_frames(monkeypatch):
+    can, chip = make_can(monkeypatch)
+
+    def second_frame_arrives():
+        # the INT edge of the second frame hits while READ RX of the first still has CS low, so the
+        # drain is deferred and runs from SPITransport._end, nested in the first drain
+        if chip.last_instruction != READ_RX0:
+            return
+        chip.spi.on_transfer = None
+        chip.receive(0x520, b'\xbb')
+        chip.fire_irq()
+
+    chip.receive(0x500, b'\xaa')
+    chip.spi.on_transfer = second_frame_arrives
+    chip.fire_irq()
+
+    assert read_all(can) == [(0x500, b'\xaa'), (0x520, b'\xbb')]
+
+
+def test_task_side_drain_nested_with_the_irq(monkeypatch):
+    can, chip = make_can(monkeypatch)
+
+    def irq_during_task_drain():
+        # between READ RX0 of the task-side drain and its commit
+        if chip.last_instruction == READ_RX0:
+            chip.spi.on_transfer = None
+            chip.receive(0x530, b'\x02')
+            can._handle_interrupt(chip.int_pin)
+
+    chip.receive(0x500, b'\x01')  # INT is low but the edge was missed
+
+    async def main():
+        chip.spi.on_transfer = irq_during_task_drain
+        await asyncio.wait_for(can.wait_for_messages(), 1)
+
+    asyncio.run(main())
+    assert read_all(can) == [(0x500, b'\x01'), (0x530, b'\x02')]
+
+
+def test_dropped_and_overflow_counters(monkeypatch):
+    can, chip = make_can(monkeypatch, rx_ring_size=2)
+    for can_id in (0x100, 0x101, 0x102):
+        chip.receive(can_id, b'')
+        chip.fire_irq()
+    assert can.dropped_frame_count == 1
+    assert read_all(can) == [(0x100, b''), (0x101, b'')]
+
+    chip.receive(0x200, b'')
+    chip.receive(0x201, b'')
+    assert not chip.receive(0x202, b'')  # both RX buffers full
+    chip.fire_irq()
+    assert can.rx_overflow_count == 1
+    assert [can_id for can_id, _ in read_all(can)] == [0x200, 0x201]
@@ -0,0 +1,90 @@
+"""SPI transactions per sent frame, counted on the fake MCP2515's SPI.
+
+Before the transport layer a send was READ STATUS (write + read), LOAD TX with four `spi.write`
+calls and RTS: 3 CS-low transactions, 7 SPI calls and 5 `bytes` objects per frame.
+"""
+from libs.canio import Message
+
+from fake_mcp2515 import make_can
+
+ACC_TEMP = 0x520
+
+
+def send(can, chip, message, priority=0):
+    """Transmit `message`; returns (transport counts of the send, SPI calls of the send)"""
+    can.reset_spi_transaction_counts()
+    transfers = chip.spi.transfers
+    buffer_index = can.transmit(message, priority)
+    assert buffer_index is not None
+    counts = {name: count for name, count in can.spi_transaction_counts.items() if count}
+    return counts, chip.spi.transfers - transfers
+
+
+def complete(can, chip):
+    chip.complete_tx()
+    chip.fire_irq()
+
+
+def test_new_frame_is_one_write_and_one_rts(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    counts, transfers = send(can, chip, Message(ACC_TEMP, bytes((1, 2, 3, 4))))
+
+    assert counts == {'write': 1, 'rts': 1}
+    assert transfers == 2
+    complete(can, chip)
+    assert chip.sent == [(0, ACC_TEMP, bytes((1, 2, 3, 4)))]
+
+
+def test_unchanged_frame_is_sent_with_the_rts_alone(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    send(can, chip, Message(ACC_TEMP, bytes((1, 2, 3, 4))))
+    complete(can, chip)
+
+    counts, transfers = send(can, chip, Message(ACC_TEMP, bytes((1, 2, 3, 4))))
+    assert counts == {'rts': 1}
+    assert transfers == 1
+    complete(can, chip)
+    assert chip.sent[-1] == (0, ACC_TEMP, bytes((1, 2, 3, 4)))
+
+
+def test_changed_frame_or_priority_is_loaded_again(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    send(can, chip, Message(ACC_TEMP, bytes((1, 2, 3, 4))))
+    complete(can, chip)
+
+    # a shorter frame must not match the old one on its first bytes
+    assert send(can, chip, Message(ACC_TEMP, bytes((1, 2))))[0] == {'write': 1, 'rts': 1}
+    complete(can, chip)
+    assert send(can, chip, Message(ACC_TEMP, bytes((1, 2))), priority=3)[0] == {'write': 1, 'rts': 1}
+    complete(can, chip)
+    assert [frame[2] for frame in chip.sent] == [bytes((1, 2, 3, 4)), bytes((1, 2)), bytes((1, 2))]
+
+
+def test_restart_forgets_the_loaded_frames(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    send(can, chip, Message(ACC_TEMP, bytes((5,))))
+    complete(can, chip)
+    can.restart()
+
+    assert send(can, chip, Message(ACC_TEMP, bytes((5,))))[0] == {'write': 1, 'rts': 1}
+
+
+def test_polled_send_adds_one_status_read(monkeypatch):
+    can, chip = make_can(monkeypatch, interrupts=False)
+    counts, transfers = send(can, chip, Message(ACC_TEMP, bytes((1, 2, 3, 4))))
+
+    assert counts == {'read_status': 1, 'write': 1, 'rts': 1}
+    assert transfers == 3
+
+
+def test_each_buffer_keeps_its_own_frame(monkeypatch):
+    can, chip = make_can(monkeypatch)
+    frames = [Message(0x320 + idx, bytes((idx,))) for idx in range(3)]
+    for frame in frames:
+        send(can, chip, frame)
+    assert chip.pending_tx() == [0, 1, 2]
+    for _ in frames:
+        complete(can, chip)
+
+    for frame in frames:
+        assert send(can, chip, frame)[0] == {'rts': 1}
@@ -0,0 +1,64 @@
+"""Receive path allocations and the reuse window of pooled messages, on the fake MCP2515.
+
+CPython cannot count MicroPython heap allocations one to one (it boxes every int > 256, for one), so
+the benchmark counts the heap blocks the driver hands out per frame: what a handler that keeps the
+message would hold on to, and what the GC has to collect otherwise. Run with `-s` for the figures.
+"""
+import tracemalloc
+
+from fake_mcp2515 import make_can
+
+FRAMES = 60
+POOL_SIZE = 4
+CAN_ID = 0x0F0  # below 256, CPython does not box it (nor the SPI op counters within FRAMES)
+DRIVER_FILES = ('libs/MCP2515.py', 'libs/canio.py')
+
+
+def receive(can, chip, count, first_value=0):
+    """Push `count` frames through the IRQ drain and read them; returns the messages"""
+    messages = []
+    for i in range(count):
+        chip.receive(CAN_ID, bytes((first_value + i) % 256 for _ in range(8)))
+        chip.fire_irq()
+        messages.append(can.read_message())
+    return messages
+
+
+def driver_blocks_per_frame(can, chip):
+    receive(can, chip, POOL_SIZE * 2)  # warm up: fill the pool, intern the views
+    can.reset_spi_transaction_counts()
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for message in receive(can, chip, FRAMES):
+        kept.append((message, message.data))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    driver = [tracemalloc.Filter(True, '*' + name) for name in DRIVER_FILES]
+    diff = after.filter_traces(driver).compare_to(before.filter_traces(driver), 'lineno')
+    return sum(stat.count_diff for stat in diff) / FRAMES
+
+
+def test_pool_allocates_nothing_per_frame(monkeypatch):
+    pooled = driver_blocks_per_frame(*make_can(monkeypatch, rx_pool_size=POOL_SIZE))
+    allocating = driver_blocks_per_frame(*make_can(monkeypatch))
+    print('\nheap blocks per received frame: pooled {:.2f}, allocating {:.2f}'.format(pooled, allocating))
+
+    assert pooled == 0
+    assert allocating >= 2  # Message + its data bytearray
+
+
+def test_pooled_message_is_reused_after_pool_size_frames(monkeypatch):
+    can, chip = make_can(monkeypatch, rx_pool_size=POOL_SIZE)
+    first = receive(can, chip, 1, first_value=1)[0]
+    kept_view = first.data
+    kept_copy = bytes(first.data)
+
+    later = receive(can, chip, POOL_SIZE - 1, first_value=2)
+    assert all(message is not first for message in later)
+    assert bytes(first.data) == bytes([1] * 8)  # still valid within the window
+
+    wrapped = receive(can, chip, 1, first_value=9)[0]
+    assert wrapped is first
+    assert bytes(kept_view) == bytes([9] * 8)  # overwritten in place
+    assert kept_copy == bytes([1] * 8)
@@ -0,0 +1,79 @@
+"""ControllerNotifier topic dispatch with the observers boot.py attaches. Run with `-s` for the cost of a
+climate notify against the loop over every observer it replaced."""
+import time
+
+import pytest
+
+from helpers.observer import Observer
+
+from device_set import boot_device_set
+
+NOTIFIES = 2000
+
+
+class Recorder(Observer):
+    def __init__(self, topics):
+        self.TOPICS = topics
+        self.updates = []
+
+    def update(self, subject_type, subject):
+        self.updates.append(subject_type)
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    return boot_device_set(monkeypatch)
+
+
+def notify_all(subject):
+    """ControllerNotifier.notify before the topics"""
+    for observer in subject._observers:
+        observer.update(subject.controller_type, subject)
+
+
+def test_climate_notify_skips_observers_of_other_topics(bench):
+    climate = bench.climate
+    climate.notify(climate.controller_type, climate)
+
+    attached = [type(observer).__name__ for observer in climate._observers]
+    assert len(attached) == 11
+    # the CAN bus subscribes for the state only
+    assert climate.delivered_count == len(attached) - 1
+
+
+def test_temp_notify_reaches_only_temp_observers(bench):
+    temp = bench.temp
+    temp.notify(temp.controller_type, temp)
+    assert temp.delivered_count == 1
+
+
+def test_attach_and_detach_rebuild_the_topic_lists(bench):
+    climate = bench.climate
+    climate.notify(climate.controller_type, climate)
+    recorder = Recorder((climate.controller_type,))
+    recorder.subscribe(climate)
+    climate.notify(climate.controller_type, climate)
+    recorder.unsubscribe(climate)
+    climate.notify(climate.controller_type, climate)
+    assert recorder.updates == [climate.controller_type]
+
+
+def test_notify_cost(bench):
+    climate = bench.climate
+
+    def per_notify_us(notify):
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(NOTIFIES):
+                notify()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1e6 / NOTIFIES
+
+    # a full notify: the device updates (and their prints) are part of the cost on both sides
+    topics = per_notify_us(lambda: climate.notify(climate.controller_type, climate))
+    every = per_notify_us(lambda: notify_all(climate))
+    print('\nclimate notify, {} attached: topics {:.1f} us ({} called), every observer {:.1f} us'.format(
+        len(climate._observers), topics, climate.delivered_count // (3 * NOTIFIES), every))
+    assert climate.delivered_count == 3 * NOTIFIES * (len(climate._observers) - 1)
@@ -0,0 +1,79 @@
+"""ArithmeticSequence against the list it replaces. Run with `-s` for the index timing."""
+import time
+
+import pytest
+
+import settings
+from constants import AC_TEMP
+from controllers.base_controller import BaseStateSelector, CycledSelector, SequentialSelector
+from helpers.sequence import ArithmeticSequence
+
+LOOKUPS = 20000
+
+SEQUENCES = [
+    (settings.EXT_TEMP_RANGE, list(range(-39, 80))),
+    (settings.AC_TEMP_RANGE, list(range(0, 29)) + [AC_TEMP.AC_TEMP_HI]),
+    (ArithmeticSequence(10, 0, -2, extras=(99, 98)), [10, 8, 6, 4, 2, 99, 98]),
+    (ArithmeticSequence(0, 0, extras=(5,)), [5]),
+]
+
+
+@pytest.mark.parametrize('sequence, as_list', SEQUENCES)
+def test_sequence_behaves_like_the_list(sequence, as_list):
+    assert len(sequence) == len(as_list)
+    assert list(sequence) == as_list
+    for idx in range(-len(as_list), len(as_list)):
+        assert sequence[idx] == as_list[idx]
+    for idx in (len(as_list), -len(as_list) - 1):
+        with pytest.raises(IndexError):
+            sequence[idx]
+    assert (min(sequence), max(sequence)) == (min(as_list), max(as_list))
+
+    for value in range(min(as_list) - 3, max(as_list) + 3):
+        assert (value in sequence) == (value in as_list)
+        if value in as_list:
+            assert sequence.index(value) == as_list.index(value)
+        else:
+            with pytest.raises(ValueError):
+                sequence.index(value)
+    assert 0.5 not in sequence
+
+
+@pytest.mark.parametrize('selector_class', (BaseStateSelector, CycledSelector, SequentialSelector))
+def test_selectors_step_the_same_over_both(selector_class):
+    sequence, as_list = SEQUENCES[1]
+    over_sequence = selector_class(sequence, min(sequence))
+    over_list = selector_class(as_list, min(as_list))
+    for step in range(2 * len(as_list)):
+        for selector in (over_sequence, over_list):
+            if hasattr(selector, 'prev_state') and step % 5 == 4:
+                selector.prev_state()
+            elif hasattr(selector, 'next_state'):
+                selector.next_state()
+            else:
+                selector.state = as_list[step % len(as_list)]
+        assert over_sequence.state == over_list.state
+    over_sequence.state = AC_TEMP.AC_TEMP_HI
+    over_list.state = AC_TEMP.AC_TEMP_HI
+    assert over_sequence.state == over_list.state
+
+
+def test_index_timing():
+    sequence, as_list = SEQUENCES[0]
+    value = max(as_list)  # the worst case of a list scan
+
+    def per_lookup_us(lookup):
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(LOOKUPS):
+                lookup(value)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1e6 / LOOKUPS
+
+    # what BaseStateSelector.state did on the list: an `in` test followed by index()
+    on_list = per_lookup_us(lambda v: v in as_list and as_list.index(v))
+    on_sequence = per_lookup_us(sequence.index)
+    print('\nindex({}) of EXT_TEMP_RANGE: {:.2f} us, list {:.2f} us'.format(value, on_sequence, on_list))
+    assert on_sequence < on_list
@@ -0,0 +1,88 @@
+import pytest
+
+from commands import UARTCmdHandlers, uart_command_key
+from constants import UART_TYPES, UART_COMMANDS, AC_CONTROL
+from uart import uart_bus
+from uart.uart_bus import UARTBus
+from uart.uart_parser import HEADER
+
+
+def frame(frame_type, payload):
+    checksum = (frame_type + len(payload) + sum(payload)) ^ 0xff
+    return bytearray([HEADER, frame_type, len(payload)] + list(payload) + [checksum & 0xff])
+
+
+class RecordingUART:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, arg=None, coalesce=True):
+        self.submitted.append((fn, arg))
+        return True
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    executor = RecordingExecutor()
+    monkeypatch.setattr(uart_bus, 'get_command_executor', lambda: executor)
+    bus = UARTBus()
+    bus._uart = RecordingUART()
+    bus.executor = executor
+    return bus
+
+
+def handle(bus, data):
+    bus._handle_frame(data, len(data))
+
+
+def test_toggle_fires_on_press(bus):
+    cmd = UARTCmdHandlers[uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.AC)]
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [AC_CONTROL.AC, AC_CONTROL.PRESSED]))
+
+    assert bus.executor.submitted == [(cmd, None)]
+    assert bus._uart.written == [UART_COMMANDS.ACK]
+
+
+def test_release_is_acknowledged_without_a_toggle(bus):
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [AC_CONTROL.AC, 0x00]))
+
+    assert bus.executor.submitted == []
+    assert bus._uart.written == [UART_COMMANDS.ACK]
+
+
+def test_toggle_without_value_byte_is_acknowledged_and_dropped(bus):
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [AC_CONTROL.AC]))
+
+    assert bus.executor.submitted == []
+    assert bus._uart.written == [UART_COMMANDS.ACK]
+
+
+def test_value_command_gets_the_value(bus):
+    cmd = UARTCmdHandlers[uart_command_key(UART_TYPES.AC_CONTROL, AC_CONTROL.SET_L_TEMP)]
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [AC_CONTROL.SET_L_TEMP, 0x00]))
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [AC_CONTROL.SET_L_TEMP, 0x0c]))
+
+    assert bus.executor.submitted == [(cmd, 0x00), (cmd, 0x0c)]
+
+
+def test_unknown_command_is_ignored(bus):
+    handle(bus, frame(UART_TYPES.AC_CONTROL, [0x7f, AC_CONTROL.PRESSED]))
+
+    assert bus.executor.submitted == []
+    assert bus._uart.written == []
+
+
+def test_stub_request_reaches_its_command(bus):
+    cmd = UARTCmdHandlers[uart_command_key(UART_TYPES.STUB_REQUEST, UART_COMMANDS.STUB_REQUEST[3])]
+    handle(bus, bytearray(UART_COMMANDS.STUB_REQUEST))
+
+    assert bus.executor.submitted == [(cmd, UART_COMMANDS.STUB_REQUEST[4])]
+    assert bus._uart.written == [UART_COMMANDS.ACK]
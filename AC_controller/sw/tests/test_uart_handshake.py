@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+import settings
+from constants import UART_COMMANDS, UART_TYPES
+from controllers.climate_controller import ClimateController
+from controllers.door_controller import DoorController
+from controllers.parking_controller import FrontParkingController, RearParkingController
+from uart import uart_bus, uart_link
+from uart.uart_bus import UARTPublisher, UARTHandshake, HANDSHAKE_READY
+from uart.uart_parser import UARTFrameParser
+
+from virtual_time import VirtualTimeLoop
+
+
+def split(data):
+    frames = []
+    UARTFrameParser(lambda frame, length: frames.append(bytes(frame[:length]))).feed(data)
+    return frames
+
+
+class SimulatedHU:
+    """UART stand-in: parses what the box writes and acknowledges every frame after `rtt_ms`,
+    except the start sequence frames if `ack_start` is off"""
+
+    def __init__(self, rtt_ms=3, ack_start=True):
+        self.publisher = None
+        self.frames = []
+        self._rtt_ms = rtt_ms
+        self._ack_start = ack_start
+        self.acking = True
+        self._start_types = set()
+        self._parser = UARTFrameParser(self._on_frame)
+        UARTFrameParser(lambda frame, length: self._start_types.add(frame[1])).feed(UART_COMMANDS.START_SEQUENCE)
+
+    def write(self, data):
+        self._parser.feed(bytes(data))
+
+    def _on_frame(self, frame, length):
+        frame_type = frame[1]
+        self.frames.append(frame_type)
+        if not self.acking or frame_type in self._start_types and not self._ack_start:
+            return
+        asyncio.get_running_loop().call_later(self._rtt_ms / 1000, self.publisher.ack_received)
+
+
+@pytest.fixture
+def reliable(monkeypatch):
+    """Simulated time loop with ACK tracking on"""
+    monkeypatch.setattr(settings.UART, 'RELIABLE', True)
+    monkeypatch.setattr(settings, 'DUBUG_MODE', 0)
+    loop = VirtualTimeLoop()
+    loop.patch(monkeypatch, uart_bus, uart_link)
+    return loop
+
+
+def make_bus(hu):
+    controllers = (ClimateController(), DoorController(), FrontParkingController(), RearParkingController())
+    handshake = None
+
+    def frame_written(frame_type):
+        handshake.frame_written(frame_type)
+
+    publisher = UARTPublisher(hu, on_write=frame_written)
+    handshake = UARTHandshake(publisher, controllers)
+    hu.publisher = publisher
+    return publisher, handshake
+
+
+async def run_until(publisher, condition, timeout_s=2):
+    task = asyncio.create_task(publisher.write_task())
+    try:
+        for _ in range(int(timeout_s / 0.005)):
+            await asyncio.sleep(0.005)
+            if condition():
+                break
+        await asyncio.sleep(0.05)  # let late ACKs arrive
+    finally:
+        task.cancel()
+
+
+def test_start_sequence_acks_are_not_matched_to_tracked_frames(reliable):
+    hu = SimulatedHU()
+    publisher, handshake = make_bus(hu)
+    acks = publisher.ack_tracker
+
+    async def main():
+        # a frame HU did not acknowledge while it was booting is outstanding when HU requests the start
+        hu.acking = False
+        task = asyncio.create_task(publisher.write_task())
+        publisher.publish(UART_TYPES.DOOR, [0x08])
+        await asyncio.sleep(0.005)
+        task.cancel()
+        assert hu.frames == [UART_TYPES.DOOR]
+        hu.acking = True
+        handshake.start()
+        await run_until(publisher, lambda: handshake.state == HANDSHAKE_READY)
+
+    reliable.run(main())
+    assert handshake.state == HANDSHAKE_READY
+    assert acks.untracked_acks == UART_COMMANDS.START_SEQUENCE_FRAMES
+    # every snapshot frame got its own ACK, none was lost or retransmitted
+    assert acks.retransmit_count == 0
+    assert acks.lost_count == 0
+    assert acks.unmatched_acks == 0
+    snapshot = hu.frames[-4:]
+    assert sorted(snapshot) == sorted((UART_TYPES.AC, UART_TYPES.DOOR, UART_TYPES.F_PARK, UART_TYPES.R_PARK))
+
+
+def test_snapshot_waits_for_start_sequence_acks(reliable):
+    hu = SimulatedHU(rtt_ms=20)
+    publisher, handshake = make_bus(hu)
+
+    async def main():
+        handshake.start()
+        await asyncio.sleep(0.01)
+        task = asyncio.create_task(publisher.write_task())
+        await asyncio.sleep(0.005)
+        # the start ACKs are not in yet: nothing else may be written
+        assert hu.frames == [frame[1] for frame in split(UART_COMMANDS.START_SEQUENCE)]
+        task.cancel()
+        await run_until(publisher, lambda: handshake.state == HANDSHAKE_READY)
+
+    reliable.run(main())
+    assert handshake.state == HANDSHAKE_READY
+    assert publisher.ack_tracker.lost_count == 0
+
+
+def test_start_sequence_without_acks_times_out(reliable):
+    hu = SimulatedHU(ack_start=False)
+    publisher, handshake = make_bus(hu)
+
+    async def main():
+        handshake.start()
+        await run_until(publisher, lambda: handshake.state == HANDSHAKE_READY)
+
+    reliable.run(main())
+    assert handshake.state == HANDSHAKE_READY
+    assert publisher.ack_tracker.untracked_acks == 0
+    assert publisher.ack_tracker.unmatched_acks == 0
+    assert handshake.last_start_us >= settings.UART.ACK_TIMEOUT_MS * 1000
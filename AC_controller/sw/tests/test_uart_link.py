@@ -0,0 +1,126 @@
+"""Parking manoeuvre replay through UARTPublisher and UARTLinkBudget on simulated time, with a 38400-baud
+wire behind the UART. Run with `-s` for the figures."""
+import asyncio
+
+import pytest
+
+import settings
+from constants import UART_TYPES
+from uart import uart_bus, uart_link
+from uart.uart_bus import UARTPublisher
+from uart.uart_link import BITS_PER_BYTE
+from uart.uart_parser import UARTFrameParser
+
+from virtual_time import VirtualTimeLoop, run_tasks
+
+REPLAY_MS = 5000
+RADARS = (UART_TYPES.R_PARK, UART_TYPES.F_PARK)
+RADAR_INTERVAL_MS = settings.UART.STREAM_LIMITS[UART_TYPES.R_PARK][0]
+# type: (publish period ms, payload length); the radars and the climate change on every publish
+STREAMS = {
+    UART_TYPES.R_PARK: (10, 4),
+    UART_TYPES.F_PARK: (10, 4),
+    UART_TYPES.AC: (20, 7),
+    UART_TYPES.DOOR: (250, 1),
+    UART_TYPES.CH_CMD_VEHICLE_SPEED_SIGNAL: (4, 6),
+    UART_TYPES.CH_CMD_ILL_INFO: (5, 6),
+    UART_TYPES.STEERING_WHEEL_ANGLE: (4, 6),
+}
+
+
+class Wire:
+    """UART stand-in: bytes leave at the baudrate, frames are timestamped when their last byte did"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._us_per_byte = BITS_PER_BYTE * 1000000 // settings.UART.BAUDRATE
+        self._free_at = 0
+        self.max_backlog_us = 0
+        self.frames = []  # (frame type, payload, ticks_us on the far end)
+        self._parser = UARTFrameParser(self._on_frame)
+
+    def write(self, data):
+        now = self._loop.ticks_us()
+        self.max_backlog_us = max(self.max_backlog_us, self._free_at - now)
+        self._free_at = max(self._free_at, now)
+        self._parser.feed(bytes(data))
+
+    def _on_frame(self, frame, length):
+        self._free_at += length * self._us_per_byte
+        self.frames.append((frame[1], bytes(frame[3:length - 1]), self._free_at))
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    monkeypatch.setattr(settings, 'DUBUG_MODE', 0)
+    loop = VirtualTimeLoop()
+    loop.patch(monkeypatch, uart_bus, uart_link)
+    return loop
+
+
+async def stream(loop, publisher, frame_type, period_ms, length, published):
+    """Publish a new value of the type every `period_ms`; the first two bytes count the values"""
+    count = 0
+    while True:
+        data = [count >> 8, count & 0xff] + [0x20] * (length - 2)
+        published.setdefault(frame_type, []).append((count, loop.ticks_us()))
+        publisher.publish(frame_type, data)
+        count += 1
+        await asyncio.sleep(period_ms / 1000)
+
+
+def latencies_ms(published, frames, frame_type):
+    """For every published value: ms until HU had it or a newer value of the type"""
+    arrived = [((payload[0] << 8) | payload[1], at) for sent_type, payload, at in frames if sent_type == frame_type]
+    latencies = []
+    for count, published_at in published[frame_type]:
+        for arrived_count, at in arrived:
+            if arrived_count >= count:
+                latencies.append((at - published_at) / 1000)
+                break
+    return sorted(latencies)
+
+
+def test_radar_frames_reach_hu_within_their_interval_plus_the_backlog(loop):
+    wire = Wire(loop)
+    publisher = UARTPublisher(wire)
+    published = {}
+
+    async def main():
+        await run_tasks(REPLAY_MS, publisher.write_task(), publisher.heartbeat_task(),
+                        *(stream(loop, publisher, frame_type, period_ms, length, published)
+                          for frame_type, (period_ms, length) in STREAMS.items()))
+
+    loop.run(main())
+    link = publisher.link_budget
+    bound_ms = RADAR_INTERVAL_MS + settings.UART.LINK_MAX_BACKLOG_US // 1000 + 5  # + its own 2 ms frame, ms ticks
+    print('\nlink utilisation {}%, saturated windows {}, max backlog {} us'.format(
+        link.utilisation, link.saturated_windows, wire.max_backlog_us))
+    for frame_type in RADARS:
+        latencies = latencies_ms(published, wire.frames, frame_type)
+        # the values of the last interval may still be on their way
+        assert len(latencies) >= len(published[frame_type]) - bound_ms // STREAMS[frame_type][0]
+        print('radar {} latency ms: p50 {}, p99 {}, max {}'.format(
+            hex(frame_type), latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100], latencies[-1]))
+        assert latencies[-1] <= bound_ms
+
+    # the floods were held to the budget: they did not crowd out the radars, the link was not overrun
+    assert link.saturated_windows > 0
+    assert link.utilisation <= 100
+    assert wire.max_backlog_us <= settings.UART.LINK_MAX_BACKLOG_US + 1000
+
+
+def test_radar_rate_is_capped_by_the_stream_limit(loop):
+    wire = Wire(loop)
+    publisher = UARTPublisher(wire)
+    published = {}
+
+    async def main():
+        await run_tasks(REPLAY_MS, publisher.write_task(),
+                        stream(loop, publisher, UART_TYPES.R_PARK, 10, 4, published))
+
+    loop.run(main())
+    times = [at for frame_type, _, at in wire.frames if frame_type == UART_TYPES.R_PARK]
+    assert len(times) <= REPLAY_MS // RADAR_INTERVAL_MS + 1
+    assert min(later - earlier for earlier, later in zip(times, times[1:])) >= RADAR_INTERVAL_MS * 1000
+    assert publisher.replaced_count > 0
@@ -0,0 +1,115 @@
+import random
+
+from uart.uart_parser import UARTFrameParser, HEADER, ACK
+
+
+def frame(frame_type, payload):
+    checksum = (frame_type + len(payload) + sum(payload)) ^ 0xff
+    return bytes([HEADER, frame_type, len(payload)] + list(payload) + [checksum & 0xff])
+
+
+FRAMES = [
+    frame(0xe0, [0x17, 0x01]),
+    frame(0x81, [0x01]),
+    frame(0x03, [0x80, 0x20, 0x10, 0x10, 0x00, 0x28, 0x00]),
+    frame(0x24, []),
+    frame(0xe0, [0x2e, 0x2e]),  # header bytes inside the payload
+]
+
+
+class Recorder:
+    def __init__(self, **kwargs):
+        self.frames = []
+        self.acks = 0
+        self.parser = UARTFrameParser(self._on_frame, on_ack=self._on_ack, **kwargs)
+
+    def _on_frame(self, buf, length):
+        self.frames.append(bytes(buf[:length]))
+
+    def _on_ack(self):
+        self.acks += 1
+
+
+def feed_in_chunks(recorder, stream, rng):
+    pos = 0
+    while pos < len(stream):
+        size = rng.randint(1, 7)
+        recorder.parser.feed(stream[pos:pos + size])
+        pos += size
+
+
+def test_frames_byte_by_byte():
+    recorder = Recorder()
+    for byte in b''.join(FRAMES):
+        recorder.parser.feed(bytes([byte]))
+    assert recorder.frames == FRAMES
+    assert recorder.parser.frames_count == len(FRAMES)
+
+
+def test_fragmented_stream_matches_whole_feed():
+    rng = random.Random(11)
+    stream = b''.join(FRAMES * 50)
+    for _ in range(20):
+        recorder = Recorder()
+        feed_in_chunks(recorder, stream, rng)
+        assert recorder.frames == FRAMES * 50
+        assert recorder.parser.checksum_errors == 0
+
+
+def test_feed_length_limits_bytes_read():
+    recorder = Recorder()
+    buf = bytearray(32)
+    data = FRAMES[0] + FRAMES[1]
+    buf[:len(data)] = data
+    recorder.parser.feed(buf, len(FRAMES[0]) + 2)
+    recorder.parser.feed(buf[len(FRAMES[0]) + 2:], len(FRAMES[1]) - 2)
+    assert recorder.frames == FRAMES[:2]
+
+
+def test_garbage_between_frames_is_skipped():
+    recorder = Recorder()
+    recorder.parser.feed(b'\x00\x13' + FRAMES[0] + b'\x55\x01' + FRAMES[1])
+    assert recorder.frames == FRAMES[:2]
+    assert recorder.parser.skipped_bytes == 4
+
+
+def test_bad_checksum_is_dropped_and_next_frame_parsed():
+    recorder = Recorder()
+    corrupted = bytearray(FRAMES[2])
+    corrupted[4] ^= 0x40
+    recorder.parser.feed(bytes(corrupted) + FRAMES[0])
+    assert recorder.frames == [FRAMES[0]]
+    assert recorder.parser.checksum_errors == 1
+
+
+def test_resync_finds_frame_behind_false_header():
+    # a stray header with a plausible length swallows the start of the real frame
+    recorder = Recorder()
+    recorder.parser.feed(bytes([HEADER, 0x10, 0x03]) + FRAMES[0] + FRAMES[1])
+    assert recorder.frames == FRAMES[:2]
+
+
+def test_resync_after_oversized_length():
+    recorder = Recorder(max_payload=8)
+    recorder.parser.feed(bytes([HEADER, 0x10, 0x40]) + FRAMES[1])
+    assert recorder.frames == [FRAMES[1]]
+
+
+def test_random_corruption_never_loses_following_clean_frames():
+    # a false header in the noise may hold the frames behind it as its payload until `max_payload`
+    # bytes have arrived, the trailing frames provide them
+    rng = random.Random(3)
+    tail = FRAMES[1] * 10
+    for _ in range(200):
+        noise = bytes(rng.choice((HEADER, 0x01, 0x02, 0xe0, rng.randrange(0xff))) for _ in range(rng.randint(1, 12)))
+        recorder = Recorder()
+        feed_in_chunks(recorder, noise + FRAMES[0] + FRAMES[2] + tail, rng)
+        idx = recorder.frames.index(FRAMES[0])
+        assert recorder.frames[idx + 1] == FRAMES[2]
+
+
+def test_ack_outside_frame():
+    recorder = Recorder()
+    recorder.parser.feed(bytes([ACK]) + FRAMES[0] + bytes([ACK]))
+    assert recorder.acks == 2
+    assert recorder.frames == [FRAMES[0]]
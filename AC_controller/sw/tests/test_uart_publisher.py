@@ -0,0 +1,95 @@
+"""UARTPublisher frame suppression and heartbeat on simulated time. Run with `-s` for the figures."""
+import asyncio
+
+import pytest
+
+import settings
+from constants import UART_TYPES
+from uart import uart_bus, uart_link
+from uart.uart_bus import UARTPublisher
+from uart.uart_parser import UARTFrameParser
+
+from virtual_time import VirtualTimeLoop, run_tasks
+
+AC_REFRESH_MS = settings.UART.STREAM_LIMITS[UART_TYPES.AC][1]
+
+
+class RecordingHU:
+    """UART stand-in: (frame type, ms) of every frame written"""
+
+    def __init__(self, loop):
+        self.frames = []
+        self._loop = loop
+        self._parser = UARTFrameParser(lambda frame, length: self.frames.append((frame[1], loop.ticks_ms())))
+
+    def write(self, data):
+        self._parser.feed(bytes(data))
+
+    def times(self, frame_type):
+        return [ms for sent_type, ms in self.frames if sent_type == frame_type]
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    monkeypatch.setattr(settings, 'DUBUG_MODE', 0)
+    loop = VirtualTimeLoop()
+    loop.patch(monkeypatch, uart_bus, uart_link)
+    return loop
+
+
+def make_publisher(loop):
+    hu = RecordingHU(loop)
+    return UARTPublisher(hu), hu
+
+
+async def publish_every(publisher, period_ms, count, frame_type, payload):
+    """Publish `payload(i)` every `period_ms`, like a controller notifying on every sensor update"""
+    for i in range(count):
+        publisher.publish(frame_type, payload(i))
+        await asyncio.sleep(period_ms / 1000)
+
+
+def test_unchanged_frames_are_sent_once_per_refresh_period(loop):
+    publisher, hu = make_publisher(loop)
+
+    async def main():
+        await run_tasks(5000, publisher.write_task(),
+                        publish_every(publisher, 50, 100, UART_TYPES.AC, lambda i: [0x80, 0x20, 0x10]))
+
+    loop.run(main())
+    print('\nunchanged 20 Hz for 5 s: sent {} ({} B), suppressed {} ({} B)'.format(
+        publisher.sent_count, publisher.sent_bytes, publisher.suppressed_count, publisher.suppressed_bytes))
+    assert hu.times(UART_TYPES.AC) == [0, AC_REFRESH_MS, 2 * AC_REFRESH_MS]
+    assert publisher.suppressed_count == 97
+    assert publisher.suppressed_bytes == 97 * 7
+
+
+def test_changed_frame_is_sent_right_away(loop):
+    publisher, hu = make_publisher(loop)
+
+    async def main():
+        # the set temperature changes once a second
+        await run_tasks(3000, publisher.write_task(),
+                        publish_every(publisher, 50, 60, UART_TYPES.AC, lambda i: [0x80, 0x20 + i // 20]))
+
+    loop.run(main())
+    assert hu.times(UART_TYPES.AC) == [0, 1000, 2000]
+
+
+def test_heartbeat_resends_frames_of_quiet_controllers(loop):
+    publisher, hu = make_publisher(loop)
+    publisher.publish(UART_TYPES.AC, [0x80, 0x20])
+    publisher.publish(UART_TYPES.R_PARK, [100, 100, 100, 100])
+
+    async def main():
+        await run_tasks(6500, publisher.write_task(), publisher.heartbeat_task())
+
+    loop.run(main())
+    for frame_type in (UART_TYPES.AC, UART_TYPES.R_PARK):
+        times = hu.times(frame_type)
+        refresh_ms = publisher.link_budget.refresh_ms(frame_type)
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        assert len(times) >= 6500 // (refresh_ms + publisher._refresh_check_ms)
+        # never more than a refresh period plus one heartbeat check without a frame
+        assert all(refresh_ms <= gap <= refresh_ms + publisher._refresh_check_ms for gap in gaps)
+    assert publisher.suppressed_count == 0
@@ -0,0 +1,83 @@
+import asyncio
+
+from commands import ControllerUpdateCoalescer
+
+TICK_MS = 30
+
+
+class RecordingController:
+    def __init__(self, name, log, fail=False):
+        self.name = name
+        self._log = log
+        self._fail = fail
+
+    def send_update(self):
+        self._log.append((self.name, asyncio.get_running_loop().time()))
+        if self._fail:
+            raise ValueError('broken observer')
+
+
+def run(coalescer, scenario):
+    async def main():
+        task = asyncio.create_task(coalescer.run())
+        try:
+            await scenario()
+        finally:
+            task.cancel()
+    asyncio.run(main())
+
+
+def test_burst_within_a_tick_sends_one_update_per_controller():
+    log = []
+    coalescer = ControllerUpdateCoalescer(TICK_MS)
+    climate, door = RecordingController('climate', log), RecordingController('door', log)
+
+    async def scenario():
+        coalescer.request(climate)
+        await asyncio.sleep(0)  # the first request of a quiet period goes out on the next loop turn
+        await asyncio.sleep(0)
+        assert [name for name, _ in log] == ['climate']
+        for controller in (climate, door, climate, climate, door):
+            coalescer.request(controller)
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(2 * TICK_MS / 1000)
+
+    run(coalescer, scenario)
+    # in order of the first request of the burst, each once
+    assert [name for name, _ in log] == ['climate', 'climate', 'door']
+    assert coalescer.requested_count == 6
+    assert coalescer.sent_count == 3
+
+
+def test_burst_is_sent_at_the_end_of_the_tick():
+    log = []
+    coalescer = ControllerUpdateCoalescer(TICK_MS)
+    climate = RecordingController('climate', log)
+
+    async def scenario():
+        coalescer.request(climate)
+        await asyncio.sleep(0.005)
+        coalescer.request(climate)
+        await asyncio.sleep(3 * TICK_MS / 1000)
+
+    run(coalescer, scenario)
+    assert len(log) == 2
+    assert (log[1][1] - log[0][1]) * 1000 >= TICK_MS * 0.9
+
+
+def test_failing_update_does_not_stop_the_others(capsys):
+    log = []
+    coalescer = ControllerUpdateCoalescer(TICK_MS)
+    broken, door = RecordingController('broken', log, fail=True), RecordingController('door', log)
+
+    async def scenario():
+        coalescer.request(broken)
+        coalescer.request(door)
+        await asyncio.sleep(2 * TICK_MS / 1000)
+        coalescer.request(door)
+        await asyncio.sleep(2 * TICK_MS / 1000)
+
+    run(coalescer, scenario)
+    assert [name for name, _ in log] == ['broken', 'door', 'door']
+    assert coalescer.sent_count == 2
+    assert 'update failed' in capsys.readouterr().out
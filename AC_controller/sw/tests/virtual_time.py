@@ -0,0 +1,70 @@
+"""asyncio on a simulated clock, for replaying seconds of bus traffic in a few milliseconds.
+
+The loop never sleeps: when nothing is ready it jumps to the next timer. `ticks_ms`/`ticks_us` follow
+the loop clock, `patch` points the `time` functions the firmware modules imported at them.
+"""
+import asyncio
+import selectors
+
+_TICKS_PERIOD = 1 << 30
+
+
+class _SkippingSelector(selectors.DefaultSelector):
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if not events and timeout:
+            self.loop.advance(timeout)
+        return events
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        selector = _SkippingSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self._now_us = 0
+
+    def time(self):
+        return self._now_us / 1000000
+
+    def advance(self, seconds):
+        self._now_us += max(1, round(seconds * 1000000))
+
+    def ticks_ms(self):
+        return (self._now_us // 1000) % _TICKS_PERIOD
+
+    def ticks_us(self):
+        return self._now_us % _TICKS_PERIOD
+
+    def patch(self, monkeypatch, *modules):
+        for module in modules:
+            for name in ('ticks_ms', 'ticks_us'):
+                if hasattr(module, name):
+                    monkeypatch.setattr(module, name, getattr(self, name))
+
+    def run(self, coro):
+        """Like `asyncio.run`: tasks still pending when `coro` returns are cancelled"""
+        try:
+            return self.run_until_complete(coro)
+        finally:
+            pending = asyncio.all_tasks(self)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.close()
+
+
+async def run_tasks(duration_ms, *coros):
+    """Run the task coroutines for `duration_ms` of simulated time, then cancel them"""
+    tasks = [asyncio.create_task(coro) for coro in coros]
+    try:
+        await asyncio.sleep(duration_ms / 1000)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,39 +1,389 @@
 import time
+from time import ticks_ms, ticks_us, ticks_diff
 
+import uasyncio
 from micropython import const
 from machine import UART, Pin
 
 import settings
-from constants import UART_COMMANDS, UART_TYPES
+from constants import UART_COMMANDS, UART_TYPES, CLIMATE_FIELDS, AC_CONTROL
 from controllers.climate_controller import get_climate_controller
 from controllers.door_controller import get_door_controller
 from controllers.parking_controller import (get_front_parking_controller, get_rear_parking_controller)
+from helpers.executor import get_command_executor
 from helpers.observer import Observer
-from commands import UARTCmdHandlers
+from commands import UARTCmdHandlers, uart_command_key
+from uart.uart_parser import UARTFrameParser, FRAME_OVERHEAD
+from uart.uart_packet import UARTPacketBuilder
+from uart.uart_link import UARTLinkBudget
+
+
+# upper bounds of the HU round-trip latency histogram buckets, the last bucket has no bound
+RTT_BUCKETS_MS = (5, 10, 20, 50, 100, 200)
+
+
+class UARTAckTracker:
+    """Matches HU ACKs to the frames sent to HU.
+
+    ACKs carry no frame type, so they are matched to the sent frames in order; at most `window`
+    frames are outstanding. If the oldest is not acknowledged within `timeout_ms` the whole window is
+    considered lost and its types are returned by `expire` to be sent again (with the latest data of
+    the type), up to `max_retries` times. The time from the first send of a frame until HU acknowledged
+    it (the window HU may show stale state) is tracked as `max_unacked_ms`.
+
+    Frames written around the tracker (the handshake start sequence) are announced with `reset`: their
+    ACKs are absorbed before any tracked frame is sent, so they are never matched to one.
+    """
+
+    def __init__(self, window, timeout_ms, max_retries):
+        self._window = window
+        self._timeout_ms = timeout_ms
+        self._max_retries = max_retries
+        self._in_flight = []  # (frame type, ticks_us it was sent)
+        self._unacked_since = {}  # frame type -> ticks_ms of the first send not acknowledged yet
+        self._retries = {}  # frame type -> retransmissions of its unacknowledged frame
+        self._untracked = 0  # ACKs still expected for frames written around the tracker
+        self._untracked_since = 0
+
+        self.rtt_histogram = [0] * (len(RTT_BUCKETS_MS) + 1)
+        self.acked_count = 0
+        self.retransmit_count = 0
+        self.lost_count = 0
+        self.unmatched_acks = 0
+        self.untracked_acks = 0
+        self.max_unacked_ms = 0
+
+    @property
+    def window_full(self):
+        return self._untracked > 0 or len(self._in_flight) >= self._window
+
+    @property
+    def stats(self):
+        return {'acked': self.acked_count, 'retransmitted': self.retransmit_count, 'lost': self.lost_count,
+                'unmatched_acks': self.unmatched_acks, 'untracked_acks': self.untracked_acks,
+                'max_unacked_ms': self.max_unacked_ms,
+                'rtt_ms': {bound: count for bound, count in zip(RTT_BUCKETS_MS + ('inf',), self.rtt_histogram)}}
+
+    def sent(self, frame_type):
+        self._in_flight.append((frame_type, ticks_us()))
+        if frame_type not in self._unacked_since:
+            self._unacked_since[frame_type] = ticks_ms()
+
+    def reset(self, untracked=0):
+        """Forget the outstanding frames, `untracked` frames were written around the tracker: the
+        next `untracked` ACKs are theirs. Tracked frames wait for those ACKs (or the ACK timeout)."""
+        self._in_flight.clear()
+        self._retries.clear()
+        self._unacked_since.clear()
+        self._untracked = untracked
+        self._untracked_since = ticks_us()
+
+    def acked(self):
+        if self._untracked:
+            self._untracked -= 1
+            self.untracked_acks += 1
+            return
+        if not self._in_flight:
+            self.unmatched_acks += 1
+            return
+        frame_type, sent_at = self._in_flight.pop(0)
+        rtt_ms = ticks_diff(ticks_us(), sent_at) // 1000
+        bucket = 0
+        while bucket < len(RTT_BUCKETS_MS) and rtt_ms > RTT_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.rtt_histogram[bucket] += 1
+        self.acked_count += 1
+        self._retries.pop(frame_type, None)
+        self._settle(frame_type)
+
+    def timeout_ms(self):
+        """Time until the oldest outstanding frame times out, None if no frame is outstanding"""
+        if self._untracked:
+            return self._timeout_ms - ticks_diff(ticks_us(), self._untracked_since) // 1000
+        if not self._in_flight:
+            return None
+        return self._timeout_ms - ticks_diff(ticks_us(), self._in_flight[0][1]) // 1000
+
+    def expire(self):
+        """Drop the outstanding frames, returns the types to send again"""
+        if self._untracked:
+            if settings.DUBUG_MODE:
+                print('[UARTBus] HU did not acknowledge {} untracked frames'.format(self._untracked))
+            self._untracked = 0
+        retransmit = []
+        for frame_type, _ in self._in_flight:
+            retries = self._retries.get(frame_type, 0) + 1
+            if retries > self._max_retries:
+                self.lost_count += 1
+                self._retries.pop(frame_type, None)
+                self._settle(frame_type)
+                if settings.DUBUG_MODE:
+                    print('[UARTBus] HU did not acknowledge frame type {}'.format(hex(frame_type)))
+            elif frame_type not in retransmit:
+                self._retries[frame_type] = retries
+                self.retransmit_count += 1
+                retransmit.append(frame_type)
+        self._in_flight.clear()
+        return retransmit
+
+    def _settle(self, frame_type):
+        since = self._unacked_since.pop(frame_type, None)
+        if since is not None:
+            self.max_unacked_ms = max(self.max_unacked_ms, ticks_diff(ticks_ms(), since))
+
+
+class UARTPublisher:
+    """Queues controller frames for HU and writes them from an asyncio task.
+
+    `publish` never touches the UART: it builds the frame into the per-type buffer of the packet
+    builder and queues its type, so it is safe to call from timer callbacks and other tasks. A type
+    is queued at most once (the queue is bounded by the number of frame types): a newer frame of a
+    queued type replaces the stale one in its buffer. `write_task` sends the queued frames by
+    `UART.TX_PRIORITIES`, highest first, and picks the next frame only after the previous one, so
+    parking radar frames overtake queued climate and door frames. A queued frame is written only
+    when the link budget lets it (stream rate, wire backlog, share of the link for priority 0);
+    held back frames keep being replaced by newer ones.
+
+    A frame identical to the last one of its type is skipped. An unchanged frame is sent again once
+    its refresh period (`UART.STREAM_LIMITS`, `UART.HEARTBEAT_MS` by default) passed, and
+    `heartbeat_task` re-queues frames whose controllers went quiet, so HU never shows stale data for
+    longer than about one refresh period.
+
+    With `UART.RELIABLE` the frames have to be acknowledged by HU (see `UARTAckTracker`), frames not
+    acknowledged in time are queued again.
+    """
+
+    def __init__(self, uart, heartbeat_ms=settings.UART.HEARTBEAT_MS, priorities=settings.UART.TX_PRIORITIES,
+                 on_write=None):
+        self._uart = uart
+        self._on_write = on_write
+        self._priorities = priorities
+        self._budget = UARTLinkBudget(settings.UART.BAUDRATE, settings.UART.LINK_BUDGET,
+                                      settings.UART.LINK_WINDOW_MS, settings.UART.LINK_MAX_BACKLOG_US,
+                                      settings.UART.STREAM_LIMITS, heartbeat_ms)
+        self._refresh_check_ms = min([heartbeat_ms] + [limits[1] for limits in settings.UART.STREAM_LIMITS.values()]) // 2
+        self._builder = UARTPacketBuilder()
+        self._acks = None
+        if settings.UART.RELIABLE:
+            self._acks = UARTAckTracker(settings.UART.ACK_WINDOW, settings.UART.ACK_TIMEOUT_MS,
+                                        settings.UART.ACK_MAX_RETRIES)
+        self._queued_at = {}  # frame type -> ticks_ms it was last queued
+        self._pending = [[] for _ in range(max([0] + list(priorities.values())) + 1)]
+        self._work = uasyncio.ThreadSafeFlag()
+
+        self.sent_count = 0
+        self.sent_bytes = 0
+        self.suppressed_count = 0
+        self.suppressed_bytes = 0
+        self.replaced_count = 0
+
+    @property
+    def packet_builder(self):
+        return self._builder
+
+    @property
+    def link_budget(self):
+        return self._budget
+
+    @property
+    def ack_tracker(self):
+        return self._acks
+
+    @property
+    def queued_count(self):
+        return sum(len(pending) for pending in self._pending)
+
+    @property
+    def stats(self):
+        return {'queued': self.queued_count, 'sent': self.sent_count, 'sent_bytes': self.sent_bytes,
+                'replaced': self.replaced_count, 'suppressed': self.suppressed_count,
+                'suppressed_bytes': self.suppressed_bytes, 'link': self._budget.stats,
+                'acks': self._acks.stats if self._acks is not None else None}
+
+    def publish(self, frame_type, data, force=False):
+        """Queue the frame unless it repeats the last one within a heartbeat period (or `force`).
+        True if queued."""
+        now = ticks_ms()
+        queued_at = self._queued_at.get(frame_type)
+        if (not force and queued_at is not None and ticks_diff(now, queued_at) < self._budget.refresh_ms(frame_type)
+                and self._builder.matches(frame_type, data)):
+            self.suppressed_count += 1
+            self.suppressed_bytes += len(data) + FRAME_OVERHEAD
+            return False
+        self._builder.build(frame_type, data)
+        self._enqueue(frame_type, now)
+        return True
+
+    def refresh(self):
+        """Re-queue the frames not sent for a heartbeat period"""
+        now = ticks_ms()
+        for frame_type in list(self._queued_at):
+            if ticks_diff(now, self._queued_at[frame_type]) >= self._budget.refresh_ms(frame_type):
+                self._enqueue(frame_type, now)
+
+    async def heartbeat_task(self):
+        while True:
+            await uasyncio.sleep_ms(self._refresh_check_ms)
+            self.refresh()
+
+    def ack_received(self):
+        if self._acks is not None:
+            self._acks.acked()
+            self._work.set()
+
+    def write_untracked(self, data, frames_count):
+        """Write `frames_count` pre-encoded frames straight to the UART, ahead of the queue. The ACK
+        tracker drops its outstanding frames and takes the next `frames_count` ACKs as theirs."""
+        self._uart.write(data)
+        if self._acks is not None:
+            self._acks.reset(frames_count)
+            self._work.set()
+
+    async def write_task(self):
+        while True:
+            frame_type, wait = self._next_frame()
+            if frame_type is None:
+                if wait is None:
+                    await self._work.wait()
+                    continue
+                try:
+                    await uasyncio.wait_for_ms(self._work.wait(), wait)
+                except uasyncio.TimeoutError:
+                    pass
+                continue
+
+            packet = self._builder.packet(frame_type)
+            if settings.DUBUG_MODE:
+                print('[UARTBus] Sending paket: {}'.format(packet))
+            # copied into the UART TX ring buffer, returns before the frame is on the wire
+            self._uart.write(packet)
+            self._budget.sent(frame_type, len(packet))
+            if self._acks is not None:
+                self._acks.sent(frame_type)
+            self.sent_count += 1
+            self.sent_bytes += len(packet)
+            if self._on_write is not None:
+                self._on_write(frame_type)
+            # let frames published meanwhile compete for the next slot
+            await uasyncio.sleep_ms(0)
+
+    def _enqueue(self, frame_type, now):
+        self._queued_at[frame_type] = now
+        pending = self._pending[self._priorities.get(frame_type, 0)]
+        if frame_type in pending:
+            self.replaced_count += 1
+            return
+        pending.append(frame_type)
+        self._work.set()
+
+    def _next_frame(self):
+        """Like `_next_pending`, also waiting for the ACKs of outstanding frames"""
+        if self._acks is None:
+            return self._next_pending()
+        timeout = self._acks.timeout_ms()
+        if timeout is not None and timeout <= 0:
+            now = ticks_ms()
+            for frame_type in self._acks.expire():
+                self._enqueue(frame_type, now)
+            timeout = None
+        if self._acks.window_full:
+            return None, timeout
+        frame_type, wait = self._next_pending()
+        if frame_type is None and timeout is not None and (wait is None or timeout < wait):
+            wait = timeout
+        return frame_type, wait
+
+    def _next_pending(self):
+        """(frame type to write now, None) or (None, ms until a queued frame may be written or None)"""
+        nearest = None
+        for priority in range(len(self._pending) - 1, -1, -1):
+            pending = self._pending[priority]
+            for idx in range(len(pending)):
+                frame_type = pending[idx]
+                wait = self._budget.wait_ms(frame_type, priority, len(self._builder.packet(frame_type)))
+                if wait == 0:
+                    pending.pop(idx)
+                    return frame_type, None
+                if nearest is None or wait < nearest:
+                    nearest = wait
+        return None, nearest
+
+
+HANDSHAKE_WAIT_START = const(0)  # HU has not requested the start yet
+HANDSHAKE_SNAPSHOT = const(1)  # start sequence written, state snapshot being sent
+HANDSHAKE_READY = const(2)
+HANDSHAKE_STATE_NAMES = ('WAIT_START', 'SNAPSHOT', 'READY')
+
+
+class UARTHandshake:
+    """HU protocol start-up.
+
+    HU sends REQ_START when it boots (or restarts its CAN box service). The box answers at once with
+    the pre-encoded start sequence (protocol version, base info, ...) in one write, then queues the
+    current state of every controller as a forced snapshot burst, so HU shows the real climate/door
+    state instead of its defaults. The handshake is READY once every snapshot frame was written;
+    `last_start_us` is the time from REQ_START until then. A REQ_START in any state starts over.
+    """
+
+    def __init__(self, publisher, controllers):
+        self._publisher = publisher
+        self._controllers = controllers
+        self._snapshot_pending = []
+        self._started_at = 0
+
+        self.state = HANDSHAKE_WAIT_START
+        self.start_count = 0
+        self.last_start_us = None
+
+    @property
+    def stats(self):
+        return {'state': HANDSHAKE_STATE_NAMES[self.state], 'starts': self.start_count,
+                'last_start_us': self.last_start_us}
+
+    def start(self):
+        self._started_at = ticks_us()
+        self.start_count += 1
+        self._publisher.write_untracked(UART_COMMANDS.START_SEQUENCE, UART_COMMANDS.START_SEQUENCE_FRAMES)
+
+        self._snapshot_pending = [controller.controller_type for controller in self._controllers]
+        self.state = HANDSHAKE_SNAPSHOT
+        for controller in self._controllers:
+            self._publisher.publish(controller.controller_type, controller.get_packed_data(), force=True)
+        if settings.DUBUG_MODE:
+            print('[UARTBus] HU requested start, sending a snapshot of {} frames'.format(len(self._controllers)))
+
+    def frame_written(self, frame_type):
+        if self.state != HANDSHAKE_SNAPSHOT or frame_type not in self._snapshot_pending:
+            return
+        self._snapshot_pending.remove(frame_type)
+        if not self._snapshot_pending:
+            self.state = HANDSHAKE_READY
+            self.last_start_us = ticks_diff(ticks_us(), self._started_at)
+            if settings.DUBUG_MODE:
+                print('[UARTBus] HU start-up done in {} us'.format(self.last_start_us))
 
 
 class UARTBus(Observer):
-    HEADER = const(0x2e)
-    CHECKSUM_XOR = const(0xff)
+    # change mask bits exist only for the climate controller, other controllers are always sent
+    FIELDS = CLIMATE_FIELDS.PACKED
 
     def __init__(self):
         self._uart = UART(settings.UART.ID, baudrate=settings.UART.BAUDRATE,
                           tx=Pin(settings.PINS.UART_TX_PIN),
                           rx=Pin(settings.PINS.UART_RX_PIN),
-                          bits=8, stop=1)
+                          bits=8, stop=1, txbuf=settings.UART.TX_BUFFER_SIZE)
+        self._rx_buffer = bytearray(settings.UART.RX_CHUNK_SIZE)
+        self._publisher = UARTPublisher(self._uart, on_write=self._frame_written)
+        self._parser = UARTFrameParser(self._handle_frame, settings.UART.MAX_PAYLOAD,
+                                       self._publisher.ack_received)
+
+        controllers = (get_climate_controller(), get_door_controller(),
+                       get_front_parking_controller(), get_rear_parking_controller())
+        self._handshake = UARTHandshake(self._publisher, controllers)
 
         # subscribe to controller updates
-        self.subscribe(get_climate_controller())
-        self.subscribe(get_door_controller())
-        self.subscribe(get_front_parking_controller())
-        self.subscribe(get_rear_parking_controller())
-
-    def _build_packet(self, type, buf, size):
-        buf.insert(0, self.HEADER)
-        buf.insert(1, type)
-        buf.insert(2, size)
-        buf.append(sum(buf[1:]) ^ self.CHECKSUM_XOR)
-        return buf
+        for controller in controllers:
+            self.subscribe(controller)
 
     def update(self, subject_type, subject):
         # if subject_type in UART_TYPES:
@@ -41,19 +391,56 @@ class UARTBus(Observer):
         self._send(subject_type, data)
 
     def _send(self, data_type, data):
-        """ Send UART commands to HU """
-        packet = self._build_packet(data_type, data, len(data))
-        print('[UARTBus] Sending paket: {}'.format(data))
-        # time.sleep(settings.UART.RESPONSE_TIMEOUT)
-        self._uart.write(bytearray(packet))
-
-    def handle_uart_cmd(self, _):
-        """ Handle UART commands from HU """
-        raw_data = self._uart.read()
-        cmd = UARTCmdHandlers.get(raw_data)
+        """ Queue a frame for HU, does not wait for the UART """
+        self._publisher.publish(data_type, data)
+
+    @property
+    def parser(self):
+        return self._parser
+
+    @property
+    def publisher(self):
+        return self._publisher
+
+    @property
+    def handshake(self):
+        return self._handshake
+
+    def _frame_written(self, frame_type):
+        self._handshake.frame_written(frame_type)
+
+    def add_loop_tasks(self, loop):
+        loop.create_task(self.receive_task())
+        loop.create_task(self._publisher.write_task())
+        loop.create_task(self._publisher.heartbeat_task())
+
+    async def receive_task(self):
+        """ Read UART commands from HU, any number of (partial) frames per read """
+        reader = uasyncio.StreamReader(self._uart)
+        while True:
+            length = await reader.readinto(self._rx_buffer)
+            self._parser.feed(self._rx_buffer, length)
+
+    def _handle_frame(self, frame, length):
+        """ Handle UART commands from HU: (type, command, value) = frame type, payload[0], payload[1] """
+        payload_length = frame[2]
+        if payload_length == 0:
+            return
+        if frame[1] == UART_TYPES.REQ_START:
+            self._uart.write(UART_COMMANDS.ACK)
+            self._handshake.start()
+            return
+        cmd = UARTCmdHandlers.get(uart_command_key(frame[1], frame[3]))
         if cmd:
             self._uart.write(UART_COMMANDS.ACK)
-            cmd()
+            if payload_length < 2:
+                return
+            # every press counts, identical commands are not coalesced
+            if cmd.TAKES_VALUE:
+                get_command_executor().submit(cmd, frame[4], coalesce=False)
+            elif frame[4] == AC_CONTROL.PRESSED:
+                # toggles fire on the press only, the release (0x00) is acknowledged and dropped
+                get_command_executor().submit(cmd, coalesce=False)
 
 
 UART_bus = None
@@ -0,0 +1,95 @@
+from time import ticks_ms, ticks_us, ticks_add, ticks_diff
+
+# start bit + 8 data bits + stop bit
+BITS_PER_BYTE = 10
+
+
+class UARTLinkBudget:
+    """Accounts the bytes every frame type puts on the HU link and decides when a frame may be written.
+
+    - Every type has a minimum interval between frames (its maximum rate) and a maximum interval (its
+      refresh period, see `refresh_ms`), taken from `stream_limits` (type -> (min ms, max ms)).
+    - Bytes are written ahead of the wire by at most `max_backlog_us`, so a high priority frame never
+      waits behind more than that in the UART driver buffer.
+    - Priority 0 frames may fill `budget` (a share of the link) per window of `window_ms`; over it they
+      wait for the next window, higher priorities are never held back by the budget.
+
+    The bytes/s of every type and the link utilisation are measured per window.
+    """
+
+    def __init__(self, baudrate, budget, window_ms, max_backlog_us, stream_limits, default_refresh_ms):
+        self._capacity = baudrate // BITS_PER_BYTE  # bytes/s
+        self._us_per_byte = BITS_PER_BYTE * 1000000 // baudrate
+        self._window_ms = window_ms
+        self._window_budget = int(self._capacity * budget * window_ms / 1000)
+        self._max_backlog_us = max_backlog_us
+        self._limits = stream_limits
+        self._default_refresh_ms = default_refresh_ms
+
+        self._sent_at = {}  # frame type -> ticks_ms of its last write
+        self._wire_free_at = ticks_us()  # when the bytes written so far have left the UART
+        self._window_start = ticks_ms()
+        self._window_bytes = 0
+        self._window_saturated = False
+        self._stream_bytes = {}  # frame type -> bytes written in the current window
+
+        self.stream_rates = {}  # frame type -> bytes/s in the last window
+        self.utilisation = 0  # % of the link capacity used in the last window
+        self.saturated_windows = 0
+
+    @property
+    def stats(self):
+        return {'utilisation': self.utilisation, 'saturated_windows': self.saturated_windows,
+                'streams': {hex(frame_type): rate for frame_type, rate in self.stream_rates.items()}}
+
+    def refresh_ms(self, frame_type):
+        """Longest time an unchanged frame of the type may go without being sent again"""
+        limits = self._limits.get(frame_type)
+        return limits[1] if limits else self._default_refresh_ms
+
+    def wait_ms(self, frame_type, priority, length):
+        """Time until a frame of the type may be written, 0 if it may be written now"""
+        now = ticks_ms()
+        self._roll_window(now)
+
+        wait = 0
+        limits = self._limits.get(frame_type)
+        sent_at = self._sent_at.get(frame_type)
+        if limits and sent_at is not None:
+            wait = limits[0] - ticks_diff(now, sent_at)
+
+        backlog_us = ticks_diff(self._wire_free_at, ticks_us())
+        if backlog_us > self._max_backlog_us:
+            wait = max(wait, (backlog_us - self._max_backlog_us) // 1000 + 1)
+
+        if priority == 0 and self._window_bytes + length > self._window_budget:
+            if not self._window_saturated:
+                self._window_saturated = True
+                self.saturated_windows += 1
+            wait = max(wait, self._window_ms - ticks_diff(now, self._window_start))
+        return max(0, wait)
+
+    def sent(self, frame_type, length):
+        now = ticks_ms()
+        self._roll_window(now)
+        self._sent_at[frame_type] = now
+
+        now_us = ticks_us()
+        if ticks_diff(self._wire_free_at, now_us) < 0:
+            self._wire_free_at = now_us
+        self._wire_free_at = ticks_add(self._wire_free_at, length * self._us_per_byte)
+
+        self._window_bytes += length
+        self._stream_bytes[frame_type] = self._stream_bytes.get(frame_type, 0) + length
+
+    def _roll_window(self, now):
+        elapsed = ticks_diff(now, self._window_start)
+        if elapsed < self._window_ms:
+            return
+        for frame_type in self._stream_bytes:
+            self.stream_rates[frame_type] = self._stream_bytes[frame_type] * 1000 // elapsed
+            self._stream_bytes[frame_type] = 0
+        self.utilisation = self._window_bytes * 100000 // (self._capacity * elapsed)
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_saturated = False
@@ -0,0 +1,50 @@
+from uart.uart_parser import HEADER, CHECKSUM_XOR, FRAME_OVERHEAD
+
+
+class UARTPacketBuilder:
+    """Builds HU frames (0x2e, type, length, payload, checksum) into one reusable buffer per type.
+
+    The header, type and length bytes are written once when the buffer of a type is created; every
+    build only copies the payload and updates the checksum on the way, so no lists or slices are
+    allocated per packet. The returned buffer is overwritten by the next build of the same type.
+    """
+
+    def __init__(self):
+        self._packets = {}  # frame type -> bytearray of the whole frame
+        self.packets_count = 0
+        self.bytes_count = 0
+
+    def packet(self, frame_type):
+        """Last frame built for the type, None if there was none"""
+        return self._packets.get(frame_type)
+
+    def matches(self, frame_type, data):
+        """True if the last frame built for the type has the same payload"""
+        packet = self._packets.get(frame_type)
+        if packet is None or len(packet) != len(data) + FRAME_OVERHEAD:
+            return False
+        for i in range(len(data)):
+            if packet[3 + i] != data[i]:
+                return False
+        return True
+
+    def build(self, frame_type, data):
+        length = len(data)
+        packet = self._packets.get(frame_type)
+        if packet is None or len(packet) != length + FRAME_OVERHEAD:
+            packet = bytearray(length + FRAME_OVERHEAD)
+            packet[0] = HEADER
+            packet[1] = frame_type
+            packet[2] = length
+            self._packets[frame_type] = packet
+
+        checksum = frame_type + length
+        for i in range(length):
+            byte = data[i]
+            packet[3 + i] = byte
+            checksum += byte
+        packet[3 + length] = (checksum ^ CHECKSUM_XOR) & 0xff
+
+        self.packets_count += 1
+        self.bytes_count += length + FRAME_OVERHEAD
+        return packet
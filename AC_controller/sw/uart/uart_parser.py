@@ -0,0 +1,107 @@
+from micropython import const
+
+HEADER = const(0x2e)
+CHECKSUM_XOR = const(0xff)
+ACK = const(0xff)
+# header, type, length + checksum
+FRAME_OVERHEAD = const(4)
+
+_STATE_HEADER = const(0)
+_STATE_TYPE = const(1)
+_STATE_LENGTH = const(2)
+_STATE_PAYLOAD = const(3)
+_STATE_CHECKSUM = const(4)
+
+
+class UARTFrameParser:
+    """Incremental parser of HU frames: 0x2e, type, length, payload, checksum.
+
+    Bytes can be fed in chunks of any size; every complete frame with a valid checksum is passed to
+    `on_frame(frame, length)` where `frame` is the parser's own buffer holding the whole frame
+    (header to checksum) in its first `length` bytes. The buffer is reused for the next frame, so
+    copy what has to be kept.
+
+    An ACK byte outside a frame is passed to `on_ack()` if given, other bytes outside a frame are
+    skipped. A frame with a bad checksum or a length above
+    `max_payload` is dropped and parsing restarts at the next header byte after its start, so a
+    frame hidden behind a false header is not lost. Nothing is allocated per byte.
+    """
+
+    def __init__(self, on_frame, max_payload=32, on_ack=None):
+        self._on_frame = on_frame
+        self._on_ack = on_ack
+        self._max_payload = max_payload
+        self._frame = bytearray(max_payload + FRAME_OVERHEAD)
+        self._state = _STATE_HEADER
+        self._pos = 0
+        self._length = 0
+        self._checksum = 0
+
+        self.frames_count = 0
+        self.checksum_errors = 0
+        self.skipped_bytes = 0
+        self.acks_count = 0
+
+    def reset(self):
+        self._state = _STATE_HEADER
+        self._pos = 0
+
+    def feed(self, data, length=None):
+        """Parse `length` bytes (all by default) of `data`"""
+        if length is None:
+            length = len(data)
+        for i in range(length):
+            self._feed_byte(data[i])
+
+    def _feed_byte(self, byte):
+        state = self._state
+        if state == _STATE_HEADER:
+            if byte != HEADER:
+                if byte == ACK and self._on_ack is not None:
+                    self.acks_count += 1
+                    self._on_ack()
+                else:
+                    self.skipped_bytes += 1
+                return
+            self._frame[0] = byte
+            self._pos = 1
+            self._state = _STATE_TYPE
+            return
+
+        frame = self._frame
+        frame[self._pos] = byte
+        self._pos += 1
+
+        if state == _STATE_TYPE:
+            self._checksum = byte
+            self._state = _STATE_LENGTH
+        elif state == _STATE_LENGTH:
+            if byte > self._max_payload:
+                self._resync()
+                return
+            self._checksum += byte
+            self._length = byte
+            self._state = _STATE_PAYLOAD if byte else _STATE_CHECKSUM
+        elif state == _STATE_PAYLOAD:
+            self._checksum += byte
+            if self._pos == 3 + self._length:
+                self._state = _STATE_CHECKSUM
+        else:
+            if byte != (self._checksum ^ CHECKSUM_XOR) & 0xff:
+                self.checksum_errors += 1
+                self._resync()
+                return
+            self._state = _STATE_HEADER
+            self.frames_count += 1
+            self._on_frame(frame, self._pos)
+
+    def _resync(self):
+        """Drop the frame start and re-parse the bytes received after it"""
+        frame = self._frame
+        end = self._pos
+        self.skipped_bytes += 1
+        self._state = _STATE_HEADER
+        self._pos = 0
+        # re-fed bytes are written at lower indexes than they are read from
+        for i in range(1, end):
+            self._feed_byte(frame[i])